@@ -1,12 +1,17 @@
-from remarking.cli.commands.csv_writer_command import (CSVWriter,
+from remarking.cli.commands.csv_writer_command import (CSVStreamWriter,
+                                                       CSVWriter,
                                                        CSVWriterCommand)
-from remarking.cli.commands.json_writer_command import (JSONWriter,
+from remarking.cli.commands.json_writer_command import (JSONStreamWriter,
+                                                        JSONWriter,
                                                         JSONWriterCommand)
 from remarking.cli.commands.table_writer_command import (TableWriter,
                                                          TableWriterCommand)
 from remarking.cli.log import CommandLineLogger, HaloWrapper
 from remarking.cli.writer import Writer
 from remarking.cli.writer_command import ClickOption, WriterCommand
+from remarking.document_source import (CompositeDocumentSource,
+                                       DirectoryDocumentSource, DocumentSource,
+                                       ZipDocumentSource)
 from remarking.highlight_extractor.highlight_extractor import (
     ExtractorData, HighlightExtractor)
 from remarking.highlight_extractor.remarkable_highlight_extractor import \
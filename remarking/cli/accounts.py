@@ -0,0 +1,161 @@
+""" Sync several reMarkable accounts concurrently in one process """
+import concurrent.futures
+import json
+import logging
+import os
+import typing as T
+from dataclasses import dataclass
+from typing import List
+
+import click
+
+from remarking import isolation, models
+from remarking import rmcloud as rmcloud_
+from remarking.cli import app as app_
+from remarking.cli import extract, log
+from remarking.storage import storage as storage_
+
+
+class BadAccountManifestException(click.ClickException):
+    """ Raised when an accounts manifest cannot be read """
+
+
+@dataclass
+class Account():
+    """ An account listed in an accounts manifest. """
+
+    name: str
+    """ Name used to tag the account's documents in storage and prefix its log output. """
+    rmapi_config: str
+    """ Path of the rmapy config file holding the account's tokens. """
+    collections: List[str]
+    """ The names of the folders and documents to extract highlights from. """
+    output: T.Optional[str] = None
+    """ File the account's highlights are written to. Highlights are written to stdout when unset. """
+    token: T.Optional[str] = None
+    """ One time auth token, only needed the first time the account is synced. """
+
+
+@dataclass
+class AccountManifest():
+    """ The accounts to sync and how many to sync at once. """
+
+    accounts: List[Account]
+    concurrency: int = 4
+
+
+def load_manifest(path: str) -> AccountManifest:
+    """ Load an accounts manifest from a JSON file.
+
+    .. code-block:: json
+
+        {
+          "concurrency": 4,
+          "accounts": [
+            {"name": "alice", "rmapi_config": "~/.rmapi-alice", "collections": ["books"], "output": "alice.json"}
+          ]
+        }
+
+    :raises BadAccountManifestException: If the file is not a valid manifest.
+    """
+    try:
+        with open(path, "r") as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError) as exc:
+        raise BadAccountManifestException(f"Could not read accounts manifest '{path}': {exc}") from exc
+
+    if not isinstance(manifest, dict) or not isinstance(manifest.get("accounts"), list):
+        raise BadAccountManifestException(f"Accounts manifest '{path}' must contain a list of 'accounts'")
+
+    accounts = []
+    names = set()
+    for index, account in enumerate(manifest["accounts"]):
+        try:
+            accounts.append(Account(**account))
+        except TypeError as exc:
+            raise BadAccountManifestException(f"Account {index} in '{path}' is not valid: {exc}") from exc
+        if account["name"] in names:
+            raise BadAccountManifestException(f"Account name '{account['name']}' is used more than once in '{path}'")
+        names.add(account["name"])
+
+    concurrency = manifest.get("concurrency", AccountManifest.concurrency)
+    if not isinstance(concurrency, int) or concurrency < 1:
+        raise BadAccountManifestException(f"'concurrency' in '{path}' must be a positive integer")
+    return AccountManifest(accounts=accounts, concurrency=concurrency)
+
+
+def run_accounts(logger: log.CommandLineLogger,
+                 manifest: AccountManifest,
+                 working_directory: str,
+                 extractors: T.List[str],
+                 storage: storage_.Storage,
+                 on_result: T.Callable[[List[models.Document], List[models.Highlight], log.CommandLineLogger], None],
+                 quiet: bool = False,
+                 extraction_limits: T.Optional[isolation.ExtractionLimits] = None,
+                 retry_skipped: bool = False,
+                 excluded_folders: T.Sequence[str] = ()
+                 ) -> List[str]:
+    """ Extract highlights for every account in the manifest, running ``manifest.concurrency`` accounts at once.
+
+    All accounts share one HTTP connection pool and storage's connection pool.
+    Each account gets its own storage session from :meth:`Storage.for_account`, so its documents are
+    tagged with the account name, and its own logger writing to the account's output file.
+
+    A failing account does not stop the others.
+
+    :param: on_result: Called with each account's documents, highlights and logger to write its highlights out.
+    :param: extraction_limits: Run extractors in worker processes held to these limits, see :func:`extract.create_app`.
+    :param: retry_skipped: If documents skipped for exceeding the limits should be extracted again.
+    :param: excluded_folders: Names of folders left out of every account's collections.
+
+    :returns: The names of the accounts that failed.
+    """
+    session = rmcloud_.create_session(pool_size=manifest.concurrency)
+    extractor_instances = extract.create_extractors(extractors)
+
+    def run_account(account: Account) -> None:
+        output = open(account.output, "w") if account.output else None  # pylint: disable=consider-using-with
+        try:
+            account_logger = log.CommandLineLogger(spinners_enabled=False,
+                                                   quiet=quiet,
+                                                   file_output=output,
+                                                   prefix=account.name)
+            rmcloud = extract.connect(account_logger,
+                                      account.token or "",
+                                      config_path=account.rmapi_config,
+                                      session=session)
+            with storage.for_account(account.name) as account_storage:
+                app = app_.App(rmcloud=rmcloud,
+                               storage=account_storage,
+                               extractors=extractor_instances,
+                               logger=account_logger,
+                               extraction_limits=extraction_limits,
+                               retry_skipped=retry_skipped,
+                               excluded_folders=excluded_folders)
+                documents, highlights = app.run_app(
+                    os.path.join(working_directory, account.name), account.collections, acknowledge=False
+                )
+                on_result(documents, highlights, account_logger)
+                app.acknowledge(highlights)
+        finally:
+            if output is not None:
+                output.close()
+
+    logger.echo(click.style("Accounts", fg="green", bold=True) +
+                f": {', '.join(account.name for account in manifest.accounts)}", err=True)
+
+    failed = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=manifest.concurrency) as executor:
+        futures = {executor.submit(run_account, account): account for account in manifest.accounts}
+        for future in concurrent.futures.as_completed(futures):
+            account = futures[future]
+            try:
+                future.result()
+            except Exception as exc:  # pylint: disable=broad-except
+                logging.exception(f"Sync failed for account {account.name}")
+                failed.append(account.name)
+                logger.echo(click.style(f"[{account.name}] Sync failed ({exc.__class__.__name__}: {exc})", fg="red"),
+                            err=True)
+
+    session.close()
+    return failed
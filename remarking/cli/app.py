@@ -1,145 +1,631 @@
 """ Application """
+import asyncio
+import contextlib
 import itertools
 import logging
+import time
 import typing as T
 from typing import Dict, List, Tuple
 
-from remarking import models
+from remarking import document_source as document_source_
+from remarking import events, isolation, metrics, models
 from remarking import rmcloud as rmcloud_
 from remarking.cli import log
 from remarking.highlight_extractor import highlight_extractor
+from remarking.storage import async_storage as async_storage_
 from remarking.storage import storage as storage_
 
 
-class App():
-    """ Main application class """
+class BaseApp():
+    """ Retrieving cloud metadata, downloading documents and running extractors, shared by :class:`App`
+        and :class:`AsyncApp`, which differ in how they access storage.
+    """
 
     def __init__(self,
                  rmcloud: rmcloud_.RMCloud,
                  extractors: List[highlight_extractor.HighlightExtractor],
                  logger: T.Optional[log.CommandLineLogger] = None,
-                 storage: storage_.Storage = None,
+                 incremental: bool = False,
+                 checkpoint_size: int = 20,
+                 extraction_limits: T.Optional[isolation.ExtractionLimits] = None,
+                 retry_skipped: bool = False,
+                 excluded_folders: T.Sequence[str] = ()
                  ) -> None:
         self._rmcloud = rmcloud
-        self._storage = storage or storage_.NoStorage()
         self._extractors = extractors
         self._logger = logger or log.CommandLineLogger(spinners_enabled=False, quiet=True)
+        self._incremental = incremental
+        self._checkpoint_size = max(checkpoint_size, 1)
+        self._extraction_limits = extraction_limits
+        self._retry_skipped = retry_skipped
+        self._excluded_folders = list(excluded_folders)
+        self._pool: T.Optional[isolation.ExtractorPool] = None
+        self._metadata_snapshot: T.Optional[Tuple[T.Tuple[str, ...], Dict[str, models.Document]]] = None
+
+    def _download_and_extract(self,
+                              working_path: str,
+                              documents: List[models.Document],
+                              spinner: log.HaloWrapper
+                              ) -> Tuple[Dict[str, models.Highlight], List[models.SkippedDocument]]:
+        """ Download documents and run the extractors on them, showing progress on spinner.
+
+            Returns a mapping of highlight hash to every highlight found, and the documents that were skipped
+            because an extractor exceeded the extraction limits on them.
+            The spinner is left running for the caller to finish once the new highlights are known.
+        """
+        with events.stage("download", documents=len(documents)):
+            source = self._download_documents(working_path, documents)
+        metrics.DOCUMENTS_DOWNLOADED.inc(len(documents))
 
-    def run_app(self, working_path:
-                str, collection_names: List[str]) -> Tuple[List[models.Document], List[models.Highlight]]:
-        """ Run highlight extractor.
+        extracted_highlights: List[models.Highlight] = []
+        skipped: List[models.SkippedDocument] = []
 
-            working_path is used for temporary storage while the extractor is running.
+        spinner.start()
+        progress = log.ProgressReporter(spinner, "Running extractors", total=len(self._extractors) * len(documents))
+        with events.stage("extract", documents=len(documents)) as stage_result:
+            if self._extraction_limits is not None:
+                extracted_highlights, skipped = self._extract_in_workers(source, documents, progress)
+                stage_result.update(documents_skipped=len(skipped))
+            else:
+                for extractor in self._extractors:
+                    if highlight_extractor.implements_batch(extractor):
+                        extracted_highlights.extend(_extract_batch(extractor, source, documents, progress))
+                        continue
+                    for doc in documents:
+                        start = time.perf_counter()
+                        highlights = extractor.get_highlights(source, doc)
+                        events.emit("document_extracted", document_id=doc.id, document_name=doc.name,
+                                    extractor=extractor.__class__.__name__, highlights=len(highlights),
+                                    ms=events.elapsed_ms(start))
+                        progress.advance(current=f"\"{extractor.__class__.__name__}\" on \"{doc.name}\"")
+                        extracted_highlights.extend(highlights)
 
-            collection_names: A list of folder and document names to extract highlights
-                            from. In the case of a folder, traverse recursively and retrieve documents.
+        extracted_highlights_mapping = {
+            highlight.hash: highlight for highlight in extracted_highlights
+        }
+        return extracted_highlights_mapping, skipped
 
-            Returns a tuple containing the documents downloaded with highlights and all highlights commited to storage.
+    def _extract_in_workers(self,
+                            source: document_source_.DocumentSource,
+                            documents: List[models.Document],
+                            progress: log.ProgressReporter
+                            ) -> Tuple[List[models.Highlight], List[models.SkippedDocument]]:
+        """ Run the extractors on documents in the worker processes of the extractor pool.
+
+            Returns the highlights of the documents no extractor exceeded the extraction limits on,
+            and a skip list entry for every other document.
         """
-        # pylint: disable=too-many-locals
+        if self._pool is None:
+            self._pool = isolation.ExtractorPool(self._extractors, T.cast(isolation.ExtractionLimits,
+                                                                          self._extraction_limits))
+        highlights_by_document: Dict[str, List[models.Highlight]] = {}
+        skipped: Dict[str, models.SkippedDocument] = {}
+        for result in self._pool.extract(source, documents):
+            doc = result.document
+            extractor_name = result.extractor.__class__.__name__
+            if result.skip_reason is None:
+                events.emit("document_extracted", document_id=doc.id, document_name=doc.name,
+                            extractor=extractor_name, highlights=len(result.highlights), ms=result.ms)
+                highlights_by_document.setdefault(doc.id, []).extend(result.highlights)
+            elif doc.id not in skipped:
+                reason = f"{extractor_name} {result.skip_reason}"
+                logging.warning(f"Skipping \"{doc.name}\" ({doc.id}): {reason}")
+                events.emit("document_skipped", document_id=doc.id, document_name=doc.name,
+                            extractor=extractor_name, reason=result.skip_reason, ms=result.ms)
+                skipped[doc.id] = models.SkippedDocument.create_skipped_document(doc, reason)
+            progress.advance(current=f"\"{extractor_name}\" on \"{doc.name}\"")
+        metrics.DOCUMENTS_SKIPPED.inc(len(skipped))
+
+        highlights = [
+            highlight for doc in documents if doc.id not in skipped
+            for highlight in highlights_by_document.get(doc.id, [])
+        ]
+        return highlights, list(skipped.values())
+
+    @contextlib.contextmanager
+    def _closing_pool(self) -> T.Iterator[None]:
+        """ Stop the worker processes of the extractor pool once the block exits. """
+        try:
+            yield
+        finally:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool = None
+
+    def _get_held_back_ids(self,
+                           documents: List[models.Document],
+                           skipped_documents: Dict[str, models.SkippedDocument]) -> T.Set[str]:
+        """ Return the ids of the documents that are not downloaded because they are unchanged since they were
+            skipped, unless skipped documents are retried.
+        """
+        if self._retry_skipped:
+            return set()
+        held_back_ids = set()
+        for doc in documents:
+            skipped = skipped_documents.get(doc.id)
+            if skipped is not None and skipped.skips(doc):
+                logging.info(f"Not extracting \"{doc.name}\", it was skipped because {skipped.reason}")
+                held_back_ids.add(doc.id)
+        return held_back_ids
+
+    def renew_auth(self) -> None:
+        """ Renew the reMarkable cloud session used by the app. """
+        self._rmcloud.renew_auth()
+
+    def _advanced_since_snapshot(self,
+                                 collection_names: List[str],
+                                 document_metadata: Dict[str, models.Document]) -> Dict[str, models.Document]:
+        """ Return the documents that are new or whose modified_client advanced since the last run.
+
+            All documents are returned if the app is not incremental or there is no usable snapshot.
+        """
+        if self._metadata_snapshot is None or self._metadata_snapshot[0] != tuple(collection_names):
+            return document_metadata
+
+        previous_metadata = self._metadata_snapshot[1]
+        advanced = {}
+        for doc_id, doc in document_metadata.items():
+            previous = previous_metadata.get(doc_id)
+            if previous is None or doc.modified_client > previous.modified_client:
+                advanced[doc_id] = doc
+        logging.info(f"{len(advanced)} of {len(document_metadata)} documents advanced since the last run")
+        return advanced
 
-        spinner = self._logger.spinner(text="Retrieving cloud metadata", spinner="bouncingBar")
-        spinner.start()
-        document_metadata = self._get_cloud_document_metadata(collection_names)
-        stored_documents = self._storage.get_documents([doc.id for doc in document_metadata.values()])
-        new_documents = _get_new_documents(document_metadata, stored_documents)
-        changed_documents = _get_changed_documents(document_metadata, stored_documents)
-        spinner.succeed()
+    def _get_cloud_document_metadata(self, collection_names: List[str]) -> Dict[str, models.Document]:
+        """
+        Retrieve document metadata for collection names passed.
 
-        docs_to_filter = (new_documents + changed_documents)
+        If collection name is a folder, retrieve document data recursively.
+        The trash and excluded folders are pruned while crawling.
 
-        # Filter out documents whose parent is trash:
+        Returns a mapping of document id to models.Document
+        """
+        logging.info("Getting cloud document metadata")
+        self._rmcloud.refresh_meta_items()
+        folder_objects = self._rmcloud.get_folders(collection_names)
+        document_objects = [
+            document for document in self._rmcloud.get_documents(collection_names)
+            if not self._rmcloud.is_excluded(document, self._excluded_folders)
+        ]
+
+        document_objects_from_folders = self._rmcloud.crawl_folders(folder_objects, self._excluded_folders)
 
-        docs_to_download = []
-        for doc in docs_to_filter:
-            if doc.parent is not None and doc.parent.lower() != "trash":
-                docs_to_download.append(doc)
+        all_documents = document_objects_from_folders + document_objects
 
-        self._download_documents(working_path, docs_to_download)
+        return {doc.id: doc for doc in models.Document.from_cloud_documents(all_documents)}
 
-        extracted_highlights = []
+    def _download_documents(self,
+                            working_path: str,
+                            documents: List[models.Document]) -> document_source_.CompositeDocumentSource:
+        """ Download the given documents to the given working_path
 
-        spinner = self._logger.spinner(text="Running extractors on documents", spinner="bouncingBar")
+            Returns a source that reads the files of every downloaded document from its archive.
+        """
+        source = document_source_.CompositeDocumentSource()
+        spinner = self._logger.spinner(text="Downloading documents", spinner="bouncingBar")
         spinner.start()
-        for extractor in self._extractors:
-            for doc in docs_to_download:
-                spinner.text = f"Running extractor \"{extractor.__class__.__name__}\" on \"{doc.name}\""
-                highlights = extractor.get_highlights(working_path, doc)
-                extracted_highlights.extend(highlights)
+        progress = log.ProgressReporter(spinner, "Downloading documents", total=len(documents))
+        for doc in documents:
+            downloaded_bytes = self._rmcloud.downloaded_bytes
+            source.add(doc.id, self._rmcloud.download_document(doc.id, working_path))
+            progress.advance(bytes_=self._rmcloud.downloaded_bytes - downloaded_bytes, current=f"\"{doc.name}\"")
+        spinner.succeed(f"Downloaded {len(documents)} documents.")
+        return source
 
-        extracted_highlights_mapping = {
-            highlight.hash: highlight for highlight in extracted_highlights
-        }
 
-        existing_highlights = self._storage.get_highlights(list(extracted_highlights_mapping.keys()))
+class App(BaseApp):
+    """ Main application class
 
-        existing_highlights_mapping = {
-            highlight.hash: highlight for highlight in existing_highlights
-        }
+        Documents are downloaded, extracted and committed to storage checkpoint_size documents at a time.
 
-        new_highlights = _get_new_highlights(existing_highlights_mapping, extracted_highlights_mapping)
-        spinner.succeed(
-            f"Ran extractors and found {len(extracted_highlights_mapping)} highlights, {len(new_highlights)} are new."
-        )
+        When incremental is set, the cloud metadata seen by the last successful :meth:`run_app` is kept
+        and documents whose ``ModifiedClient`` has not advanced since are skipped without consulting storage.
+        This is only correct when storage persists state between runs, as with ``persist --watch``.
 
-        self._storage.save_models(new_documents)
-        self._storage.update_documents(changed_documents)
+        When extraction_limits is set, extractors run in worker processes and a document an extractor exceeds
+        the limits on is skipped: none of its highlights are kept and it is added to the skip list in storage.
+        Skipped documents are not downloaded again until they are modified, or retry_skipped is set.
 
-        self._storage.save_models(new_highlights)
-        self._storage.commit()
+        Documents in the trash, and in folders named in excluded_folders, are left out when the requested
+        collections are crawled, so they are never listed or downloaded.
+    """
 
-        highlights_by_doc_id = [highlight.document_id for highlight in new_highlights]
+    def __init__(self,
+                 rmcloud: rmcloud_.RMCloud,
+                 extractors: List[highlight_extractor.HighlightExtractor],
+                 logger: T.Optional[log.CommandLineLogger] = None,
+                 storage: storage_.Storage = None,
+                 incremental: bool = False,
+                 checkpoint_size: int = 20,
+                 extraction_limits: T.Optional[isolation.ExtractionLimits] = None,
+                 retry_skipped: bool = False,
+                 excluded_folders: T.Sequence[str] = ()
+                 ) -> None:
+        super().__init__(rmcloud, extractors, logger=logger, incremental=incremental,
+                         checkpoint_size=checkpoint_size, extraction_limits=extraction_limits,
+                         retry_skipped=retry_skipped, excluded_folders=excluded_folders)
+        self._storage = storage or storage_.NoStorage()
 
-        docs_to_return = [doc for doc in docs_to_download if doc.id in highlights_by_doc_id]
+    def run_app(self,
+                working_path: str,
+                collection_names: List[str],
+                acknowledge: bool = True) -> Tuple[List[models.Document], List[models.Highlight]]:
+        """ Run highlight extractor.
 
-        sorted_docs = sorted(docs_to_return, key=lambda doc: doc.name)
-        document_lookup = {doc.id: doc for doc in sorted_docs}
+            working_path is where downloaded document archives are stored while the extractor is running.
+            Archives are read in place and never unpacked.
 
-        sorted_highlights = list(itertools.chain(*(
-            sorted(group, key=lambda highlight: highlight.page_number)
-            for key, group in
-            itertools.groupby(
-                sorted(new_highlights, key=lambda highlight: document_lookup[highlight.document_id].name),
-                key=lambda highlight: document_lookup[highlight.document_id].name
-            )
-        )))
+            collection_names: A list of folder and document names to extract highlights
+                            from. In the case of a folder, traverse recursively and retrieve documents.
 
-        return (sorted_docs, sorted_highlights)
+            acknowledge: If highlights should be considered delivered once they are returned. When false,
+                         the caller must call :meth:`acknowledge` after it has written the highlights out.
+                         Until then they are returned again by every run, even after a crash.
 
-    def _get_cloud_document_metadata(self, collection_names: List[str]) -> Dict[str, models.Document]:
+            Documents are processed in batches of ``checkpoint_size``. Each batch's documents and new highlights
+            are committed to storage together, so an interrupted run resumes with the first uncommitted batch.
+            New highlights committed by an earlier run that were never acknowledged are returned as well.
+
+            Returns a tuple containing the documents downloaded with highlights and all highlights commited to storage.
+
+            Counts and stage durations are recorded in :data:`remarking.metrics.REGISTRY`.
         """
-        Retrieve document metadata for collection names passed.
+        with _record_run(), self._closing_pool():
+            return self._run_app(working_path, collection_names, acknowledge)
+
+    def _run_app(self,
+                 working_path: str,
+                 collection_names: List[str],
+                 acknowledge: bool) -> Tuple[List[models.Document], List[models.Highlight]]:
+        """ Implementation of :meth:`run_app` """
+        # pylint: disable=too-many-locals
 
-        If collection name is a folder, retrieve document data recursively.
+        spinner = self._logger.spinner(text="Retrieving cloud metadata", spinner="bouncingBar")
+        spinner.start()
+        with events.stage("metadata") as stage_result:
+            all_document_metadata = self._get_cloud_document_metadata(collection_names)
+            document_metadata = self._advanced_since_snapshot(collection_names, all_document_metadata)
+            if document_metadata:
+                stored_documents = self._storage.get_documents([doc.id for doc in document_metadata.values()])
+            else:
+                stored_documents = []
+            new_documents = _get_new_documents(document_metadata, stored_documents)
+            changed_documents = _get_changed_documents(document_metadata, stored_documents)
+            skipped_documents: Dict[str, models.SkippedDocument] = {}
+            if new_documents or changed_documents:
+                skipped_documents = {skipped.document_id: skipped for skipped in self._storage.get_skipped_documents()}
+            held_back_ids = self._get_held_back_ids(new_documents + changed_documents, skipped_documents)
+            pending_highlights = self._storage.get_pending_highlights()
+            stage_result.update(documents_listed=len(all_document_metadata), documents_new=len(new_documents),
+                                documents_changed=len(changed_documents))
+        metrics.DOCUMENTS_LISTED.inc(len(all_document_metadata))
+        metrics.DOCUMENTS_NEW.inc(len(new_documents))
+        metrics.DOCUMENTS_CHANGED.inc(len(changed_documents))
+        spinner.succeed()
 
-        Returns a mapping of document id to models.Document
+        docs_to_download = _get_documents_to_download(
+            [doc for doc in new_documents + changed_documents if doc.id not in held_back_ids]
+        )
+
+        new_document_ids = {doc.id for doc in new_documents}
+        new_highlights: List[models.Highlight] = []
+        for start in range(0, len(docs_to_download), self._checkpoint_size):
+            batch = docs_to_download[start:start + self._checkpoint_size]
+            new_highlights.extend(self._process_batch(working_path, batch, new_document_ids, set(skipped_documents)))
+
+        # Held back documents are not stored, so they are compared with the skip list again by the next run.
+        downloaded_ids = {doc.id for doc in docs_to_download} | held_back_ids
+        with events.stage("store"):
+            self._storage.save_models([doc for doc in new_documents if doc.id not in downloaded_ids])
+            self._storage.update_documents([doc for doc in changed_documents if doc.id not in downloaded_ids])
+            if acknowledge:
+                self._storage.clear_pending_highlights(
+                    [highlight.hash for highlight in pending_highlights + new_highlights]
+                )
+            self._storage.commit()
+
+        if self._incremental:
+            self._metadata_snapshot = (tuple(collection_names), all_document_metadata)
+
+        new_highlights = _merge_pending_highlights(new_highlights, pending_highlights)
+        docs_to_return, missing_doc_ids = _get_documents_to_return(docs_to_download, new_highlights)
+        if missing_doc_ids:
+            docs_to_return.extend(self._storage.get_documents(missing_doc_ids))
+
+        return _sort_result(docs_to_return, new_highlights)
+
+    def acknowledge(self, highlights: List[models.Highlight]) -> None:
+        """ Mark highlights returned by :meth:`run_app` as delivered so they are not returned again. """
+        self._storage.clear_pending_highlights([highlight.hash for highlight in highlights])
+        self._storage.commit()
+
+    def _process_batch(self,
+                       working_path: str,
+                       documents: List[models.Document],
+                       new_document_ids: T.Set[str],
+                       skipped_document_ids: T.Set[str]) -> List[models.Highlight]:
+        """ Download and extract highlights for documents, then commit them and their new highlights.
+
+            Documents that are skipped are added to the skip list instead of being committed,
+            documents in skipped_document_ids that are extracted are removed from it.
+
+            Returns the highlights that were not already in storage.
         """
-        logging.info("Getting cloud document metadata")
-        folder_objects = self._rmcloud.get_folders(collection_names)
-        document_objects = self._rmcloud.get_documents(collection_names)
+        spinner = self._logger.spinner(text="Running extractors on documents", spinner="bouncingBar")
+        extracted_highlights_mapping, skipped = self._download_and_extract(working_path, documents, spinner)
+        extracted, retried_ids = _split_skipped(documents, skipped, skipped_document_ids)
 
-        document_objects_from_folders = self._rmcloud.crawl_folders(folder_objects)
+        existing_highlights = []
+        with events.stage("lookup", highlights=len(extracted_highlights_mapping)):
+            if extracted_highlights_mapping:
+                existing_highlights = self._storage.get_highlights(list(extracted_highlights_mapping.keys()))
 
-        all_documents = document_objects_from_folders + document_objects
+        new_highlights = _count_new_highlights(existing_highlights, extracted_highlights_mapping, spinner)
 
-        documents = []
-        for cloud_document in all_documents:
-            documents.append(models.Document.from_cloud_document(cloud_document))
+        with events.stage("store", documents=len(extracted), highlights=len(new_highlights)):
+            self._storage.save_models([doc for doc in extracted if doc.id in new_document_ids])
+            self._storage.update_documents([doc for doc in extracted if doc.id not in new_document_ids])
 
-        document_rec: Dict[str, models.Document] = {}
-        for doc in documents:
-            document_rec[doc.id] = doc
+            self._storage.save_models(new_highlights)
+            self._storage.save_models([models.PendingHighlight(hash=highlight.hash) for highlight in new_highlights])
+            self._storage.save_skipped_documents(skipped)
+            self._storage.clear_skipped_documents(retried_ids)
+            self._storage.commit()
+        return new_highlights
 
-        return document_rec
 
-    def _download_documents(self, working_path: str, documents: List[models.Document]) -> None:
-        """ Download the given documents to the given working_path """
-        spinner = self._logger.spinner(text="Downloading documents", spinner="bouncingBar")
+class AsyncApp(BaseApp):
+    """ Application that stores highlights through an :class:`AsyncStorage`.
+
+        Cloud requests and extraction run in a worker thread while storage is awaited on the event loop,
+        so the new highlights of one batch of documents are looked up and committed while the next batch
+        is downloaded. Otherwise it behaves like :class:`App`, use :meth:`run_app_async` and
+        :meth:`acknowledge_async` in place of :meth:`App.run_app` and :meth:`App.acknowledge`.
+    """
+
+    def __init__(self,
+                 rmcloud: rmcloud_.RMCloud,
+                 extractors: List[highlight_extractor.HighlightExtractor],
+                 logger: T.Optional[log.CommandLineLogger] = None,
+                 storage: T.Optional[async_storage_.AsyncStorage] = None,
+                 incremental: bool = False,
+                 checkpoint_size: int = 20,
+                 extraction_limits: T.Optional[isolation.ExtractionLimits] = None,
+                 retry_skipped: bool = False,
+                 excluded_folders: T.Sequence[str] = ()
+                 ) -> None:
+        super().__init__(rmcloud, extractors, logger=logger, incremental=incremental,
+                         checkpoint_size=checkpoint_size, extraction_limits=extraction_limits,
+                         retry_skipped=retry_skipped, excluded_folders=excluded_folders)
+        self._async_storage = storage or async_storage_.SyncStorageAdapter(storage_.NoStorage())
+
+    async def run_app_async(self,
+                            working_path: str,
+                            collection_names: List[str],
+                            acknowledge: bool = True) -> Tuple[List[models.Document], List[models.Highlight]]:
+        """ Coroutine version of :meth:`App.run_app`, taking the same arguments. """
+        with _record_run(), self._closing_pool():
+            return await self._run_app_async(working_path, collection_names, acknowledge)
+
+    async def _run_app_async(self,
+                             working_path: str,
+                             collection_names: List[str],
+                             acknowledge: bool) -> Tuple[List[models.Document], List[models.Highlight]]:
+        """ Implementation of :meth:`run_app_async` """
+        # pylint: disable=too-many-locals
+        loop = asyncio.get_event_loop()
+        storage = self._async_storage
+
+        spinner = self._logger.spinner(text="Retrieving cloud metadata", spinner="bouncingBar")
         spinner.start()
-        for doc in documents:
-            spinner.text = f"Downloading \"{doc.name}\""
-            self._rmcloud.download_document(doc.id, working_path)
-        spinner.succeed(f"Downloaded {len(documents)} documents.")
+        with events.stage("metadata") as stage_result:
+            # Pending highlights do not depend on the cloud metadata, so they are read while it is retrieved.
+            pending_task = asyncio.ensure_future(storage.get_pending_highlights())
+            try:
+                all_document_metadata = await loop.run_in_executor(
+                    None, self._get_cloud_document_metadata, collection_names
+                )
+            finally:
+                pending_highlights = await pending_task
+            document_metadata = self._advanced_since_snapshot(collection_names, all_document_metadata)
+            if document_metadata:
+                stored_documents = await storage.get_documents([doc.id for doc in document_metadata.values()])
+            else:
+                stored_documents = []
+            new_documents = _get_new_documents(document_metadata, stored_documents)
+            changed_documents = _get_changed_documents(document_metadata, stored_documents)
+            skipped_documents: Dict[str, models.SkippedDocument] = {}
+            if new_documents or changed_documents:
+                skipped_documents = {skipped.document_id: skipped for skipped in await storage.get_skipped_documents()}
+            held_back_ids = self._get_held_back_ids(new_documents + changed_documents, skipped_documents)
+            stage_result.update(documents_listed=len(all_document_metadata), documents_new=len(new_documents),
+                                documents_changed=len(changed_documents))
+        metrics.DOCUMENTS_LISTED.inc(len(all_document_metadata))
+        metrics.DOCUMENTS_NEW.inc(len(new_documents))
+        metrics.DOCUMENTS_CHANGED.inc(len(changed_documents))
+        spinner.succeed()
+
+        docs_to_download = _get_documents_to_download(
+            [doc for doc in new_documents + changed_documents if doc.id not in held_back_ids]
+        )
+
+        new_document_ids = {doc.id for doc in new_documents}
+        new_highlights: List[models.Highlight] = []
+        store_task: T.Optional[T.Awaitable[List[models.Highlight]]] = None
+        for start in range(0, len(docs_to_download), self._checkpoint_size):
+            batch = docs_to_download[start:start + self._checkpoint_size]
+            spinner = self._logger.spinner(text="Running extractors on documents", spinner="bouncingBar")
+            extract_future = loop.run_in_executor(
+                None, self._download_and_extract, working_path, batch, spinner
+            )
+            # The previous batch is stored while this one downloads. Storage operations must not overlap,
+            # so it is awaited before this batch is stored.
+            if store_task is not None:
+                new_highlights.extend(await store_task)
+            extracted_highlights_mapping, skipped = await extract_future
+            store_task = asyncio.ensure_future(self._store_batch(
+                batch, extracted_highlights_mapping, skipped, new_document_ids, set(skipped_documents), spinner
+            ))
+        if store_task is not None:
+            new_highlights.extend(await store_task)
+
+        downloaded_ids = {doc.id for doc in docs_to_download} | held_back_ids
+        with events.stage("store"):
+            await storage.save_models([doc for doc in new_documents if doc.id not in downloaded_ids])
+            await storage.update_documents([doc for doc in changed_documents if doc.id not in downloaded_ids])
+            if acknowledge:
+                await storage.clear_pending_highlights(
+                    [highlight.hash for highlight in pending_highlights + new_highlights]
+                )
+            await storage.commit()
+
+        if self._incremental:
+            self._metadata_snapshot = (tuple(collection_names), all_document_metadata)
+
+        new_highlights = _merge_pending_highlights(new_highlights, pending_highlights)
+        docs_to_return, missing_doc_ids = _get_documents_to_return(docs_to_download, new_highlights)
+        if missing_doc_ids:
+            docs_to_return.extend(await storage.get_documents(missing_doc_ids))
+
+        return _sort_result(docs_to_return, new_highlights)
+
+    async def acknowledge_async(self, highlights: List[models.Highlight]) -> None:
+        """ Coroutine version of :meth:`App.acknowledge`. """
+        await self._async_storage.clear_pending_highlights([highlight.hash for highlight in highlights])
+        await self._async_storage.commit()
+
+    async def close_async(self) -> None:
+        """ Close the storage of the app. """
+        await self._async_storage.close()
+
+    async def _store_batch(self,
+                           documents: List[models.Document],
+                           extracted_highlights_mapping: Dict[str, models.Highlight],
+                           skipped: List[models.SkippedDocument],
+                           new_document_ids: T.Set[str],
+                           skipped_document_ids: T.Set[str],
+                           spinner: log.HaloWrapper) -> List[models.Highlight]:
+        """ Commit a batch of documents and their new highlights, and update the skip list like
+            :meth:`App._process_batch`.
+
+            Returns the highlights that were not already in storage.
+        """
+        # pylint: disable=too-many-arguments
+        storage = self._async_storage
+        extracted, retried_ids = _split_skipped(documents, skipped, skipped_document_ids)
+        existing_highlights = []
+        with events.stage("lookup", highlights=len(extracted_highlights_mapping)):
+            if extracted_highlights_mapping:
+                existing_highlights = await storage.get_highlights(list(extracted_highlights_mapping.keys()))
+
+        new_highlights = _count_new_highlights(existing_highlights, extracted_highlights_mapping, spinner)
+
+        with events.stage("store", documents=len(extracted), highlights=len(new_highlights)):
+            await storage.save_models([doc for doc in extracted if doc.id in new_document_ids])
+            await storage.update_documents([doc for doc in extracted if doc.id not in new_document_ids])
+
+            await storage.save_models(new_highlights)
+            await storage.save_models([models.PendingHighlight(hash=highlight.hash) for highlight in new_highlights])
+            await storage.save_skipped_documents(skipped)
+            await storage.clear_skipped_documents(retried_ids)
+            await storage.commit()
+        return new_highlights
+
+
+@contextlib.contextmanager
+def _record_run() -> T.Iterator[None]:
+    """ Count a run and whether it succeeded in :mod:`remarking.metrics`. """
+    metrics.RUNS.inc()
+    try:
+        yield
+    except Exception:
+        metrics.RUN_ERRORS.inc()
+        metrics.LAST_RUN_SUCCESS.set(0)
+        raise
+    finally:
+        metrics.LAST_RUN_TIMESTAMP.set(time.time())
+    metrics.LAST_RUN_SUCCESS.set(1)
+
+
+def _extract_batch(extractor: highlight_extractor.HighlightExtractor,
+                   source: document_source_.DocumentSource,
+                   documents: List[models.Document],
+                   progress: log.ProgressReporter) -> List[models.Highlight]:
+    """ Run an extractor implementing :meth:`HighlightExtractor.get_highlights_batch` on all documents at once. """
+    start = time.perf_counter()
+    highlights_by_document = extractor.get_highlights_batch(source, documents)
+    highlights = [highlight for doc in documents for highlight in highlights_by_document.get(doc.id, [])]
+    events.emit("documents_extracted", documents=len(documents), extractor=extractor.__class__.__name__,
+                highlights=len(highlights), ms=events.elapsed_ms(start))
+    progress.advance(items=len(documents), current=f"\"{extractor.__class__.__name__}\"")
+    return highlights
+
+
+def _split_skipped(documents: List[models.Document],
+                   skipped: List[models.SkippedDocument],
+                   skipped_document_ids: T.Set[str]) -> Tuple[List[models.Document], List[str]]:
+    """ Return the documents that were not skipped, and the ids of those among them that are on the skip list. """
+    skipped_ids = {skipped_document.document_id for skipped_document in skipped}
+    extracted = [doc for doc in documents if doc.id not in skipped_ids]
+    return extracted, [doc.id for doc in extracted if doc.id in skipped_document_ids]
+
+
+def _get_documents_to_download(documents: List[models.Document]) -> List[models.Document]:
+    """ Filter out documents whose parent is trash """
+    return [doc for doc in documents if doc.parent is not None and doc.parent.lower() != "trash"]
+
+
+def _count_new_highlights(existing_highlights: List[models.Highlight],
+                          extracted_highlights: Dict[str, models.Highlight],
+                          spinner: log.HaloWrapper) -> List[models.Highlight]:
+    """ Return the extracted highlights that are not already stored, counting both in :mod:`remarking.metrics`
+        and finishing spinner with the counts.
+    """
+    new_highlights = _get_new_highlights(
+        {highlight.hash: highlight for highlight in existing_highlights}, extracted_highlights
+    )
+    metrics.HIGHLIGHTS_EXTRACTED.inc(len(extracted_highlights))
+    metrics.HIGHLIGHTS_NEW.inc(len(new_highlights))
+    spinner.succeed(
+        f"Ran extractors and found {len(extracted_highlights)} highlights, {len(new_highlights)} are new."
+    )
+    return new_highlights
+
+
+def _merge_pending_highlights(new_highlights: List[models.Highlight],
+                              pending_highlights: List[models.Highlight]) -> List[models.Highlight]:
+    """ Add the pending highlights that are not also new to new_highlights """
+    new_hashes = {highlight.hash for highlight in new_highlights}
+    return new_highlights + [highlight for highlight in pending_highlights if highlight.hash not in new_hashes]
+
+
+def _get_documents_to_return(downloaded_documents: List[models.Document],
+                             highlights: List[models.Highlight]) -> Tuple[List[models.Document], List[str]]:
+    """ Return the downloaded documents with highlights, and the ids of documents with highlights
+        that were not downloaded and must be read from storage.
+    """
+    highlights_by_doc_id = {highlight.document_id for highlight in highlights}
+    docs_to_return = [doc for doc in downloaded_documents if doc.id in highlights_by_doc_id]
+    missing_doc_ids = highlights_by_doc_id - {doc.id for doc in docs_to_return}
+    return docs_to_return, list(missing_doc_ids)
+
+
+def _sort_result(documents: List[models.Document],
+                 highlights: List[models.Highlight]) -> Tuple[List[models.Document], List[models.Highlight]]:
+    """ Sort documents by name, and highlights by document name and page number """
+    sorted_docs = sorted(documents, key=lambda doc: doc.name)
+    document_lookup = {doc.id: doc for doc in sorted_docs}
+
+    sorted_highlights = list(itertools.chain(*(
+        sorted(group, key=lambda highlight: highlight.page_number)
+        for key, group in
+        itertools.groupby(
+            sorted(highlights, key=lambda highlight: document_lookup[highlight.document_id].name),
+            key=lambda highlight: document_lookup[highlight.document_id].name
+        )
+    )))
+
+    return (sorted_docs, sorted_highlights)
 
 
 def _get_changed_documents(document_metadata:
@@ -1,6 +1,4 @@
 import inspect
-import logging
-import os
 import sys
 import typing as T
 
@@ -9,9 +7,13 @@ from click_help_colors import HelpColorsGroup
 
 import remarking.cli.commands as commands_module
 from remarking.cli import common
+from remarking.cli import deduplicate as deduplicate_
+from remarking.cli import export as export_
 from remarking.cli import list as list_
+from remarking.cli import log
+from remarking.cli import search as search_
 from remarking.cli import writer_command, writer_command_runner
-from remarking.storage import sqlalchemy_storage
+from remarking.storage import log_storage
 from remarking.storage import storage as storage_
 
 _BUG_FILING_URL = "https://github.com/sabidib/remarking/issues/new/choose"
@@ -54,8 +56,25 @@ def exception_wrapper(func: T.Any) -> T.Any:
 )
 @click.version_option(package_name="remarking")
 @click.option("-v", "--verbose", count=True, envvar="DEBUG", help="Increase logging level.")
+@click.option("--metrics-file",
+              type=click.Path(dir_okay=False, writable=True),
+              default=None,
+              envvar="REMARKING_METRICS_FILE",
+              show_envvar=True,
+              help="Write run metrics to this file in the OpenMetrics text format, "
+              "e.g. for the node_exporter textfile collector. The file is rewritten after every sync."
+              )
+@click.option("--log-format",
+              type=click.Choice(log.LOG_FORMATS),
+              default="text",
+              show_default=True,
+              envvar="REMARKING_LOG_FORMAT",
+              show_envvar=True,
+              help="Format of logs written to stderr. `json` writes one JSON object per line, with an event for "
+              "every stage and document, in place of progress messages."
+              )
 @click.pass_context
-def command_line(ctx: click.Context, verbose: int) -> None:
+def command_line(ctx: click.Context, verbose: int, metrics_file: T.Optional[str], log_format: str) -> None:
     """ Remarking is a tool for extracting higlights from reMarkable documents.
 
     Remarking accepts takes a list of documents or folders and downloads documents recursively.
@@ -98,10 +117,11 @@ def command_line(ctx: click.Context, verbose: int) -> None:
     """
     ctx.ensure_object(dict)
     ctx.obj['verbose'] = verbose
-    if verbose > 0:
+    ctx.obj['metrics_file'] = metrics_file
+    ctx.obj['log_format'] = log_format
+    if verbose > 0 and log_format == "text":
         click.echo(f"Verbosity: {verbose}", err=True)
-        logging.basicConfig(format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
-                            level=logging.DEBUG if verbose > 0 else logging.WARNING)
+    log.configure_logging(verbose, log_format)
 
 
 @click.group(
@@ -117,10 +137,42 @@ def command_line(ctx: click.Context, verbose: int) -> None:
               show_envvar=True,
               help="When set to a sqlachemy connection string will save metadata about documents,"
               "document history and highlights across executions. This can also be a file whose contents"
-              "are a connection string."
+              "are a connection string. Use log:///path/to/file.log to keep state in a lightweight "
+              "append-only log file instead of a database."
+              )
+@click.option("--watch/--no-watch",
+              default=False,
+              help="Keep running and sync again every `--interval` seconds. The cloud session, "
+              "database connection and cloud metadata are kept between syncs. Stop with Ctrl-C."
+              )
+@click.option("--interval",
+              type=click.FloatRange(min=1),
+              default=60,
+              show_default=True,
+              help="Seconds to wait between syncs when using `--watch`."
+              )
+@click.option("--bloom-filter/--no-bloom-filter",
+              default=False,
+              envvar="REMARKING_BLOOM_FILTER",
+              show_envvar=True,
+              help="Keep a bloom filter of stored highlights so highlights that were never seen before "
+              "are not looked up in the database. For SQLite and log storage it is saved next to the "
+              "database file with a .bloom extension."
+              )
+@click.option("--asyncio/--no-asyncio",
+              "use_asyncio",
+              default=False,
+              help="Access the database with an asyncio driver (aiosqlite, asyncpg or aiomysql, which must be "
+              "installed) so new highlights are stored while the next documents download. "
+              "Cannot be used with `--watch`, `--bloom-filter`, `--accounts` or log storage."
               )
 @click.pass_context
-def persist(ctx: click.Context, sqlalchemy: str) -> None:
+def persist(ctx: click.Context,
+            sqlalchemy: str,
+            watch: bool,
+            interval: float,
+            bloom_filter: bool,
+            use_asyncio: bool) -> None:
     """ Produce new highlights since last execution.
 
     Extract highlights from the passed COLLECTION-NAMES.
@@ -173,22 +225,45 @@ def persist(ctx: click.Context, sqlalchemy: str) -> None:
 
     For more examples check out the docs at: https://remarking.readthedocs.io/en/latest/
 
+    Use `--watch` to keep remarking running and sync every `--interval` seconds instead
+    of running it from cron. Only documents whose modification time advanced are processed
+    on each sync and output is only written when there are new highlights.
+
+    \b
+    Example:
+        remarking persist --watch --interval 60 json --output highlights.json books
+
     Learn more with `remarking persist json --help`
 
     """
     ctx.ensure_object(dict)
+    ctx.obj["watch"] = watch
+    ctx.obj["interval"] = interval
     if sqlalchemy is not None:
         source = ctx.get_parameter_source("sqlalchemy")
-        if os.path.exists(sqlalchemy) and os.path.isfile(sqlalchemy):
-            with open(sqlalchemy, "r") as file_p:
-                sqlalchemy = file_p.read().strip()
+        sqlalchemy = common.read_connection_string(sqlalchemy)
         ctx.obj["source"] = source
+        ctx.obj["log_storage"] = log_storage.is_log_url(sqlalchemy)
     else:
         ctx.fail(click.style("Missing option '--sqlalchemy'. "
                              "Use `remarking run` to run without persistent storage."))
         sys.exit(1)
-    storage = sqlalchemy_storage.SqlAlchemyStorage(sqlalchemy)
+    if use_asyncio:
+        if watch or bloom_filter or log_storage.is_log_url(sqlalchemy):
+            ctx.fail(click.style("`--asyncio` cannot be used with `--watch`, `--bloom-filter` or log storage",
+                                 fg="red"))
+        # Imported here so that runs without --asyncio do not load the asyncio extension of SqlAlchemy.
+        from remarking.storage import async_sqlalchemy_storage  # pylint: disable=import-outside-toplevel
+        try:
+            ctx.obj["storage"] = async_sqlalchemy_storage.AsyncSqlAlchemyStorage(sqlalchemy)
+        except async_sqlalchemy_storage.MissingAsyncDriverException as exc:
+            ctx.fail(click.style(str(exc), fg="red"))
+        return
+    storage = common.create_storage(sqlalchemy)
+    if bloom_filter:
+        storage = common.add_bloom_filter(storage, sqlalchemy)
     ctx.obj["storage"] = storage
+    ctx.call_on_close(storage.close)
 
 
 @click.group(
@@ -256,7 +331,7 @@ WRITER_OUTPUT_CLASSES = []
 
 for name, module in common.import_submodules(commands_module).items():
     for _, class_ in inspect.getmembers(module, predicate=inspect.isclass):
-        if issubclass(class_, writer_command.WriterCommand) and class_ != writer_command.WriterCommand:
+        if issubclass(class_, writer_command.WriterCommand) and not inspect.isabstract(class_):
             WRITER_OUTPUT_CLASSES.append(class_)
 
 writer_command_registration_handler = writer_command_runner.WriterCommandRegistrationHandler(
@@ -265,10 +340,14 @@ writer_command_registration_handler = writer_command_runner.WriterCommandRegistr
 
 for writer_command in WRITER_OUTPUT_CLASSES:
     writer_command_registration_handler.register_writer_command(writer_command)  # type: ignore
+    export_.register_export_writer_command(writer_command)  # type: ignore
 
 
 command_line.add_command(run, "run")
 command_line.add_command(persist, "persist")
 command_line.add_command(list_.list_, "list")
+command_line.add_command(search_.search, "search")
+command_line.add_command(export_.export, "export")
+command_line.add_command(deduplicate_.deduplicate_text, "deduplicate-text")
 command_line.add_command(help_, "help")
 command_line.add_command(bug, "bug")
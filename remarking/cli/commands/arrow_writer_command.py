@@ -0,0 +1,223 @@
+import importlib
+import typing as T
+from abc import abstractmethod
+from typing import Dict, List
+
+import click
+import sqlalchemy
+
+from remarking import models
+from remarking.cli import common, log
+from remarking.cli import writer as writer_
+from remarking.cli import writer_command
+
+
+class MissingPyArrowException(click.ClickException):
+    """ Raised when writing parquet or arrow files without pyarrow installed """
+
+
+def import_pyarrow() -> T.Any:
+    """ Import pyarrow, which is an optional dependency of remarking.
+
+    :raises MissingPyArrowException: If pyarrow is not installed.
+    """
+    try:
+        import pyarrow  # pylint: disable=import-outside-toplevel
+    except ImportError as exc:
+        raise MissingPyArrowException(
+            "Writing parquet or arrow files requires pyarrow, install it with `pip install remarking[arrow]`"
+        ) from exc
+    return pyarrow
+
+
+def _arrow_type(pyarrow: T.Any, column_type: T.Any) -> T.Any:
+    if isinstance(column_type, sqlalchemy.Boolean):
+        return pyarrow.bool_()
+    if isinstance(column_type, sqlalchemy.Integer):
+        return pyarrow.int64()
+    if isinstance(column_type, sqlalchemy.Float):
+        return pyarrow.float64()
+    if isinstance(column_type, sqlalchemy.DateTime):
+        return pyarrow.timestamp("us")
+    return pyarrow.string()
+
+
+def arrow_schema(pyarrow: T.Any, columns: List[str]) -> T.Any:
+    """ Return the arrow schema of normalized columns, typed after the model columns they come from.
+
+    :param pyarrow: The pyarrow module, see :func:`import_pyarrow`.
+    :param columns: The normalized columns, as returned by :func:`common.generate_column_choices`.
+    """
+    mappings = common.generate_normalized_column_mappings()
+    types: Dict[str, T.Any] = {}
+    for model, mapping in ((models.Highlight, mappings["highlight"]), (models.Document, mappings["document"])):
+        for key, column in mapping.items():
+            types[column] = _arrow_type(pyarrow, model.__table__.c[key].type)  # type: ignore
+    return pyarrow.schema([pyarrow.field(column, types[column]) for column in columns])
+
+
+class ArrowWriter(writer_.Writer):
+    """ Writes normalized documents and highlights as a typed, compressed, columnar file.
+
+        Writes a parquet file, or an arrow IPC file, that can be read by pandas, polars or DuckDB.
+        Highlights are written in row groups of ``row_group_size`` rows, as they arrive,
+        so large exports are never held in memory at once.
+
+        :param documents: The documents the highlights belong to.
+        :param highlight_batches: The highlights to write, in batches.
+        :param columns: The columns to write. All columns are written if not set.
+                        A list of columns can be found by running ``remarking list columns``
+        :param file_format: Either ``parquet`` or ``arrow``.
+        :param compression: The compression codec, e.g. ``zstd``, or ``none``.
+        :param row_group_size: The number of highlights per row group, or per record batch for arrow files.
+    """
+
+    def __init__(self,
+                 documents: List[models.Document],
+                 highlight_batches: T.Iterable[List[models.Highlight]],
+                 columns: T.Optional[List[str]] = None,
+                 file_format: str = "parquet",
+                 compression: str = "zstd",
+                 row_group_size: int = 65536) -> None:
+        self.documents = documents
+        self.highlight_batches = highlight_batches
+        self.columns = columns
+        self.file_format = file_format
+        self.compression = compression
+        self.row_group_size = row_group_size
+
+    def write(self, logger: log.CommandLineLogger) -> None:
+        pyarrow = import_pyarrow()
+        _, headers = common.get_column_filtered_highlights_and_header([], [], self.columns)
+        schema = arrow_schema(pyarrow, headers)
+        output = logger.binary_output()
+        writer = self._open_writer(output, schema)
+        try:
+            rows: List[Dict[str, T.Any]] = []
+            for highlights in self.highlight_batches:
+                normalized_highlights, _ = common.get_column_filtered_highlights_and_header(
+                    self.documents, highlights, self.columns
+                )
+                rows.extend(normalized_highlights)
+                while len(rows) >= self.row_group_size:
+                    self._write_rows(pyarrow, writer, schema, rows[:self.row_group_size])
+                    rows = rows[self.row_group_size:]
+            if rows:
+                self._write_rows(pyarrow, writer, schema, rows)
+        finally:
+            writer.close()
+        output.flush()
+
+    def _open_writer(self, output: T.BinaryIO, schema: T.Any) -> T.Any:
+        if self.file_format == "arrow":
+            ipc = importlib.import_module("pyarrow.ipc")
+            options = ipc.IpcWriteOptions(compression=None if self.compression == "none" else self.compression)
+            return ipc.new_file(output, schema, options=options)
+        parquet = importlib.import_module("pyarrow.parquet")
+        return parquet.ParquetWriter(output, schema, compression=self.compression)
+
+    def _write_rows(self, pyarrow: T.Any, writer: T.Any, schema: T.Any, rows: List[Dict[str, T.Any]]) -> None:
+        batch = pyarrow.RecordBatch.from_arrays(
+            [pyarrow.array([row[field.name] for row in rows], type=field.type) for field in schema],
+            schema=schema
+        )
+        if self.file_format == "arrow":
+            writer.write_batch(batch)
+        else:
+            writer.write_table(pyarrow.Table.from_batches([batch]), row_group_size=self.row_group_size)
+
+
+class ColumnarWriterCommand(writer_command.WriterCommand):
+    """ Base class of the writer commands writing :class:`ArrowWriter` files. """
+
+    compressions = ["zstd", "none"]
+    """ The compression codecs supported by the file format. The first one is the default. """
+
+    @abstractmethod
+    def file_format(self) -> str:
+        """ Return the file format passed to :class:`ArrowWriter`. """
+
+    def options(self) -> List[writer_command.ClickOption]:
+        return [
+            click.option("--columns",
+                         default=",".join(common.generate_column_choices()),
+                         type=str,
+                         show_default="all columns",
+                         callback=common.validate_columns,
+                         help="Comma delimited list of columns to write. "
+                         "`remarking list columns` shows all available columns",
+                         ),
+            click.option("--compression",
+                         type=click.Choice(self.compressions),
+                         default=self.compressions[0],
+                         show_default=True,
+                         help="Compression codec of the file."
+                         ),
+            click.option("--row-group-size",
+                         type=click.IntRange(min=1),
+                         default=65536,
+                         show_default=True,
+                         help="Number of highlights written per row group."
+                         ),
+        ]
+
+    def writer(self,
+               documents: List[models.Document],
+               highlights: List[models.Highlight],
+               **kwargs: T.Any) -> writer_.Writer:
+        return self.stream_writer(documents, [highlights], **kwargs)
+
+    def stream_writer(self,
+                      documents: List[models.Document],
+                      highlight_batches: T.Iterable[List[models.Highlight]],
+                      **kwargs: T.Any) -> writer_.Writer:
+        return ArrowWriter(documents, highlight_batches, kwargs['columns'], self.file_format(),
+                           kwargs['compression'], kwargs['row_group_size'])
+
+
+class ParquetWriterCommand(ColumnarWriterCommand):
+    """ The writer command implementation for the ``parquet`` output writer. """
+
+    compressions = ["zstd", "snappy", "gzip", "lz4", "none"]
+
+    def name(self) -> str:
+        return "parquet"
+
+    def file_format(self) -> str:
+        return "parquet"
+
+    def long_description(self) -> str:
+        return """Output highlights normalized with documents as a parquet file.
+
+Columns are typed and compressed, ready to be loaded by pandas or DuckDB.
+Requires pyarrow, install it with `pip install remarking[arrow]`.
+Check out `remarking list columns` for a list of columns to choose from
+for the `--columns` option.
+    """
+
+    def short_description(self) -> str:
+        return "Output highlights normalized with documents as a parquet file"
+
+
+class ArrowWriterCommand(ColumnarWriterCommand):
+    """ The writer command implementation for the ``arrow`` output writer. """
+
+    compressions = ["zstd", "lz4", "none"]
+
+    def name(self) -> str:
+        return "arrow"
+
+    def file_format(self) -> str:
+        return "arrow"
+
+    def long_description(self) -> str:
+        return """Output highlights normalized with documents as an arrow IPC file.
+
+Columns are typed and compressed, ready to be loaded by pandas, polars or DuckDB.
+Requires pyarrow, install it with `pip install remarking[arrow]`.
+Check out `remarking list columns` for a list of columns to choose from
+for the `--columns` option.
+    """
+
+    def short_description(self) -> str:
+        return "Output highlights normalized with documents as an arrow IPC file"
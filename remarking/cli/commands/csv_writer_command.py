@@ -46,6 +46,41 @@ class CSVWriter(writer_.Writer):
         logger.output_result(output.getvalue())
 
 
+class CSVStreamWriter(writer_.Writer):
+    """ Writes the same csv as :class:`CSVWriter`, one batch of highlights at a time.
+
+        :param documents: The documents the highlights belong to.
+        :param highlight_batches: The highlights to generate a csv for, in batches.
+        :param columns: The columns to print for the csv.
+        :param delimiter: The delimiter to use for the csv.
+    """
+
+    def __init__(self,
+                 documents: List[models.Document],
+                 highlight_batches: T.Iterable[List[models.Highlight]],
+                 columns: T.Optional[List[str]] = None,
+                 delimiter: str = None) -> None:
+        self.delimiter = delimiter or ","
+        self.columns = columns
+        self.documents = documents
+        self.highlight_batches = highlight_batches
+
+    def write(self, logger: log.CommandLineLogger) -> None:
+        output = io.StringIO(newline='')
+        _, headers = common.get_column_filtered_highlights_and_header([], [], self.columns)
+        writer = csv.DictWriter(output, delimiter=self.delimiter, fieldnames=headers)
+        writer.writeheader()
+        for highlights in self.highlight_batches:
+            normalized_highlights, _ = common.get_column_filtered_highlights_and_header(
+                self.documents, highlights, self.columns
+            )
+            writer.writerows(normalized_highlights)
+            logger.output_result(output.getvalue())
+            output.seek(0)
+            output.truncate()
+        logger.output_result(output.getvalue())
+
+
 class CSVWriterCommand(writer_command.WriterCommand):
     """ The writer command implementaton for the ``csv`` output writer. """
 
@@ -77,3 +112,9 @@ for the `--columns` option.
         delimiter = kwargs['delimiter']
         columns = kwargs['columns']
         return CSVWriter(documents, highlights, columns, delimiter)
+
+    def stream_writer(self,
+                      documents: List[models.Document],
+                      highlight_batches: T.Iterable[List[models.Highlight]],
+                      **kwargs: T.Any) -> writer_.Writer:
+        return CSVStreamWriter(documents, highlight_batches, kwargs['columns'], kwargs['delimiter'])
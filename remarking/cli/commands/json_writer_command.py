@@ -65,6 +65,32 @@ class JSONWriter(writer_.Writer):
         logger.output_result(json_string + '\n')
 
 
+class JSONStreamWriter(writer_.Writer):
+    """ Writes the same JSON string as :class:`JSONWriter`, one batch of highlights at a time.
+
+        :param documents: The list of documents to generate a json string for.
+        :param highlight_batches: The highlights to generate a json string for, in batches.
+    """
+
+    def __init__(self,
+                 documents: List[models.Document],
+                 highlight_batches: T.Iterable[List[models.Highlight]]) -> None:
+        self.documents = [doc.to_dict() for doc in documents]
+        self.highlight_batches = highlight_batches
+
+    def write(self, logger: log.CommandLineLogger) -> None:
+        logger.output_result('{"documents": ' + json.dumps(self.documents, default=json_serial) + ', "highlights": [')
+        separator = ""
+        for highlights in self.highlight_batches:
+            if not highlights:
+                continue
+            logger.output_result(separator + ", ".join(
+                json.dumps(highlight.to_dict(), default=json_serial) for highlight in highlights
+            ))
+            separator = ", "
+        logger.output_result(']}\n')
+
+
 class JSONWriterCommand(writer_command.WriterCommand):
     """ The writer command implementation for the ``json`` output writer. """
 
@@ -85,3 +111,9 @@ class JSONWriterCommand(writer_command.WriterCommand):
                highlights: List[models.Highlight],
                **kwargs: T.Any) -> writer_.Writer:
         return JSONWriter(documents, highlights)
+
+    def stream_writer(self,
+                      documents: List[models.Document],
+                      highlight_batches: T.Iterable[List[models.Highlight]],
+                      **kwargs: T.Any) -> writer_.Writer:
+        return JSONStreamWriter(documents, highlight_batches)
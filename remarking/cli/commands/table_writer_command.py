@@ -1,3 +1,4 @@
+import itertools
 import typing as T
 from typing import List
 
@@ -10,6 +11,11 @@ from remarking.cli import writer as writer_
 from remarking.cli import writer_command
 
 
+def truncate_text(text: str) -> str:
+    """ Shorten text to 100 characters for printing in a table. """
+    return text[0:100] + ("..." if len(text) > 99 else "")
+
+
 # pylint: disable=line-too-long
 class TableWriter(writer_.Writer):
     """ Writes normalized documents and highlights to a simple table.
@@ -46,15 +52,119 @@ class TableWriter(writer_.Writer):
             logger.output_result(tabulate(self.highlights, headers="keys", tablefmt="plain") + '\n'
                                  if self.highlights else "")
         else:
+            highlights = self.highlights
             if self.truncate:
-                for highlight in self.highlights:
-                    text = highlight['highlight_text']
-                    highlight['highlight_text'] = text[0:100] + ("..." if len(text) > 99 else "")
-                for highlight in self.highlights:
-                    text = highlight['document_name']
-                    highlight['document_name'] = text[0:100] + ("..." if len(text) > 99 else "")
-            logger.output_result(tabulate(self.highlights, headers="keys", tablefmt="simple") + '\n'
-                                 if self.highlights else "")
+                # Truncated copies, the normalized highlights may be shared with other writers.
+                highlights = [{
+                    **highlight,
+                    'highlight_text': truncate_text(highlight['highlight_text']),
+                    'document_name': truncate_text(highlight['document_name']),
+                } for highlight in highlights]
+            logger.output_result(tabulate(highlights, headers="keys", tablefmt="simple") + '\n'
+                                 if highlights else "")
+
+
+class TableStreamWriter(writer_.Writer):
+    """ Writes the table of :class:`TableWriter` row by row, without holding every row in memory.
+
+        Column widths are either fixed or sampled from the first ``sample_rows`` rows, so rows are printed
+        as soon as they are normalized. Cells wider than their column are truncated with ``...``.
+        Output is written in whole lines, ``flush_rows`` rows at a time, so a pager shows complete rows
+        as they arrive. Writing stops quietly once the reader, like ``head`` or a pager, closes the output.
+
+        :param documents: The documents the highlights belong to.
+        :param highlight_batches: The highlights to generate a table for, in batches.
+        :param columns: The columns to print for the table.
+        :param print_plain: If a plain table with only spaces and new lines should be printed.
+        :param column_widths: The width of each column. Sampled from the first rows if not set.
+        :param sample_rows: The number of rows column widths are sampled from.
+        :param max_width: The widest a sampled column can be. Columns are as wide as their widest sampled cell
+                          if not set, wider cells in later rows are then not truncated.
+        :param flush_rows: The number of rows written at a time.
+    """
+
+    def __init__(self,
+                 documents: List[models.Document],
+                 highlight_batches: T.Iterable[List[models.Highlight]],
+                 columns: T.Optional[List[str]] = None,
+                 print_plain: bool = False,
+                 column_widths: T.Optional[List[int]] = None,
+                 sample_rows: int = 100,
+                 max_width: T.Optional[int] = 100,
+                 flush_rows: int = 50) -> None:
+        self.documents = documents
+        self.highlight_batches = highlight_batches
+        self.projector = common.row_projector(columns)
+        self.print_plain = print_plain
+        if column_widths is not None and len(column_widths) != len(self.projector.headers):
+            raise ValueError(f"Expected {len(self.projector.headers)} column widths, got {len(column_widths)}")
+        self.column_widths = column_widths
+        self.sample_rows = sample_rows
+        self.max_width = max_width
+        self.flush_rows = flush_rows
+
+    def _rows(self) -> T.Iterator[T.Tuple[str, ...]]:
+        headers = self.projector.headers
+        for highlights in self.highlight_batches:
+            for row in self.projector.project_all(self.documents, highlights):
+                yield tuple(_format_cell(row[header]) for header in headers)
+
+    def write(self, logger: log.CommandLineLogger) -> None:
+        headers = self.projector.headers
+        rows = self._rows()
+        sample = list(itertools.islice(rows, self.sample_rows))
+        if not sample:
+            return
+        widths = self.column_widths
+        if widths is None:
+            widths = [max(len(cell) for cell in column) for column in zip(*sample)]
+            if self.max_width is not None:
+                widths = [min(width, self.max_width) for width in widths]
+            widths = [max(width, len(header)) for width, header in zip(widths, headers)]
+        # Like tabulate, columns whose sampled cells are all numbers are right aligned.
+        right_aligned = [all(cell == "" or _is_number(cell) for cell in column) and any(column)
+                         for column in zip(*sample)]
+
+        def format_row(cells: T.Sequence[str]) -> str:
+            return "  ".join(
+                _fit(cell, width).rjust(width) if right else _fit(cell, width).ljust(width)
+                for cell, width, right in zip(cells, widths, right_aligned)
+            ).rstrip() + "\n"
+
+        lines = [format_row(headers)]
+        if not self.print_plain:
+            lines.append("  ".join("-" * width for width in widths) + "\n")
+        try:
+            for index, row in enumerate(itertools.chain(sample, rows)):
+                lines.append(format_row(row))
+                # The first rows are written right away, the rest in chunks of `flush_rows`.
+                if index == 0 or len(lines) >= self.flush_rows:
+                    logger.output_result("".join(lines))
+                    lines = []
+            if lines:
+                logger.output_result("".join(lines))
+        except BrokenPipeError:
+            pass
+
+
+def _format_cell(value: T.Any) -> str:
+    if value is None:
+        return ""
+    return str(value).replace("\n", " ")
+
+
+def _is_number(text: str) -> bool:
+    try:
+        float(text)
+    except ValueError:
+        return False
+    return True
+
+
+def _fit(text: str, width: int) -> str:
+    if len(text) <= width:
+        return text
+    return text[:max(width - 3, 0)] + "..."[:width]
 
 
 class TableWriterCommand(writer_command.WriterCommand):
@@ -74,7 +184,30 @@ class TableWriterCommand(writer_command.WriterCommand):
                          "do_truncate",
                          default=True,
                          help="Truncate results when printing plain"
-                          )
+                          ),
+            click.option("--stream/--no-stream",
+                         default=False,
+                         help="Print rows as they are extracted instead of once all rows are known. "
+                         "Column widths are fixed with `--column-widths` or sampled from the first rows."
+                         ),
+            click.option("--column-widths",
+                         default=None,
+                         type=str,
+                         callback=validate_column_widths,
+                         help="Comma delimited widths of the columns when streaming, e.g. `60,30,4`."
+                         ),
+            click.option("--sample-rows",
+                         type=click.IntRange(min=1),
+                         default=100,
+                         show_default=True,
+                         help="Number of rows column widths are sampled from when streaming."
+                         ),
+            click.option("--flush-rows",
+                         type=click.IntRange(min=1),
+                         default=50,
+                         show_default=True,
+                         help="Number of rows written at a time when streaming."
+                         ),
         ]
 
     def long_description(self) -> str:
@@ -91,7 +224,41 @@ for the `--columns` option.
                documents: List[models.Document],
                highlights: List[models.Highlight],
                **kwargs: T.Any) -> writer_.Writer:
+        if kwargs['stream']:
+            return self.stream_writer(documents, [highlights], **kwargs)
         columns = kwargs['columns']
         do_truncate = kwargs['do_truncate']
         print_plain = kwargs['print_plain']
         return TableWriter(documents, highlights, columns, do_truncate, print_plain)
+
+    def stream_writer(self,
+                      documents: List[models.Document],
+                      highlight_batches: T.Iterable[List[models.Highlight]],
+                      **kwargs: T.Any) -> writer_.Writer:
+        if not kwargs['stream']:
+            return super().stream_writer(documents, highlight_batches, **kwargs)
+        try:
+            return TableStreamWriter(documents, highlight_batches, kwargs['columns'], kwargs['print_plain'],
+                                     column_widths=kwargs['column_widths'],
+                                     sample_rows=kwargs['sample_rows'],
+                                     max_width=100 if kwargs['do_truncate'] else None,
+                                     flush_rows=kwargs['flush_rows'])
+        except ValueError as exc:
+            raise click.BadParameter(str(exc), param_hint="'--column-widths'") from exc
+
+
+# pylint: disable=unused-argument
+def validate_column_widths(ctx: click.Context, param: click.Parameter, value: T.Optional[str]) -> T.Optional[List[int]]:
+    """ Parse the comma delimited `--column-widths` into a list of widths.
+
+    Should be called as a click callback.
+    """
+    if value is None:
+        return None
+    try:
+        widths = [int(width) for width in value.replace(" ", "").split(",")]
+    except ValueError as exc:
+        raise click.BadParameter(f"'{value}' is not a comma delimited list of numbers") from exc
+    if any(width < 1 for width in widths):
+        raise click.BadParameter("column widths must be at least 1")
+    return widths
@@ -1,5 +1,10 @@
+import contextlib
+import contextvars
+import functools
 import importlib
 import inspect
+import operator
+import os
 import pkgutil
 import typing as T
 import uuid
@@ -10,6 +15,8 @@ import click
 import remarking.highlight_extractor as highlight_extractor_modules
 from remarking import models
 from remarking.highlight_extractor import highlight_extractor
+from remarking.storage import bloom_storage, log_storage
+from remarking.storage import storage as storage_
 
 
 def import_submodules(package: T.Any, recursive: bool = True) -> T.Any:
@@ -53,6 +60,54 @@ def help_color_options() -> Dict[str, str]:
 
 
 
+def read_connection_string(sqlalchemy: str) -> str:
+    """ Return the connection string passed to `--sqlalchemy`.
+
+    If the value is the path to a file, the connection string is read from the file.
+    """
+    if os.path.exists(sqlalchemy) and os.path.isfile(sqlalchemy):
+        with open(sqlalchemy, "r") as file_p:
+            return file_p.read().strip()
+    return sqlalchemy
+
+
+def create_storage(url: str) -> storage_.Storage:
+    """ Open the storage for a `--sqlalchemy` connection string.
+
+    ``log://`` URLs open a :class:`LogStorage`, anything else is passed to SqlAlchemy.
+    """
+    if log_storage.is_log_url(url):
+        return log_storage.LogStorage(url)
+    # Imported here so that log storage does not pay for setting up SqlAlchemy engines.
+    from remarking.storage import sqlalchemy_storage  # pylint: disable=import-outside-toplevel
+    return sqlalchemy_storage.SqlAlchemyStorage(url)
+
+
+def storage_file_path(url: str) -> T.Optional[str]:
+    """ Return the local file holding the storage of a `--sqlalchemy` connection string.
+
+    Returns None unless the storage is a log or a SQLite database file.
+    """
+    if log_storage.is_log_url(url):
+        return url[len(log_storage.LOG_URL_SCHEME):]
+    if url.startswith("sqlite:///"):
+        path = url[len("sqlite:///"):].split("?", 1)[0]
+        if path and path != ":memory:":
+            return path
+    return None
+
+
+def add_bloom_filter(storage: storage_.Storage, url: str) -> bloom_storage.BloomFilterStorage:
+    """ Wrap storage with a bloom filter of its highlight hashes.
+
+    The filter is saved next to file based storage as ``<file>.bloom``, and kept in memory otherwise.
+    """
+    path = storage_file_path(url)
+    return bloom_storage.BloomFilterStorage(storage,
+                                            path=f"{path}.bloom" if path is not None else None,
+                                            storage_path=path)
+
+
 # pylint: disable=unused-argument
 
 
@@ -123,6 +178,14 @@ core_run_options = [
                  type=click.File('w', lazy=True),
                  default=None,
                  help="Output highlights to the given file"),
+    click.option("--sink",
+                 "sinks",
+                 multiple=True,
+                 metavar="WRITER-COMMAND",
+                 help="Also write the highlights with another writer command and its options, "
+                 "e.g. `--sink \"csv --output highlights.csv\"`. Can be repeated. "
+                 "Every writer gets the same highlights from a single extraction."
+                 ),
     click.option("--working-directory",
                  "-w",
                  type=click.Path(exists=False,
@@ -137,29 +200,149 @@ core_run_options = [
                  help="Working directory where files will be downloaded and highlights generated."
                   ),
     click.option("-q", "--quiet", is_flag=True, help="Print nothing."),
+    click.option("--accounts",
+                 type=click.Path(exists=True, file_okay=True, dir_okay=False, readable=True),
+                 default=None,
+                 help="Path to a JSON manifest of accounts to sync concurrently in one process. "
+                 "Each account lists its rmapi config file, collections and output file. "
+                 "COLLECTION-NAMES, `--token` and `--output` are ignored when set."
+                 ),
+    click.option("--extractor-timeout",
+                 type=click.FloatRange(min=0, min_open=True),
+                 default=None,
+                 help="Seconds an extractor may spend on a document. Extractors run in worker processes when set "
+                 "and documents that take longer are skipped until they are modified."
+                 ),
+    click.option("--extractor-memory",
+                 type=click.IntRange(min=1),
+                 default=None,
+                 help="Megabytes of memory an extractor worker process may use. Extractors run in worker processes "
+                 "when set and documents that need more are skipped until they are modified. Unix only."
+                 ),
+    click.option("--extractor-workers",
+                 type=click.IntRange(min=1),
+                 default=1,
+                 show_default=True,
+                 help="Number of worker processes running extractors. Extractors run in worker processes when above 1."
+                 ),
+    click.option("--retry-skipped",
+                 is_flag=True,
+                 help="Extract documents that were skipped for exceeding `--extractor-timeout` or `--extractor-memory`"
+                 " again, even if they were not modified since."
+                 ),
+    click.option("--exclude-folder",
+                 "excluded_folders",
+                 multiple=True,
+                 metavar="FOLDER-NAME",
+                 help="Skip the folder with this name and everything inside it while crawling COLLECTION-NAMES. "
+                 "Can be repeated. Documents in the trash are always skipped."
+                 ),
     click.argument("collection-names", nargs=-1)
 ]
 
 
-def generate_normalized_column_mappings() -> Dict[str, T.Dict[str, str]]:
-    """ Generate mappings for model column names to normalized column names """
-    dummy_highlight = models.Highlight()
-    dummy_document = models.Document()
+@functools.lru_cache(maxsize=None)
+def _normalized_column_mappings() -> Dict[str, T.Dict[str, str]]:
     return {
-        "highlight": {key: f'highlight_{key}' for key in dummy_highlight.to_dict().keys()},
-        "document": {key: f'document_{key}' for key in dummy_document.to_dict().keys()}
+        "highlight": {column.name: f'highlight_{column.name}' for column in models.Highlight.__table__.columns},
+        "document": {column.name: f'document_{column.name}' for column in models.Document.__table__.columns}
     }
 
 
+def generate_normalized_column_mappings() -> Dict[str, T.Dict[str, str]]:
+    """ Generate mappings for model column names to normalized column names """
+    return {model: dict(mapping) for model, mapping in _normalized_column_mappings().items()}
+
+
 def generate_column_choices() -> T.List[str]:
     """ Generate columns names for normalized mappings"""
-    mappings = generate_normalized_column_mappings()
+    mappings = _normalized_column_mappings()
     return [
         *list(mappings['highlight'].values()),
         *list(mappings['document'].values())
     ]
 
 
+class RowProjector():
+    """ Builds normalized highlights holding only the selected columns.
+
+    The selected attributes are read straight from the highlight and document models with one
+    :func:`operator.attrgetter` per model, so unselected columns cost nothing. The document columns of a row
+    are read once per document and copied into the rows of its highlights. Use :func:`row_projector` to get
+    the projector of a column selection, it is only built once.
+
+    :param columns: The normalized columns to select. All columns are selected if not set.
+    """
+
+    def __init__(self, columns: T.Optional[T.Sequence[str]] = None) -> None:
+        mappings = _normalized_column_mappings()
+        selected = set(columns) if columns is not None else None
+        fields = [(model, key, header)
+                  for model in ("highlight", "document")
+                  for key, header in mappings[model].items()
+                  if selected is None or header in selected]
+        self.headers = [header for _, _, header in fields]
+        """ The selected normalized columns, highlight columns first and in model order. """
+        self._highlight_headers = [header for model, _, header in fields if model == "highlight"]
+        self._document_headers = [header for model, _, header in fields if model == "document"]
+        self._get_highlight_values = _tuple_attrgetter([key for model, key, _ in fields if model == "highlight"])
+        self._get_document_values = _tuple_attrgetter([key for model, key, _ in fields if model == "document"])
+
+    def _document_row(self, document: models.Document) -> Dict[str, T.Any]:
+        return dict(zip(self._document_headers, self._get_document_values(document)))
+
+    def project(self, highlight: models.Highlight, document: models.Document) -> Dict[str, T.Any]:
+        """ Return the normalized row of a highlight and its document. """
+        row = dict(zip(self._highlight_headers, self._get_highlight_values(highlight)))
+        row.update(self._document_row(document))
+        return row
+
+    def project_all(self,
+                    documents: List[models.Document],
+                    highlights: List[models.Highlight]) -> List[Dict[str, T.Any]]:
+        """ Join highlights with their documents into normalized rows.
+
+        :raises MissingDocumentException: If a highlight has no matching document.
+        """
+        document_lookup = {doc.id: doc for doc in documents}
+        document_rows: Dict[str, Dict[str, T.Any]] = {}
+        highlight_headers = self._highlight_headers
+        get_highlight_values = self._get_highlight_values
+        rows = []
+        for highlight in highlights:
+            document_row = document_rows.get(highlight.document_id)
+            if document_row is None:
+                try:
+                    document = document_lookup[highlight.document_id]
+                except KeyError as exc:
+                    raise MissingDocumentException(highlight.document_id) from exc
+                document_row = document_rows[highlight.document_id] = self._document_row(document)
+            row = dict(zip(highlight_headers, get_highlight_values(highlight)))
+            row.update(document_row)
+            rows.append(row)
+        return rows
+
+
+def _tuple_attrgetter(names: T.List[str]) -> T.Callable[[T.Any], Tuple[T.Any, ...]]:
+    """ Return a function reading the named attributes of an object into a tuple, whatever their number. """
+    if not names:
+        return lambda obj: ()
+    if len(names) == 1:
+        get_value = operator.attrgetter(names[0])
+        return lambda obj: (get_value(obj),)
+    return operator.attrgetter(*names)
+
+
+@functools.lru_cache(maxsize=32)
+def _cached_row_projector(columns: T.Optional[Tuple[str, ...]]) -> RowProjector:
+    return RowProjector(columns)
+
+
+def row_projector(columns: T.Optional[T.Sequence[str]] = None) -> RowProjector:
+    """ Return the :class:`RowProjector` of a column selection, building it on first use. """
+    return _cached_row_projector(tuple(columns) if columns is not None else None)
+
+
 def get_column_filtered_highlights_and_header(
     documents: List[models.Document],
     highlights: List[models.Highlight],
@@ -173,23 +356,39 @@ def get_column_filtered_highlights_and_header(
     Returns headers even if normalized highlight is empty.
 
     """
+    if columns is None:
+        return normalize_highlights_and_documents(documents, highlights), generate_column_choices()
+    projector = row_projector(columns)
+    return projector.project_all(documents, highlights), list(projector.headers)
 
-    mappings = generate_normalized_column_mappings()
-    headers = [
-        *mappings['highlight'].values(),
-        *mappings['document'].values(),
-    ]
-    normalized_highlights = normalize_highlights_and_documents(documents, highlights)
-    if columns is not None:
-        keys_to_remove = [key for key in headers if key not in columns]
-        for key in keys_to_remove:
-            headers.remove(key)
 
-        for highlight in normalized_highlights:
-            for key in keys_to_remove:
-                highlight.pop(key)
+_NormalizationCache = Dict[Tuple[int, int], Tuple[List[models.Document],
+                                                  List[models.Highlight],
+                                                  List[Dict[str, T.Any]]]]
+_normalization_cache: "contextvars.ContextVar[T.Optional[_NormalizationCache]]" = \
+    contextvars.ContextVar("remarking_normalization_cache", default=None)
+""" Normalized highlights by the ids of the lists they were built from, while :func:`shared_normalization` is active.
+
+The cache is local to the thread or asyncio task that activated it, and keeps the lists alive so their ids
+cannot be reused.
+"""
+
 
-    return normalized_highlights, headers
+@contextlib.contextmanager
+def shared_normalization() -> T.Iterator[None]:
+    """ Normalize each list of documents and highlights only once while the context is active.
+
+    Used when one result is written by several writers, see `--sink`. The normalized highlights returned by
+    :func:`normalize_highlights_and_documents` are then shared and must not be modified.
+    """
+    if _normalization_cache.get() is not None:
+        yield
+        return
+    token = _normalization_cache.set({})
+    try:
+        yield
+    finally:
+        _normalization_cache.reset(token)
 
 
 class MissingDocumentException(Exception):
@@ -205,26 +404,17 @@ def normalize_highlights_and_documents(documents: List[models.Document],
 
     If a highlight has no matching document, an exception is thrown.
     """
-    mappings = generate_normalized_column_mappings()
-    documents_dict = [doc.to_dict() for doc in documents]
-    highlights_dict = [highlight.to_dict() for highlight in highlights]
-
-    document_lookup = {doc['id']: doc for doc in documents_dict}
-
-    normalized_highlights = []
-    for highlight in highlights_dict:
-        new_highlight = {
-            mappings['highlight'][key]: value
-            for key, value in highlight.items()
-        }
-        if highlight['document_id'] not in document_lookup:
-            raise MissingDocumentException(highlight['document_id'])
-        document = document_lookup[highlight['document_id']]
-        new_document = {
-            mappings['document'][key]: value
-            for key, value in document.items()
-        }
-        new_highlight.update(new_document)
-        normalized_highlights.append(new_highlight)
-
-    return normalized_highlights
+    cache = _normalization_cache.get()
+    if cache is not None:
+        key = (id(documents), id(highlights))
+        cached = cache.get(key)
+        if cached is None:
+            cached = (documents, highlights, _normalize_highlights_and_documents(documents, highlights))
+            cache[key] = cached
+        return cached[2]
+    return _normalize_highlights_and_documents(documents, highlights)
+
+
+def _normalize_highlights_and_documents(documents: List[models.Document],
+                                        highlights: List[models.Highlight]) -> List[Dict[str, T.Any]]:
+    return row_projector().project_all(documents, highlights)
@@ -0,0 +1,52 @@
+""" Move highlight text saved by persist to a deduplicated table """
+import click
+from click_help_colors import HelpColorsCommand
+
+from remarking.cli import common, log
+from remarking.storage import log_storage, sqlalchemy_storage
+
+
+@click.command(
+    name="deduplicate-text",
+    cls=HelpColorsCommand,
+    **common.help_color_options()
+)
+@click.option("--sqlalchemy",
+              type=str,
+              required=True,
+              nargs=1,
+              default="sqlite:///remarking_database.sqlite3",
+              envvar="REMARKING_SQLALCHEMY",
+              show_envvar=True,
+              help="The sqlalchemy connection string of the database used by `remarking persist`. "
+              "This can also be a file whose contents are a connection string."
+              )
+@click.option("--batch-size",
+              type=click.IntRange(min=1),
+              default=1000,
+              show_default=True,
+              help="Number of highlights moved per statement."
+              )
+@click.pass_context
+def deduplicate_text(ctx: click.Context, sqlalchemy: str, batch_size: int) -> None:
+    """ Store each distinct highlight text once in the database used by `remarking persist`.
+
+    The text of every stored highlight is moved to a table keyed by a hash of the text, so a passage
+    highlighted in several documents or copies of a book is only stored once. Afterwards `remarking persist`
+    saves new highlights the same way. Highlights are read back unchanged, no other command is affected.
+
+    The migration runs in a single transaction and can be run again at any time.
+    SQLite databases only shrink on disk after running VACUUM.
+
+    \b
+    Example:
+        remarking deduplicate-text --sqlalchemy sqlite:///database.sqlite3
+    """
+    connection_string = common.read_connection_string(sqlalchemy)
+    if log_storage.is_log_url(connection_string):
+        ctx.fail(click.style("Log storage cannot deduplicate highlight text", fg="red"))
+
+    logger = log.CommandLineLogger(spinners_enabled=False, quiet=False)
+    with sqlalchemy_storage.SqlAlchemyStorage(connection_string) as storage:
+        moved = storage.deduplicate_highlight_text(batch_size=batch_size)
+    logger.echo(f"Moved the text of {moved} highlights.", err=True)
@@ -0,0 +1,109 @@
+""" Export highlights saved by persist """
+import datetime
+import typing as T
+from typing import List, Type
+
+import click
+from click_help_colors import HelpColorsCommand, HelpColorsGroup
+
+from remarking.cli import common, log, writer_command
+from remarking.cli.writer_command_runner import add_options
+
+
+@click.group(
+    name="export",
+    cls=HelpColorsGroup,
+    **common.help_color_options()
+)
+@click.option("--sqlalchemy",
+              type=str,
+              required=True,
+              nargs=1,
+              default="sqlite:///remarking_database.sqlite3",
+              envvar="REMARKING_SQLALCHEMY",
+              show_envvar=True,
+              help="The sqlalchemy connection string of the database used by `remarking persist`. "
+              "This can also be a file whose contents are a connection string."
+              )
+@click.option("--since",
+              type=click.DateTime(),
+              default=None,
+              help="Only export highlights extracted at or after this time."
+              )
+@click.option("--document",
+              "document_names",
+              multiple=True,
+              help="Only export highlights of the document with this name or id. Can be repeated."
+              )
+@click.option("--batch-size",
+              type=click.IntRange(min=1),
+              default=1000,
+              show_default=True,
+              help="Number of highlights read from the database at a time."
+              )
+@click.pass_context
+def export(ctx: click.Context,
+           sqlalchemy: str,
+           since: T.Optional[datetime.datetime],
+           document_names: T.Tuple[str, ...],
+           batch_size: int) -> None:
+    """ Export highlights saved by `remarking persist`.
+
+    All highlights saved in the database are written out by the given writer command,
+    oldest first. The reMarkable cloud is not contacted.
+
+    Highlights are read from the database in batches, so large databases can be exported
+    without loading every highlight into memory. The csv and json writers also write
+    each batch as soon as it is read.
+
+    \b
+    Example:
+        remarking export --since 2021-07-01 --document "Through the Looking-Glass" csv --output highlights.csv
+    """
+    ctx.ensure_object(dict)
+    ctx.obj["storage"] = common.create_storage(common.read_connection_string(sqlalchemy))
+    ctx.call_on_close(ctx.obj["storage"].close)
+    ctx.obj["since"] = since
+    ctx.obj["document_names"] = document_names
+    ctx.obj["batch_size"] = batch_size
+
+
+def register_export_writer_command(command_cls: Type[writer_command.WriterCommand]) -> None:
+    """ Add a subcommand to `remarking export` that writes stored highlights with the given writer command. """
+    writer_command_instance = command_cls()
+
+    @click.command(
+        name=writer_command_instance.name(),
+        cls=HelpColorsCommand,
+        short_help=writer_command_instance.short_description(),
+        help=writer_command_instance.long_description(),
+        **common.help_color_options()
+    )
+    @click.option("--output",
+                  "-o",
+                  type=click.File('w', lazy=True),
+                  default=None,
+                  help="Output highlights to the given file")
+    @add_options(writer_command_instance.options())
+    @click.pass_context
+    def command(ctx: click.Context, output: T.Optional[T.IO], **kwargs: T.Any) -> None:
+        logger = log.CommandLineLogger(spinners_enabled=False, quiet=False, file_output=output)
+        storage = ctx.obj["storage"]
+        documents = storage.get_documents()
+
+        document_ids: T.Optional[List[str]] = None
+        if ctx.obj["document_names"]:
+            wanted = {name.lower() for name in ctx.obj["document_names"]}
+            documents = [doc for doc in documents if doc.id.lower() in wanted or doc.name.lower() in wanted]
+            if not documents:
+                ctx.fail(click.style(
+                    f"No stored documents match {', '.join(ctx.obj['document_names'])}", fg="red"
+                ))
+            document_ids = [doc.id for doc in documents]
+
+        highlight_batches = storage.iter_highlight_batches(since=ctx.obj["since"],
+                                                           document_ids=document_ids,
+                                                           batch_size=ctx.obj["batch_size"])
+        writer_command_instance.stream_writer(documents, highlight_batches, **kwargs).write(logger)
+
+    export.add_command(command, writer_command_instance.name())
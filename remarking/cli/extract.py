@@ -1,35 +1,93 @@
+import asyncio
 import logging
 import sys
 import typing as T
 from typing import List
 
 import click
+import requests
 
-from remarking import models
+from remarking import isolation, models
 from remarking import rmcloud as rmcloud_
 from remarking.cli import app as app_
-from remarking.cli import common, log
+from remarking.cli import common, log, watch
 from remarking.highlight_extractor import highlight_extractor
+from remarking.storage import async_storage as async_storage_
 from remarking.storage import storage as storage_
 
 
-def run_extract(logger: log.CommandLineLogger,
-                token: str,
-                working_directory: str,
-                extractors: T.List[str],
-                collection_names: T.List[str],
-                storage: storage_.Storage
-                ) -> T.Tuple[List[models.Document], List[models.Highlight]]:
-    """ Run extraction of highlights.
+def create_extractors(extractors: T.List[str]) -> List[highlight_extractor.HighlightExtractor]:
+    """ Return the extractor instances for the given extractor names. """
+    extractor_instances: List[highlight_extractor.HighlightExtractor] = []
+    for extractor_name in extractors:
+        logging.info(f"Creating extractor {extractor_name}")
+        extractor_instances.append(common.get_extractor_mappings()[extractor_name].instance)
+    return extractor_instances
+
+
+def create_extraction_limits(timeout: T.Optional[float] = None,
+                             memory: T.Optional[int] = None,
+                             workers: int = 1) -> T.Optional[isolation.ExtractionLimits]:
+    """ Return the limits extractors are held to, or None if they should run in process without limits.
+
+    :param: timeout: Seconds an extractor may spend on a document.
+    :param: memory: Megabytes of memory an extractor worker process may use.
+    :param: workers: The number of extractor worker processes.
+    """
+    if timeout is None and memory is None and workers <= 1:
+        return None
+    return isolation.ExtractionLimits(timeout=timeout,
+                                      memory=memory * 2 ** 20 if memory is not None else None,
+                                      workers=workers)
+
+
+def connect(logger: log.CommandLineLogger,
+            token: str,
+            config_path: T.Optional[str] = None,
+            session: T.Optional[requests.Session] = None) -> rmcloud_.RMCloud:
+    """ Connect to the reMarkable cloud, showing a spinner while connecting.
+
+    :param: config_path: The rmapy config file holding the account's tokens, see :class:`RMCloud`.
+    :param: session: A requests session shared with other connections, see :func:`rmcloud.create_session`.
+
+    :raises rmcloud.AuthError: If the token is not valid.
+    """
+    spinner = logger.spinner(text="Connecting to RM cloud", spinner="bouncingBar")
+    spinner.start()
+    try:
+        rmcloud = rmcloud_.RMCloud(token, config_path=config_path, session=session)
+    except rmcloud_.AuthError:
+        spinner.fail()
+        raise
+    spinner.succeed("Connected to RM cloud.")
+    return rmcloud
+
+
+def create_app(logger: log.CommandLineLogger,
+               token: str,
+               extractors: T.List[str],
+               collection_names: T.List[str],
+               storage: T.Union[storage_.Storage, async_storage_.AsyncStorage],
+               incremental: bool = False,
+               extraction_limits: T.Optional[isolation.ExtractionLimits] = None,
+               retry_skipped: bool = False,
+               excluded_folders: T.Sequence[str] = ()
+               ) -> T.Union[app_.App, app_.AsyncApp]:
+    """ Connect to the reMarkable cloud and create the application used to extract highlights.
 
     :param: token: reMarkable cloud one time use token.
-    :param: working_directory: a directory to download highlights to and perform general file io in.
     :param: extractors: A list of named highlight extractors. The names should match those
                         in common.get_extractor_mappings(). They can be listed with the `list` subcommand
     :param: collection_names: A list of the names of folder and documents that highlights should be extracted from.
     :param: storage: an implementation of storage to persist highlight and document state.
+                     When it is an :class:`AsyncStorage` an :class:`AsyncApp` is returned.
+    :param: incremental: If the app should skip documents unchanged since its previous run.
+    :param: extraction_limits: Run extractors in worker processes held to these limits,
+                               see :func:`create_extraction_limits`.
+    :param: retry_skipped: If documents skipped for exceeding the limits should be extracted again.
+    :param: excluded_folders: Names of folders left out with everything inside them when crawling collections.
 
-    :returns: A list of highlights and their associated documents.
+    :returns: The application, ready to have :meth:`App.run_app` or :meth:`AsyncApp.run_app_async` called.
     """
 
     if not collection_names:
@@ -38,22 +96,134 @@ def run_extract(logger: log.CommandLineLogger,
     logger.echo(click.style("Extractors", fg="green", bold=True) + f": {', '.join(extractors)}", err=True)
     logger.echo(click.style("Collections", fg="green", bold=True) + f": {' , '.join(collection_names)}", err=True)
 
-    extractor_instances: List[highlight_extractor.HighlightExtractor] = []
-    for extractor_name in extractors:
-        logging.info(f"Creating extractor {extractor_name}")
-        extractor_instances.append(common.get_extractor_mappings()[extractor_name].instance)
+    extractor_instances = create_extractors(extractors)
 
-    spinner = logger.spinner(text="Connecting to RM cloud", spinner="bouncingBar")
-    spinner.start()
-    rmcloud: T.Optional[rmcloud_.RMCloud] = None
     try:
-        rmcloud = rmcloud_.RMCloud(token)
+        rmcloud = connect(logger, token)
     except rmcloud_.AuthError:
-        spinner.fail()
         logger.echo(click.style("Failed to connect to the Remarkable Cloud, is the token correct?", fg="red"))
         sys.exit(1)
-    spinner.succeed("Connected to RM cloud.")
 
-    app = app_.App(rmcloud=rmcloud, storage=storage, extractors=extractor_instances, logger=logger)
-    documents, highlights = app.run_app(working_directory, collection_names)
+    if isinstance(storage, async_storage_.AsyncStorage):
+        return app_.AsyncApp(rmcloud=rmcloud,
+                             storage=storage,
+                             extractors=extractor_instances,
+                             logger=logger,
+                             incremental=incremental,
+                             extraction_limits=extraction_limits,
+                             retry_skipped=retry_skipped,
+                             excluded_folders=excluded_folders)
+    return app_.App(rmcloud=rmcloud,
+                    storage=storage,
+                    extractors=extractor_instances,
+                    logger=logger,
+                    incremental=incremental,
+                    extraction_limits=extraction_limits,
+                    retry_skipped=retry_skipped,
+                    excluded_folders=excluded_folders)
+
+
+def run_extract(logger: log.CommandLineLogger,
+                token: str,
+                working_directory: str,
+                extractors: T.List[str],
+                collection_names: T.List[str],
+                storage: T.Union[storage_.Storage, async_storage_.AsyncStorage],
+                on_result: T.Optional[T.Callable[[List[models.Document], List[models.Highlight]], None]] = None,
+                extraction_limits: T.Optional[isolation.ExtractionLimits] = None,
+                retry_skipped: bool = False,
+                excluded_folders: T.Sequence[str] = ()
+                ) -> T.Tuple[List[models.Document], List[models.Highlight]]:
+    """ Run extraction of highlights.
+
+    :param: token: reMarkable cloud one time use token.
+    :param: working_directory: a directory to download highlights to and perform general file io in.
+    :param: extractors: A list of named highlight extractors. The names should match those
+                        in common.get_extractor_mappings(). They can be listed with the `list` subcommand
+    :param: collection_names: A list of the names of folder and documents that highlights should be extracted from.
+    :param: storage: an implementation of storage to persist highlight and document state.
+                     When it is an :class:`AsyncStorage` the app is run on an event loop and storage is closed after.
+    :param: on_result: Called with the documents and highlights before they are marked as delivered in storage.
+                       If it raises, the highlights are returned again by the next run.
+    :param: extraction_limits: Run extractors in worker processes held to these limits, see :func:`create_app`.
+    :param: retry_skipped: If documents skipped for exceeding the limits should be extracted again.
+    :param: excluded_folders: Names of folders left out with everything inside them, see :func:`create_app`.
+
+    :returns: A list of highlights and their associated documents.
+    """
+    app = create_app(logger, token, extractors, collection_names, storage,
+                     extraction_limits=extraction_limits, retry_skipped=retry_skipped,
+                     excluded_folders=excluded_folders)
+    if isinstance(app, app_.AsyncApp):
+        return asyncio.run(_run_async_app(app, working_directory, collection_names, on_result))
+    documents, highlights = app.run_app(working_directory, collection_names, acknowledge=on_result is None)
+    if on_result is not None:
+        on_result(documents, highlights)
+        app.acknowledge(highlights)
     return documents, highlights
+
+
+async def _run_async_app(app: app_.AsyncApp,
+                         working_directory: str,
+                         collection_names: T.List[str],
+                         on_result: T.Optional[T.Callable[[List[models.Document], List[models.Highlight]], None]]
+                         ) -> T.Tuple[List[models.Document], List[models.Highlight]]:
+    """ Coroutine version of the rest of :func:`run_extract` once the app is created. """
+    try:
+        documents, highlights = await app.run_app_async(working_directory, collection_names,
+                                                        acknowledge=on_result is None)
+        if on_result is not None:
+            on_result(documents, highlights)
+            await app.acknowledge_async(highlights)
+        return documents, highlights
+    finally:
+        await app.close_async()
+
+
+def watch_extract(logger: log.CommandLineLogger,
+                  token: str,
+                  working_directory: str,
+                  extractors: T.List[str],
+                  collection_names: T.List[str],
+                  storage: storage_.Storage,
+                  interval: float,
+                  on_result: T.Callable[[List[models.Document], List[models.Highlight]], None],
+                  after_iteration: T.Optional[T.Callable[[], None]] = None,
+                  extraction_limits: T.Optional[isolation.ExtractionLimits] = None,
+                  retry_skipped: bool = False,
+                  excluded_folders: T.Sequence[str] = ()
+                  ) -> None:
+    """ Run extraction of highlights every interval seconds until interrupted.
+
+    The cloud session, extractors, storage and the last seen cloud metadata are kept between runs,
+    so each run only processes documents whose ``ModifiedClient`` advanced.
+
+    Failed runs are rolled back and retried with an exponential backoff.
+
+    :param: interval: Seconds to wait between runs.
+    :param: on_result: Called with the documents and highlights of every run that found new highlights.
+    :param: after_iteration: Called after every run, whether it failed or not.
+
+    The remaining parameters are the same as :func:`run_extract`.
+    """
+    # storage is synchronous, so create_app returns an App.
+    app = T.cast(app_.App, create_app(logger, token, extractors, collection_names, storage, incremental=True,
+                                      extraction_limits=extraction_limits, retry_skipped=retry_skipped,
+                                      excluded_folders=excluded_folders))
+
+    def iteration() -> None:
+        documents, highlights = app.run_app(working_directory, collection_names, acknowledge=False)
+        if highlights:
+            on_result(documents, highlights)
+            app.acknowledge(highlights)
+
+    def on_error(exc: Exception) -> None:
+        storage.rollback()
+        try:
+            app.renew_auth()
+        except rmcloud_.RMCloudException:
+            logging.exception("Failed to renew auth after a failed sync")
+
+    watcher = watch.Watcher(iteration, interval, logger, on_error=on_error, after_iteration=after_iteration)
+    logger.echo(click.style("Watching", fg="green", bold=True) + f": every {interval} seconds", err=True)
+    watcher.run()
@@ -1,10 +1,64 @@
+import datetime
+import json
+import logging
 import sys
+import time
 import typing as T
 
 import click
 import halo
 
 
+LOG_FORMATS = ["text", "json"]
+""" The formats accepted by `--log-format`. """
+
+
+class JSONLogFormatter(logging.Formatter):
+    """ Formats log records as one JSON object per line, for log pipelines.
+
+        Every object has ``time``, ``level``, ``logger``, ``event`` and ``message`` keys.
+        Records emitted by :func:`remarking.events.emit` carry their event name and fields,
+        other records have the event ``log``.
+
+        .. code-block:: json
+
+            {"time": "2021-07-22T10:12:01.337+00:00", "level": "INFO", "logger": "remarking.events",
+             "event": "document_downloaded", "message": "document_downloaded document_id=1c1b bytes=52133 ms=210.4",
+             "document_id": "1c1b", "bytes": 52133, "ms": 210.4}
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        created = datetime.datetime.fromtimestamp(record.created, tz=datetime.timezone.utc)
+        entry = {
+            "time": created.isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": getattr(record, "event", "log"),
+            "message": record.getMessage(),
+        }
+        for key, value in getattr(record, "fields", {}).items():
+            entry.setdefault(key, value)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(verbose: int, log_format: str) -> None:
+    """ Set up logging for the `--verbose` and `--log-format` options.
+
+    Text logs are only shown with `--verbose`. JSON logs are always written to stderr, including the events of
+    :mod:`remarking.events`, and debug records are added with `--verbose`.
+    """
+    if log_format == "json":
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(JSONLogFormatter())
+        root = logging.getLogger()
+        root.handlers = [handler]
+        root.setLevel(logging.DEBUG if verbose > 0 else logging.INFO)
+    elif verbose > 0:
+        logging.basicConfig(format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s', level=logging.DEBUG)
+
+
 def isatty() -> bool:
     """ Indicates if stderr is a tty. """
     return sys.stderr.isatty()
@@ -111,6 +165,95 @@ class HaloWrapper:
                 self.__show_echo()
 
 
+def format_bytes(count: float) -> str:
+    """ Format a number of bytes with a binary unit, e.g. ``1.5 MiB``. """
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if count < 1024 or unit == "GiB":
+            return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+        count /= 1024
+    return f"{count:.1f} GiB"
+
+
+def format_duration(seconds: float) -> str:
+    """ Format a duration in seconds, e.g. ``1h02m``, ``3m05s`` or ``12s``. """
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class ProgressReporter():
+    """ Shows the progress of a stage on a spinner with its throughput and the estimated time left.
+
+    Updates are coalesced so the spinner text changes at most once every ``interval`` seconds,
+    however many items are processed. The rate is the same whether the spinner is shown or,
+    with spinners disabled, its text is echoed as a line, so large runs do not flood logs.
+
+    Example:
+        .. code-block:: python
+
+            progress = ProgressReporter(spinner, "Downloading documents", total=len(documents))
+            for doc in documents:
+                ...
+                progress.advance(bytes_=size, current=f'"{doc.name}"')
+            # Prints e.g. Downloading documents: 120/4000, 35.2/s, 4.1 MiB/s, ETA 1m50s - "A book"
+
+    :param spinner: The spinner showing the progress. It should already be started.
+    :param stage: What is being done, e.g. ``Downloading documents``.
+    :param total: The number of items in the stage, if known. Needed for the estimated time left.
+    :param interval: The least number of seconds between two updates of the spinner text.
+    :param clock: Returns the current time in seconds.
+    """
+
+    def __init__(self,
+                 spinner: HaloWrapper,
+                 stage: str,
+                 total: T.Optional[int] = None,
+                 interval: float = 1.0,
+                 clock: T.Callable[[], float] = time.monotonic) -> None:
+        self.spinner = spinner
+        self.stage = stage
+        self.total = total
+        self.interval = interval
+        self.items = 0
+        self.bytes = 0
+        self._clock = clock
+        self._started = clock()
+        self._last_update = self._started
+
+    def advance(self, items: int = 1, bytes_: int = 0, current: T.Optional[str] = None) -> None:
+        """ Record processed items and update the spinner text if ``interval`` seconds passed since the last update.
+
+        :param items: The number of items processed.
+        :param bytes_: The number of bytes processed with the items.
+        :param current: Describes the item being processed, e.g. a document name.
+        """
+        self.items += items
+        self.bytes += bytes_
+        now = self._clock()
+        if now - self._last_update < self.interval:
+            return
+        self._last_update = now
+        self.spinner.text = self.describe(now, current)
+
+    def describe(self, now: T.Optional[float] = None, current: T.Optional[str] = None) -> str:
+        """ Return the progress line shown on the spinner. """
+        elapsed = max((now if now is not None else self._clock()) - self._started, 1e-9)
+        rate = self.items / elapsed
+        parts = [f"{self.stage}: {self.items}" + (f"/{self.total}" if self.total is not None else ""),
+                 f"{rate:.1f}/s"]
+        if self.bytes:
+            parts.append(f"{format_bytes(self.bytes / elapsed)}/s")
+        if self.total is not None and rate > 0 and self.items < self.total:
+            parts.append(f"ETA {format_duration((self.total - self.items) / rate)}")
+        text = ", ".join(parts)
+        if current is not None:
+            text += f" - {current}"
+        return text
+
+
 class CommandLineLogger():
     """ A logger used throughout remarking.
 
@@ -123,19 +266,23 @@ class CommandLineLogger():
     :param quiet: If output should be supressed.
                   This will not supress output from calls to :meth:`CommandLineLogger.output_result`
     :param file_output: When set, this indicates that all logs should go to the given file handle.
+    :param prefix: When set, echoed text is prefixed with ``[prefix]``.
+                   Used to tell apart the output of several accounts synced at once.
 
     """
 
     def __init__(self,
                  spinners_enabled: bool = True,
                  quiet: bool = False,
-                 file_output: T.Optional[T.IO] = None):
+                 file_output: T.Optional[T.IO] = None,
+                 prefix: T.Optional[str] = None):
         if not isatty():
             self._spinners_enabled = False
         else:
             self._spinners_enabled = spinners_enabled
         self._file_output = file_output
         self._quiet = quiet
+        self._prefix = prefix
 
     def spinner(self, text: str, spinner: str, **kwargs: T.Any) -> HaloWrapper:
         """ Return a spinner to show the user that something is happening.
@@ -158,10 +305,22 @@ class CommandLineLogger():
         """
         if self._file_output is not None:
             self._file_output.write(text)
+            self._file_output.flush()
         else:
             sys.stdout.write(text)
             sys.stdout.flush()
 
+    def binary_output(self) -> T.BinaryIO:
+        """ Return the binary stream under the output, for results that are not text.
+
+        Like :meth:`output_result` this ignores the quiet flag.
+        It should be used by :class:`Writer` implementations writing binary formats, like parquet.
+        Text output written before is flushed first.
+        """
+        output = self._file_output if self._file_output is not None else sys.stdout
+        output.flush()
+        return output.buffer
+
     def echo(self, text: str, **kwargs: T.Any) -> None:
         """ Write text to given output.
 
@@ -181,4 +340,6 @@ class CommandLineLogger():
 
         """
         if not self._quiet and text != "":
+            if self._prefix is not None:
+                text = f"[{self._prefix}] {text}"
             click.echo(text, **kwargs)
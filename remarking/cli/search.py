@@ -0,0 +1,58 @@
+""" Search highlights saved by persist """
+import typing as T
+
+import click
+from click_help_colors import HelpColorsCommand
+
+from remarking.cli import common, log
+from remarking.cli.commands import table_writer_command
+from remarking.cli.writer_command_runner import add_options
+
+
+@click.command(
+    name="search",
+    cls=HelpColorsCommand,
+    **common.help_color_options()
+)
+@click.option("--sqlalchemy",
+              type=str,
+              required=True,
+              nargs=1,
+              default="sqlite:///remarking_database.sqlite3",
+              envvar="REMARKING_SQLALCHEMY",
+              show_envvar=True,
+              help="The sqlalchemy connection string of the database used by `remarking persist`. "
+              "This can also be a file whose contents are a connection string."
+              )
+@click.option("--limit",
+              "-n",
+              type=click.IntRange(min=1),
+              default=20,
+              show_default=True,
+              help="The maximum number of highlights to print."
+              )
+@add_options(table_writer_command.TableWriterCommand().options())
+@click.argument("query", nargs=-1, required=True)
+@click.pass_context
+def search(ctx: click.Context, sqlalchemy: str, limit: int, query: T.Tuple[str, ...], **kwargs: T.Any) -> None:
+    """ Search highlights saved by `remarking persist`.
+
+    Print the highlights whose text or document name contains every word of QUERY, best matches first.
+    The reMarkable cloud is not contacted.
+
+    When the database is SQLite, highlights are looked up in a full-text index kept up to date by
+    `remarking persist`, so words match regardless of case and inflection ("running" matches "run").
+
+    \b
+    Example:
+        remarking search --sqlalchemy sqlite:///database.sqlite3 looking glass
+    """
+    logger = log.CommandLineLogger(spinners_enabled=False, quiet=False)
+    storage = common.create_storage(common.read_connection_string(sqlalchemy))
+    ctx.call_on_close(storage.close)
+    highlights = storage.search_highlights(" ".join(query), limit=limit)
+    documents = storage.get_documents(list({highlight.document_id for highlight in highlights}))
+    if not highlights:
+        logger.echo(click.style("No matching highlights.", fg="yellow"), err=True)
+        ctx.exit(1)
+    table_writer_command.TableWriterCommand().writer(documents, highlights, **kwargs).write(logger)
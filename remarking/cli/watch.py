@@ -0,0 +1,105 @@
+""" Run a sync repeatedly, keeping state warm between iterations """
+import logging
+import signal
+import threading
+import typing as T
+
+import click
+
+from remarking.cli import log
+
+
+class Watcher():
+    """ Call an iteration function every interval seconds until stopped.
+
+    Failed iterations are retried with an exponential backoff, starting at interval
+    and doubling after each consecutive failure up to max_backoff.
+    A successful iteration resets the backoff.
+
+    :param iteration: The function to call on each iteration.
+    :param interval: Seconds to wait between the end of one iteration and the start of the next.
+    :param logger: Logger used to report failures and shutdown.
+    :param max_backoff: The largest number of seconds to wait after repeated failures.
+    :param on_error: Called with the exception when an iteration fails, before backing off.
+    :param after_iteration: Called after every iteration, whether it failed or not.
+    """
+
+    def __init__(self,
+                 iteration: T.Callable[[], None],
+                 interval: float,
+                 logger: log.CommandLineLogger,
+                 max_backoff: float = 900.0,
+                 on_error: T.Optional[T.Callable[[Exception], None]] = None,
+                 after_iteration: T.Optional[T.Callable[[], None]] = None) -> None:
+        self._iteration = iteration
+        self.interval = interval
+        self.max_backoff = max(max_backoff, interval)
+        self._logger = logger
+        self._on_error = on_error
+        self._after_iteration = after_iteration
+        self._stop_event = threading.Event()
+        self.consecutive_failures = 0
+
+    def next_delay(self) -> float:
+        """ Return the number of seconds to wait before the next iteration. """
+        if self.consecutive_failures == 0:
+            return self.interval
+        return min(self.interval * 2 ** self.consecutive_failures, self.max_backoff)
+
+    def stop(self) -> None:
+        """ Ask the watcher to exit once the current iteration completes. """
+        self._stop_event.set()
+
+    @property
+    def stopped(self) -> bool:
+        """ True once :meth:`stop` has been called. """
+        return self._stop_event.is_set()
+
+    def run(self) -> None:
+        """ Run iterations until :meth:`stop` is called.
+
+        SIGINT and SIGTERM stop the watcher gracefully when called from the main thread.
+        A second SIGINT interrupts the running iteration.
+        """
+        with _graceful_shutdown(self):
+            while not self.stopped:
+                try:
+                    self._iteration()
+                    self.consecutive_failures = 0
+                except Exception as exc:  # pylint: disable=broad-except
+                    self.consecutive_failures += 1
+                    logging.exception("Watch iteration failed")
+                    if self._on_error is not None:
+                        self._on_error(exc)
+                    self._logger.echo(
+                        click.style(f"Sync failed ({exc.__class__.__name__}: {exc}), "
+                                    f"retrying in {self.next_delay():.0f} seconds.", fg="red"),
+                        err=True
+                    )
+                if self._after_iteration is not None:
+                    self._after_iteration()
+                self._stop_event.wait(self.next_delay())
+        self._logger.echo("Stopped watching.", err=True)
+
+
+class _graceful_shutdown():  # pylint: disable=invalid-name
+    """ Context manager routing SIGINT and SIGTERM to :meth:`Watcher.stop` """
+
+    def __init__(self, watcher: Watcher) -> None:
+        self._watcher = watcher
+        self._previous_handlers: T.Dict[int, T.Any] = {}
+
+    def _handle(self, signum: int, frame: T.Any) -> None:
+        if self._watcher.stopped and signum == signal.SIGINT:
+            raise KeyboardInterrupt()
+        self._watcher.stop()
+
+    def __enter__(self) -> None:
+        if threading.current_thread() is not threading.main_thread():
+            return
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self._previous_handlers[signum] = signal.signal(signum, self._handle)
+
+    def __exit__(self, *args: T.Any) -> None:
+        for signum, handler in self._previous_handlers.items():
+            signal.signal(signum, handler)
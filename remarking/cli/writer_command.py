@@ -1,3 +1,4 @@
+import itertools
 import typing as T
 from abc import ABCMeta, abstractmethod
 from typing import Callable, List, TypeVar
@@ -57,3 +58,19 @@ class WriterCommand(metaclass=ABCMeta):
 
         :return: Return an instance of the writer implementation for your command.
         """
+
+    def stream_writer(self,
+                      documents: List[models.Document],
+                      highlight_batches: T.Iterable[List[models.Highlight]],
+                      **kwargs: T.Any) -> writer_.Writer:
+        """ Return a configured writer for highlights that arrive in batches, as when exporting from storage.
+
+        The writer must produce the same output as :meth:`writer` would for all the highlights at once.
+        By default all batches are collected and passed to :meth:`writer`. Override this method to write
+        each batch as it arrives instead.
+
+        :param documents: The documents the highlights belong to.
+        :param highlight_batches: The highlights, in batches. The iterable may only be consumed once.
+        :param kwargs: options specified in the :meth:`options` method are available here.
+        """
+        return self.writer(documents, list(itertools.chain.from_iterable(highlight_batches)), **kwargs)
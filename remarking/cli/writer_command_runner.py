@@ -1,13 +1,16 @@
 import functools
+import shlex
 import typing as T
-from typing import List, Type
+from typing import Callable, Dict, List, Tuple, Type
 
 import click
 from click_help_colors import HelpColorsCommand
 
-from remarking import models
+from remarking import metrics, models
 from remarking import rmcloud as rmcloud_
+from remarking.cli import accounts as accounts_
 from remarking.cli import common, extract, log, writer_command
+from remarking.storage import async_storage, caching_storage
 from remarking.storage import storage as storage_
 
 
@@ -60,13 +63,67 @@ def get_storage(ctx: click.Context, logger: log.CommandLineLogger) -> storage_.S
 def get_logger(ctx: click.Context, quiet: bool, output: T.Optional[T.IO] = None) -> log.CommandLineLogger:
     """ Construct the logger given a command context.
 
-    If quiet is set the logger does not print.
+    If quiet is set the logger does not print. With `--log-format json` only JSON logs are written to stderr,
+    so the logger does not print either.
     """
     verbose = ctx.obj['verbose']
+    quiet = quiet or ctx.obj.get('log_format') == "json"
     logger = log.CommandLineLogger(spinners_enabled=(verbose == 0), quiet=quiet, file_output=output)
     return logger
 
 
+def write_metrics(ctx: click.Context, logger: log.CommandLineLogger) -> None:
+    """ Write run metrics to the file passed with `--metrics-file`, if any.
+
+    Failing to write metrics is reported but does not fail the run.
+    """
+    metrics_file = ctx.obj.get("metrics_file")
+    if metrics_file is None:
+        return
+    try:
+        metrics.REGISTRY.write_textfile(metrics_file)
+    except OSError as exc:
+        logger.echo(click.style(f"Failed to write metrics to {metrics_file}: {exc}", fg="red"), err=True)
+
+
+SinkWriter = Callable[[List[models.Document], List[models.Highlight]], None]
+
+SINK_COMMANDS: Dict[str, Tuple[writer_command.WriterCommand, click.Command]] = {}
+""" The registered writer commands and the commands parsing their `--sink` options, by writer command name. """
+
+
+def parse_sinks(ctx: click.Context, sinks: T.Sequence[str], quiet: bool) -> List[SinkWriter]:
+    """ Parse the values of `--sink` into functions writing a result with the named writer command.
+
+    Each value is a writer command name followed by its options, e.g. ``csv --output highlights.csv``.
+    Files opened by sinks are closed with the context.
+    """
+    sink_writers = []
+    for sink in sinks:
+        args = shlex.split(sink)
+        if not args or args[0] not in SINK_COMMANDS:
+            ctx.fail(click.style(f"Unknown writer command in `--sink {sink}`, "
+                                 f"choose from: {', '.join(sorted(SINK_COMMANDS))}", fg="red"))
+        writer_command_instance, command = SINK_COMMANDS[args[0]]
+        try:
+            sink_ctx = command.make_context(args[0], args[1:], parent=ctx)
+        except click.UsageError as exc:
+            ctx.fail(click.style(f"Invalid `--sink {sink}`: {exc.format_message()}", fg="red"))
+        ctx.call_on_close(sink_ctx.close)
+        options = dict(sink_ctx.params)
+        sink_logger = log.CommandLineLogger(spinners_enabled=False, quiet=quiet, file_output=options.pop("output"))
+        sink_writers.append(functools.partial(_write_sink, writer_command_instance, sink_logger, options))
+    return sink_writers
+
+
+def _write_sink(writer_command_instance: writer_command.WriterCommand,
+                logger: log.CommandLineLogger,
+                options: T.Dict[str, T.Any],
+                documents: List[models.Document],
+                highlights: List[models.Highlight]) -> None:
+    writer_command_instance.writer(documents, highlights, **options).write(logger)
+
+
 # TODO: Need to write the correct annotations
 def highlight_output_command(short_help: str, help_: str, name: str) -> T.Any:
     """ Decorator for wrapping command line arguments for output commands."""
@@ -88,10 +145,56 @@ def highlight_output_command(short_help: str, help_: str, name: str) -> T.Any:
                     extractors: T.List[str],
                     collection_names: T.List[str],
                     output: T.Optional[T.IO],
+                    sinks: T.Tuple[str, ...],
                     quiet: bool,
+                    accounts: T.Optional[str],
+                    extractor_timeout: T.Optional[float],
+                    extractor_memory: T.Optional[int],
+                    extractor_workers: int,
+                    retry_skipped: bool,
+                    excluded_folders: T.Tuple[str, ...],
                     **kwargs: T.Any) -> None:
+            # pylint: disable=too-many-locals
             logger = get_logger(ctx, quiet, output)
+            extraction_limits = extract.create_extraction_limits(extractor_timeout, extractor_memory,
+                                                                 extractor_workers)
             storage = get_storage(ctx, logger)
+            sink_writers = parse_sinks(ctx, sinks, quiet)
+
+            def write_result(documents: List[models.Document],
+                             highlights: List[models.Highlight],
+                             result_logger: log.CommandLineLogger) -> None:
+                with common.shared_normalization():
+                    func(documents, highlights, result_logger, **kwargs)
+                    for write_sink in sink_writers:
+                        write_sink(documents, highlights)
+
+            if accounts is not None:
+                if sink_writers:
+                    ctx.fail(click.style("`--sink` cannot be used with `--accounts`", fg="red"))
+                if ctx.obj.get("watch"):
+                    ctx.fail(click.style("`--accounts` cannot be used with `--watch`", fg="red"))
+                if isinstance(storage, async_storage.AsyncStorage):
+                    ctx.fail(click.style("`--accounts` cannot be used with `--asyncio`", fg="red"))
+                if ctx.obj.get("log_storage"):
+                    ctx.fail(click.style("`--accounts` cannot be used with log storage", fg="red"))
+                try:
+                    failed = accounts_.run_accounts(
+                        logger, accounts_.load_manifest(accounts), working_directory, extractors, storage,
+                        on_result=lambda documents, highlights, account_logger: func(
+                            documents, highlights, account_logger, **kwargs
+                        ),
+                        quiet=quiet,
+                        extraction_limits=extraction_limits,
+                        retry_skipped=retry_skipped,
+                        excluded_folders=excluded_folders
+                    )
+                finally:
+                    write_metrics(ctx, logger)
+                if failed:
+                    ctx.exit(1)
+                return
+
             try:
                 rmcloud_.RMCloud("fake_token_for_checking_auth")
             except rmcloud_.AuthError:
@@ -107,10 +210,30 @@ def highlight_output_command(short_help: str, help_: str, name: str) -> T.Any:
                     )
                     token = get_token(ctx)
 
-            documents, highlights = extract.run_extract(
-                logger, token, working_directory, extractors, collection_names, storage)
+            if ctx.obj.get("watch"):
+                # Only this process writes to storage while watching, so lookups can be served from memory.
+                extract.watch_extract(
+                    logger, token, working_directory, extractors, collection_names,
+                    caching_storage.CachingStorage(storage),
+                    interval=ctx.obj["interval"],
+                    on_result=lambda documents, highlights: write_result(documents, highlights, logger),
+                    after_iteration=lambda: write_metrics(ctx, logger),
+                    extraction_limits=extraction_limits,
+                    retry_skipped=retry_skipped,
+                    excluded_folders=excluded_folders
+                )
+                return
 
-            func(documents, highlights, logger, **kwargs)
+            try:
+                extract.run_extract(
+                    logger, token, working_directory, extractors, collection_names, storage,
+                    on_result=lambda documents, highlights: write_result(documents, highlights, logger),
+                    extraction_limits=extraction_limits,
+                    retry_skipped=retry_skipped,
+                    excluded_folders=excluded_folders
+                )
+            finally:
+                write_metrics(ctx, logger)
 
         # This is a bit of a hack, but let's use put highlight output command
         # at any position as a decorator.
@@ -160,3 +283,15 @@ class WriterCommandRegistrationHandler():
 
         for command_group in self._command_groups:
             command_group.add_command(caller, writer_command_instance.name())
+
+        @click.command(name=writer_command_instance.name(), add_help_option=False)
+        @click.option("--output",
+                      "-o",
+                      type=click.File('w', lazy=True),
+                      default=None,
+                      help="Output highlights to the given file")
+        @add_options(options)
+        def sink(**kwargs: T.Any) -> None:
+            """ Only parses `--sink` options, see `parse_sinks`. """
+
+        SINK_COMMANDS[writer_command_instance.name()] = (writer_command_instance, sink)
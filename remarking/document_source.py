@@ -0,0 +1,221 @@
+""" Sources that expose the files of downloaded reMarkable documents to extractors """
+import contextlib
+import io
+import mmap
+import os
+import posixpath
+import typing as T
+import zipfile
+from abc import ABCMeta, abstractmethod
+from typing import Dict, List, Union
+
+
+class DocumentSource(metaclass=ABCMeta):
+    """ Read-only view over the files of one or more reMarkable documents.
+
+        Paths are relative, ``/`` separated and follow the layout of the reMarkable
+        `user data directory <https://remarkablewiki.com/tech/filesystem#user_data_directory_structure>`_,
+        for example ``<doc_id>.content`` or ``<doc_id>.highlights/<page_id>.json``.
+    """
+
+    @abstractmethod
+    def exists(self, path: str) -> bool:
+        """ Return True if path is a file or directory within the source. """
+
+    @abstractmethod
+    def listdir(self, path: str) -> List[str]:
+        """ Return the names of the entries directly contained in the directory at path. """
+
+    @abstractmethod
+    def read_bytes(self, path: str) -> bytes:
+        """ Return the contents of the file at path. """
+
+    def open(self, path: str, mode: str = "r") -> T.IO[T.Any]:
+        """ Open the file at path for reading. ``mode`` is either ``"r"`` or ``"rb"``. """
+        if mode not in ("r", "rb"):
+            raise ValueError(f"Unsupported mode '{mode}', sources are read-only")
+        data = io.BytesIO(self.read_bytes(path))
+        if mode == "rb":
+            return data
+        return io.TextIOWrapper(data, encoding="utf-8")
+
+    @contextlib.contextmanager
+    def map_bytes(self, path: str) -> T.Iterator[memoryview]:
+        """ Yield the contents of the file at path as a read-only :class:`memoryview`.
+
+        Sources that can map files into memory do so, letting binary parsers read them without copying.
+        The view is released when the block exits.
+        """
+        view = memoryview(self.read_bytes(path))
+        try:
+            yield view
+        finally:
+            view.release()
+
+
+class DirectoryDocumentSource(DocumentSource):
+    """ Source for documents that have been unpacked into a directory on disk.
+
+    :param root: The directory documents were unpacked into.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def _full_path(self, path: str) -> str:
+        return os.path.join(self.root, *path.split("/"))
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(self._full_path(path))
+
+    def listdir(self, path: str) -> List[str]:
+        return os.listdir(self._full_path(path))
+
+    def read_bytes(self, path: str) -> bytes:
+        with open(self._full_path(path), "rb") as file_p:
+            return file_p.read()
+
+    def open(self, path: str, mode: str = "r") -> T.IO[T.Any]:
+        if mode not in ("r", "rb"):
+            raise ValueError(f"Unsupported mode '{mode}', sources are read-only")
+        return open(self._full_path(path), mode)  # pylint: disable=consider-using-with
+
+    @contextlib.contextmanager
+    def map_bytes(self, path: str) -> T.Iterator[memoryview]:
+        with open(self._full_path(path), "rb") as file_p:
+            if os.fstat(file_p.fileno()).st_size == 0:
+                # Empty files cannot be mapped.
+                yield memoryview(b"")
+                return
+            with mmap.mmap(file_p.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    yield view
+                finally:
+                    view.release()
+
+
+class ZipDocumentSource(DocumentSource):
+    """ Source that reads entries straight out of a document zip archive without unpacking it.
+
+    :param archive: A path to the archive, a binary file object or the raw bytes of the archive.
+    """
+
+    def __init__(self, archive: Union[str, bytes, T.BinaryIO]) -> None:
+        if isinstance(archive, bytes):
+            archive = io.BytesIO(archive)
+        self._archive = archive
+        self._zip_file: T.Optional[zipfile.ZipFile] = None
+        self._names: T.Optional[T.Set[str]] = None
+        self._directories: T.Optional[Dict[str, List[str]]] = None
+
+    def _zip(self) -> zipfile.ZipFile:
+        """ Open the archive on first use so that sources are cheap to create. """
+        if self._zip_file is None:
+            self._zip_file = zipfile.ZipFile(self._archive, "r")  # pylint: disable=consider-using-with
+        return self._zip_file
+
+    def _index(self) -> T.Tuple[T.Set[str], Dict[str, List[str]]]:
+        """ Build the set of file names and a mapping of directory to children from the archive listing. """
+        if self._names is None or self._directories is None:
+            names = set()
+            directories: Dict[str, List[str]] = {}
+            for name in self._zip().namelist():
+                name = name.rstrip("/")
+                names.add(name)
+                parent, child = posixpath.split(name)
+                while parent:
+                    children = directories.setdefault(parent, [])
+                    if child not in children:
+                        children.append(child)
+                    parent, child = posixpath.split(parent)
+            self._names = names
+            self._directories = directories
+        return self._names, self._directories
+
+    def exists(self, path: str) -> bool:
+        names, directories = self._index()
+        return path in names or path in directories
+
+    def listdir(self, path: str) -> List[str]:
+        _, directories = self._index()
+        if path not in directories:
+            raise FileNotFoundError(f"No directory '{path}' in archive")
+        return list(directories[path])
+
+    def read_bytes(self, path: str) -> bytes:
+        try:
+            return self._zip().read(path)
+        except KeyError as exc:
+            raise FileNotFoundError(f"No file '{path}' in archive") from exc
+
+    def close(self) -> None:
+        """ Close the underlying archive. """
+        if self._zip_file is not None:
+            self._zip_file.close()
+            self._zip_file = None
+
+    def __getstate__(self) -> Dict[str, T.Any]:
+        # Open zip files cannot be pickled, they are re-opened lazily instead.
+        state = self.__dict__.copy()
+        state["_zip_file"] = None
+        return state
+
+
+class CompositeDocumentSource(DocumentSource):
+    """ Source that routes paths to a per-document source based on the document id the path starts with.
+
+        This lets a set of individually downloaded archives be presented to extractors as if they
+        had all been unpacked into the same directory.
+
+    :param sources: A mapping of document id to the source containing that document's files.
+    """
+
+    def __init__(self, sources: T.Optional[Dict[str, DocumentSource]] = None) -> None:
+        self._sources: Dict[str, DocumentSource] = dict(sources or {})
+
+    def add(self, doc_id: str, source: DocumentSource) -> None:
+        """ Add or replace the source for doc_id """
+        self._sources[doc_id] = source
+
+    def _route(self, path: str) -> T.Optional[DocumentSource]:
+        first_segment = path.split("/", 1)[0]
+        return self._sources.get(first_segment.split(".", 1)[0])
+
+    def exists(self, path: str) -> bool:
+        source = self._route(path)
+        return source is not None and source.exists(path)
+
+    def listdir(self, path: str) -> List[str]:
+        source = self._route(path)
+        if source is None:
+            raise FileNotFoundError(f"No source for '{path}'")
+        return source.listdir(path)
+
+    def read_bytes(self, path: str) -> bytes:
+        source = self._route(path)
+        if source is None:
+            raise FileNotFoundError(f"No source for '{path}'")
+        return source.read_bytes(path)
+
+    def open(self, path: str, mode: str = "r") -> T.IO[T.Any]:
+        source = self._route(path)
+        if source is None:
+            raise FileNotFoundError(f"No source for '{path}'")
+        return source.open(path, mode)
+
+    def map_bytes(self, path: str) -> T.ContextManager[memoryview]:
+        source = self._route(path)
+        if source is None:
+            raise FileNotFoundError(f"No source for '{path}'")
+        return source.map_bytes(path)
+
+
+def as_document_source(working_path: Union[str, DocumentSource]) -> DocumentSource:
+    """ Return working_path as a :class:`DocumentSource`.
+
+    Paths on disk are wrapped in a :class:`DirectoryDocumentSource`, sources are returned as is.
+    """
+    if isinstance(working_path, DocumentSource):
+        return working_path
+    return DirectoryDocumentSource(working_path)
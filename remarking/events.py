@@ -0,0 +1,59 @@
+""" Structured events describing the stages of a run and each document processed """
+import contextlib
+import logging
+import time
+import typing as T
+from typing import Dict
+
+from remarking import metrics
+
+LOGGER = logging.getLogger("remarking.events")
+""" The logger events are emitted on, at the ``INFO`` level. """
+
+
+def enabled() -> bool:
+    """ Return if emitted events are handled, so callers can skip measuring what would not be reported. """
+    return LOGGER.isEnabledFor(logging.INFO)
+
+
+def emit(event: str, **fields: T.Any) -> None:
+    """ Emit an event with the given fields.
+
+    The record's message reads ``<event> key=value ...``. The event name and fields are also attached to the
+    record as its ``event`` and ``fields`` attributes, see :class:`remarking.cli.log.JSONLogFormatter`.
+
+    :param event: The name of the event, e.g. ``document_downloaded``.
+    :param fields: Values describing the event. They should be JSON serializable.
+    """
+    if not enabled():
+        return
+    message = " ".join([event] + [f"{key}={value}" for key, value in fields.items()])
+    LOGGER.info(message, extra={"event": event, "fields": fields})
+
+
+def elapsed_ms(start: float) -> float:
+    """ Return the milliseconds since start, a value of :func:`time.perf_counter`. """
+    return round((time.perf_counter() - start) * 1000, 3)
+
+
+@contextlib.contextmanager
+def stage(name: str, **fields: T.Any) -> T.Iterator[Dict[str, T.Any]]:
+    """ Time a stage of a run.
+
+    Emits ``stage_started`` and then ``stage_finished``, or ``stage_failed`` if the block raised, with the
+    milliseconds spent as ``ms``. The seconds are also added to :data:`remarking.metrics.STAGE_DURATION`.
+    Fields added to the yielded dict are included in the finishing event.
+
+    :param name: The name of the stage, e.g. ``download``.
+    :param fields: Fields included in every event of the stage.
+    """
+    emit("stage_started", stage=name, **fields)
+    result: Dict[str, T.Any] = {}
+    start = time.perf_counter()
+    try:
+        with metrics.STAGE_DURATION.time(stage=name):
+            yield result
+    except BaseException:
+        emit("stage_failed", stage=name, ms=elapsed_ms(start), **fields, **result)
+        raise
+    emit("stage_finished", stage=name, ms=elapsed_ms(start), **fields, **result)
@@ -1,7 +1,9 @@
+import typing as T
 from abc import ABCMeta, abstractmethod
 from dataclasses import dataclass
-from typing import List
+from typing import Dict, List
 
+from remarking import document_source as document_source_
 from remarking import models
 
 
@@ -40,11 +42,16 @@ class HighlightExtractor(metaclass=ABCMeta):  # pylint: disable=too-few-public-m
         """
 
     @abstractmethod
-    def get_highlights(self, working_path: str, document: models.Document) -> List[models.Highlight]:
+    def get_highlights(self,
+                       working_path: T.Union[str, document_source_.DocumentSource],
+                       document: models.Document) -> List[models.Highlight]:
         """ Retrieve all highlights for document.
 
-        :param working_path: The path on the operating system where all documents were downloaded. Documents
-            are downloaded from the cloud and unzipped into this repository. For more information on the layout
+        :param working_path: A :class:`remarking.document_source.DocumentSource` exposing the files of all
+            downloaded documents. remarking reads documents straight out of their downloaded archives, so
+            nothing is unpacked on disk. A path to a directory containing unpacked documents may also be passed,
+            :func:`remarking.document_source.as_document_source` turns either into a source.
+            For more information on the layout
             check out `<https://remarkablewiki.com/tech/filesystem#user_data_directory_structure>`_.
 
         :param document: The document to extract highlights for.
@@ -52,6 +59,28 @@ class HighlightExtractor(metaclass=ABCMeta):  # pylint: disable=too-few-public-m
         :return: A list of highlights for the document.
         """
 
+    def get_highlights_batch(self,
+                             working_path: T.Union[str, document_source_.DocumentSource],
+                             documents: List[models.Document]) -> Dict[str, List[models.Highlight]]:
+        """ Retrieve all highlights for several documents at once.
+
+        remarking calls this instead of :meth:`get_highlights` when an extractor overrides it, passing every
+        document downloaded in a batch. Extractors that load a model, compile patterns or index files can do so
+        once per batch, or process the documents together. By default :meth:`get_highlights` is called for each
+        document.
+
+        :param working_path: The documents source, see :meth:`get_highlights`.
+        :param documents: The documents to extract highlights for.
+
+        :return: A mapping of document id to the highlights of the document.
+        """
+        return {document.id: self.get_highlights(working_path, document) for document in documents}
+
+
+def implements_batch(extractor: HighlightExtractor) -> bool:
+    """ Return if extractor overrides :meth:`HighlightExtractor.get_highlights_batch`. """
+    return type(extractor).get_highlights_batch is not HighlightExtractor.get_highlights_batch
+
 
 def clean_highlight_text(text: str) -> str:
     """ Return a cleaned version of the passed text. """
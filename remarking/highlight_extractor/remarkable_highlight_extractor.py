@@ -1,31 +1,62 @@
 import functools
 import json
 import logging
-import os
 import typing as T
-from dataclasses import dataclass
-from typing import Dict, List
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
 
+from remarking import document_source as document_source_
 from remarking import models
 from remarking.highlight_extractor import highlight_extractor
 
 
+MERGE_STRATEGIES = ["offsets", "spatial"]
+""" The ways highlight fragments can be joined, see :class:`RemarkableHighlightExtractor`. """
+
+
+@dataclass
+class Rect:
+    """ A rectangle of the page covered by a highlight """
+    x: float
+    y: float
+    width: float
+    height: float
+
+    @property
+    def right(self) -> float:
+        """ The horizontal end of the rectangle. """
+        return self.x + self.width
+
+    @property
+    def bottom(self) -> float:
+        """ The vertical end of the rectangle. """
+        return self.y + self.height
+
+
 @dataclass
 class RawHighlight:
     """ Represent remarkable raw highlight entry"""
     start: int
     length: int
     text: str
+    rects: List[Rect] = field(default_factory=list)
 
 
-def get_page_number_mapping(working_path: str, doc_id: str) -> T.Optional[Dict[str, int]]:
+def get_page_number_mapping(working_path: T.Union[str, document_source_.DocumentSource],
+                            doc_id: str) -> T.Optional[Dict[str, int]]:
     """ Return a mapping of page id to page number or None if .content metadata file could not be found """
-    contents_path = os.path.join(working_path, f"{doc_id}.content")
-    if not os.path.exists(contents_path):
+    source = document_source_.as_document_source(working_path)
+    contents_path = f"{doc_id}.content"
+    if not source.exists(contents_path):
         logging.info(f"Could not find a contents file at {contents_path}")
         return None
-    with open(contents_path, "r") as contents_file:
-        page_ids = json.load(contents_file)["pages"]
+    with source.open(contents_path, "r") as contents_file:
+        contents = json.load(contents_file)
+    if "pages" in contents:
+        page_ids = contents["pages"]
+    else:
+        # Documents written by firmware 3 and later list their pages under cPages instead.
+        page_ids = [page["id"] for page in contents.get("cPages", {}).get("pages", [])]
     return {page_id: ind for ind, page_id in enumerate(page_ids)}
 
 
@@ -34,26 +65,31 @@ def create_raw_highlight(raw_highlight_data: Dict[str, T.Any]) -> RawHighlight:
     return RawHighlight(
         start=raw_highlight_data['start'],
         length=raw_highlight_data['length'],
-        text=raw_highlight_data['text']
+        text=raw_highlight_data['text'],
+        rects=[
+            Rect(x=rect['x'], y=rect['y'], width=rect['width'], height=rect['height'])
+            for rect in raw_highlight_data.get('rects', [])
+        ]
     )
 
 
-def get_raw_highlights_by_page(working_path: str,
+def get_raw_highlights_by_page(working_path: T.Union[str, document_source_.DocumentSource],
                                doc_id: str) -> T.Optional[Dict[str, List[RawHighlight]]]:
     """ Return raw highlights by page id for a given working_path that contains the passed document id. """
     raw_highlights: T.Dict[str, List[RawHighlight]] = {}
+    source = document_source_.as_document_source(working_path)
 
-    highlights_path = os.path.join(working_path, f"{doc_id}.highlights")
+    highlights_path = f"{doc_id}.highlights"
 
-    if not os.path.exists(highlights_path):
+    if not source.exists(highlights_path):
         logging.info(f"Could not find a highlights folder at {highlights_path}")
         return None
 
-    highlights_files = os.listdir(highlights_path)
+    highlights_files = source.listdir(highlights_path)
     for highlight_file in highlights_files:
         page_id = highlight_file.replace(".json", "")
-        page_highlight_path = os.path.join(highlights_path, highlight_file)
-        with open(page_highlight_path, "r") as highlights_file:
+        page_highlight_path = f"{highlights_path}/{highlight_file}"
+        with source.open(page_highlight_path, "r") as highlights_file:
             highlights_by_layer: List[List[Dict[str, T.Any]]] = json.load(highlights_file)['highlights']
         raw_highlights_json: List[Dict[str, T.Any]] = functools.reduce(
             lambda l, r: l + r, highlights_by_layer, [])
@@ -66,8 +102,171 @@ def get_raw_highlights_by_page(working_path: str,
     return raw_highlights
 
 
+def join_highlight_text(text: str, diff: int, next_text: str) -> str:
+    """ Append the text of the next fragment to the text joined so far.
+
+    :param text: The text joined so far.
+    :param diff: The number of characters between the end of the previous fragment and the start of the next one.
+                 Negative if the fragments overlap, in which case the overlapping characters are only kept once.
+    :param next_text: The text of the next fragment.
+    """
+    if diff < 0:
+        return (
+            text[:diff] +
+            next_text +
+            (text[len(text) + diff + len(next_text):] if abs(diff) > len(next_text) else "")
+        )
+    return text + " " + next_text
+
+
+@dataclass
+class PageLayout:
+    """ The extent of the highlighted rects of a page, taken as an estimate of its text block. """
+    line_height: float
+    left: float
+    top: float
+    right: float
+    bottom: float
+
+    @classmethod
+    def from_fragments(cls, fragments: List[RawHighlight]) -> T.Optional['PageLayout']:
+        """ Return the layout of the rects of fragments, or None if they have no rects. """
+        rects = [rect for fragment in fragments for rect in fragment.rects]
+        if not rects:
+            return None
+        heights = sorted(rect.height for rect in rects)
+        return cls(
+            line_height=heights[len(heights) // 2] or 1.0,
+            left=min(rect.x for rect in rects),
+            top=min(rect.y for rect in rects),
+            right=max(rect.right for rect in rects),
+            bottom=max(rect.bottom for rect in rects),
+        )
+
+    def spans_lines(self) -> bool:
+        """ Return if the rects span more than one line, below that their extent says nothing of the margins. """
+        return self.bottom - self.top > 2 * self.line_height
+
+    def ends_page(self, rect: Rect) -> bool:
+        """ Return if rect ends at the bottom right of the text block. """
+        return rect.bottom >= self.bottom - self.line_height and rect.right >= self.right - self.line_height
+
+    def starts_page(self, rect: Rect) -> bool:
+        """ Return if rect starts at the top left of the text block. """
+        return rect.y <= self.top + self.line_height and rect.x <= self.left + self.line_height
+
+
+class _Grid:
+    """ Spatial index of fragments by the top left corner of their first rect, in square cells one line high. """
+
+    def __init__(self, fragments: List[RawHighlight], cell_size: float) -> None:
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        for index, fragment in enumerate(fragments):
+            if fragment.rects:
+                first = fragment.rects[0]
+                self.cells.setdefault(self._cell(first.x, first.y), []).append(index)
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return int(y // self.cell_size), int(x // self.cell_size)
+
+    def query(self, left: float, top: float, right: float, bottom: float) -> T.Iterator[int]:
+        """ Yield the fragments whose first rect starts in the cells overlapping the area. """
+        top_row, left_column = self._cell(left, top)
+        bottom_row, right_column = self._cell(right, bottom)
+        for row in range(top_row, bottom_row + 1):
+            for column in range(left_column, right_column + 1):
+                yield from self.cells.get((row, column), [])
+
+
+def _continues(layout: PageLayout, previous: Rect, first: Rect) -> bool:
+    """ Return if a fragment starting with first visually continues a fragment ending with previous.
+
+        It does if it starts on the same line, no more than a line height after the end of previous,
+        on the following line after previous reached the right of the text block, or at the top of
+        a column to the right after previous reached the bottom of the text block.
+    """
+    line_height = layout.line_height
+    if abs(first.y - previous.y) < line_height / 2:
+        return previous.x <= first.x <= previous.right + line_height
+    if line_height / 2 <= first.y - previous.y <= 1.5 * line_height:
+        return previous.right >= layout.right - line_height and first.x <= layout.left + line_height
+    return (previous.bottom >= layout.bottom - line_height and
+            first.y <= layout.top + line_height and
+            first.x >= previous.right - line_height)
+
+
+def group_spatially(fragments: List[RawHighlight]) -> List[List[RawHighlight]]:
+    """ Group the fragments of a page that continue each other, see :func:`_continues`.
+
+    Fragments overlapping in characters, or only a space apart, are always grouped. Candidates that visually continue a
+    fragment are looked up in a grid of line high cells around where the fragment ends, so grouping a page
+    takes ``O(n log n)``. Groups and the fragments within them are returned in reading order.
+    """
+    fragments = sorted(fragments, key=lambda fragment: fragment.start)
+    parents = list(range(len(fragments)))
+
+    def find(index: int) -> int:
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    def union(first: int, second: int) -> None:
+        parents[find(second)] = find(first)
+
+    for index in range(1, len(fragments)):
+        previous = fragments[index - 1]
+        if fragments[index].start <= previous.start + previous.length + 1:
+            union(index - 1, index)
+
+    layout = PageLayout.from_fragments(fragments)
+    if layout is not None:
+        line_height = layout.line_height
+        grid = _Grid(fragments, line_height)
+        for index, fragment in enumerate(fragments):
+            if not fragment.rects:
+                continue
+            last = fragment.rects[-1]
+            areas = [(last.x, last.y - line_height, last.right + line_height, last.y + line_height)]
+            if last.right >= layout.right - line_height:
+                areas.append((layout.left, last.y, layout.left + line_height, last.y + 1.5 * line_height))
+            if last.bottom >= layout.bottom - line_height:
+                areas.append((last.right - line_height, layout.top, layout.right, layout.top + line_height))
+            for area in areas:
+                for candidate in grid.query(*area):
+                    if candidate != index and _continues(layout, last, fragments[candidate].rects[0]):
+                        union(index, candidate)
+
+    groups: Dict[int, List[RawHighlight]] = {}
+    for index, fragment in enumerate(fragments):
+        groups.setdefault(find(index), []).append(fragment)
+    return list(groups.values())
+
+
+def join_group_text(group: List[RawHighlight]) -> str:
+    """ Return the text of a group of fragments, in reading order. """
+    text = group[0].text
+    end = group[0].start + group[0].length
+    for fragment in group[1:]:
+        text = join_highlight_text(text, fragment.start - end, fragment.text)
+        end = max(end, fragment.start + fragment.length)
+    return text
+
+
 class RemarkableHighlightExtractor(highlight_extractor.HighlightExtractor):
-    """ Extracts highlights from the ``highlights`` folder of reMarkable documents. """
+    """ Extracts highlights from the ``highlights`` folder of reMarkable documents.
+
+        :param merge: How fragments of a highlight are joined, one of :data:`MERGE_STRATEGIES`.
+                      ``offsets`` joins fragments less than 4 characters apart.
+                      ``spatial`` joins fragments whose rects continue each other on the page,
+                      across lines, columns and pages, see :func:`group_spatially`.
+    """
+
+    def __init__(self, merge: str = "offsets") -> None:
+        if merge not in MERGE_STRATEGIES:
+            raise ValueError(f"Unknown merge strategy '{merge}', expected one of {MERGE_STRATEGIES}")
+        self.merge = merge
 
     @classmethod
     def get_extractor_instance_data(cls) -> List[highlight_extractor.ExtractorData]:
@@ -75,27 +274,37 @@ class RemarkableHighlightExtractor(highlight_extractor.HighlightExtractor):
             highlight_extractor.ExtractorData(
                 extractor_name="remarkable",
                 instance=cls(),
-                description=cls.__doc__
+                description="Extracts highlights from the ``highlights`` folder of reMarkable documents."
+            ),
+            highlight_extractor.ExtractorData(
+                extractor_name="remarkable_spatial",
+                instance=cls(merge="spatial"),
+                description="Extracts highlights from the ``highlights`` folder of reMarkable documents, "
+                "joining fragments that continue each other on the page, including across pages."
             )
         ]
 
-    def get_highlights(self, working_path: str, document: models.Document) -> List[models.Highlight]:
+    def get_highlights(self,
+                       working_path: T.Union[str, document_source_.DocumentSource],
+                       document: models.Document) -> List[models.Highlight]:
         logging.info("Getting highlights from remarkable")
         extracted_highlight = []
 
-        page_id_to_page_num = get_page_number_mapping(working_path, document.id)
+        source = document_source_.as_document_source(working_path)
+        page_id_to_page_num = get_page_number_mapping(source, document.id)
         if page_id_to_page_num is None:
             logging.info(f"Failed to get page_id_to_page_num mapping for {document.id}")
             return []
 
-        raw_highlights_by_page = get_raw_highlights_by_page(working_path, document.id)
+        raw_highlights_by_page = get_raw_highlights_by_page(source, document.id)
 
         if raw_highlights_by_page is None:
             logging.info(f"Failed to get raw highlights for {document.id}")
             return []
 
+        from_raw_highlights = self._from_spatial_groups if self.merge == "spatial" else self._from_raw_highlights
         extracted_highlight.extend(
-            self._from_raw_highlights(
+            from_raw_highlights(
                 document.id, page_id_to_page_num, raw_highlights_by_page
             )
         )
@@ -135,18 +344,9 @@ class RemarkableHighlightExtractor(highlight_extractor.HighlightExtractor):
                     )
                     highlight_text = page_raw_highlights[i].text
                     highlight_page = page_id_to_page_num[page_id]
-                elif diff < 0:
-                    # highlights overlap
-                    highlight_text = (
-                        highlight_text[:diff] +
-                        cur_highlight.text +
-                        (highlight_text[len(highlight_text) + diff + len(cur_highlight.text):]
-                         if abs(diff) > len(cur_highlight.text) else ""
-                        )
-                    )
-                else:  # diff == 0
-                    # Highlights start and end at the same spot
-                    highlight_text += " " + cur_highlight.text
+                else:
+                    # highlights overlap, or start and end at the same spot
+                    highlight_text = join_highlight_text(highlight_text, diff, cur_highlight.text)
 
             highlight_recs.append(
                 models.Highlight.create_highlight(
@@ -157,3 +357,40 @@ class RemarkableHighlightExtractor(highlight_extractor.HighlightExtractor):
                 )
             )
         return highlight_recs
+
+    def _from_spatial_groups(self,
+                             doc_id: str,
+                             page_id_to_page_num: Dict[str, int],
+                             raw_highlights_by_page: Dict[str, List[RawHighlight]]) -> List[models.Highlight]:
+        """ Create Highlights from the groups of :func:`group_spatially`.
+
+        The last group of a page is joined with the first group of the next page if it ends at the bottom right
+        of its page and the next one starts at the top left of its page.
+        """
+        pages = sorted(
+            (page_id_to_page_num[page_id], fragments)
+            for page_id, fragments in raw_highlights_by_page.items() if fragments
+        )
+        joined: List[Tuple[int, str]] = []
+        previous_page: T.Optional[Tuple[int, PageLayout, RawHighlight]] = None
+        for page_number, fragments in pages:
+            groups = group_spatially(fragments)
+            layout = PageLayout.from_fragments(fragments)
+            texts = [join_group_text(group) for group in groups]
+            first = groups[0][0]
+            if (previous_page is not None and layout is not None and first.rects and
+                    previous_page[0] == page_number - 1 and
+                    previous_page[1].spans_lines() and layout.spans_lines() and
+                    previous_page[1].ends_page(previous_page[2].rects[-1]) and layout.starts_page(first.rects[0])):
+                joined[-1] = (joined[-1][0], joined[-1][1] + " " + texts.pop(0))
+            joined.extend((page_number, text) for text in texts)
+
+            last = max(groups[-1], key=lambda fragment: fragment.start + fragment.length)
+            previous_page = (page_number, layout, last) if layout is not None and last.rects else None
+
+        return [
+            models.Highlight.create_highlight(
+                doc_id, highlight_extractor.clean_highlight_text(text), page_number, self.__class__.__name__
+            )
+            for page_number, text in joined
+        ]
@@ -0,0 +1,257 @@
+import functools
+import logging
+import struct
+import typing as T
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from remarking import document_source as document_source_
+from remarking import models
+from remarking.highlight_extractor import highlight_extractor
+from remarking.highlight_extractor import remarkable_highlight_extractor
+
+HEADER_PREFIX = b"reMarkable .lines file, version="
+""" The start of the header of every ``.rm`` file, followed by the version and padded with spaces. """
+HEADER_LENGTH = 43
+HIGHLIGHTER_TOOLS = frozenset([5, 18])
+""" The pen ids of the highlighter tool, for the original and the second generation highlighter. """
+
+_INT = struct.Struct("<i")
+_LINE_V3 = struct.Struct("<iiifi")
+_LINE_V5 = struct.Struct("<iiiffi")
+_BLOCK_HEADER = struct.Struct("<IBBBB")
+_UINT = struct.Struct("<I")
+_POINT_SIZE_V5 = 24
+_POINT_SIZE_V6 = 14
+_POINT_SIZE_V6_LEGACY = 24
+
+_LINE_BLOCK = 0x05
+_LINE_ITEM = 0x03
+_TAG_BYTE1 = 0x1
+_TAG_BYTE4 = 0x4
+_TAG_BYTE8 = 0x8
+_TAG_LENGTH4 = 0xC
+_TAG_ID = 0xF
+
+
+class RmFormatException(ValueError):
+    """ Raised when a ``.rm`` file cannot be parsed """
+
+
+@dataclass
+class Stroke:
+    """ The bounding box of a stroke, in the coordinates of the ``.rm`` file.
+
+        Version 6 files place the horizontal origin in the middle of the page.
+    """
+    tool: int
+    color: int
+    x: float
+    y: float
+    width: float
+    height: float
+
+
+@functools.lru_cache(maxsize=1024)
+def _coordinates_struct(count: int, point_size: int) -> struct.Struct:
+    """ Return a struct unpacking the x and y coordinates of count points in one call.
+
+        Points start with their coordinates as two floats, the remaining fields are skipped as padding.
+    """
+    return struct.Struct("<" + f"ff{point_size - 8}x" * count)
+
+
+def _bounding_stroke(tool: int, color: int, points: memoryview, point_size: int) -> T.Optional[Stroke]:
+    """ Return the stroke spanning the packed points, or None if the stroke has no points. """
+    if len(points) % point_size:
+        raise RmFormatException(f"Point data of {len(points)} bytes is not a multiple of {point_size}")
+    if not points:
+        return None
+    coordinates = _coordinates_struct(len(points) // point_size, point_size).unpack(points)
+    xs, ys = coordinates[0::2], coordinates[1::2]
+    left, top = min(xs), min(ys)
+    return Stroke(tool=tool, color=color, x=left, y=top, width=max(xs) - left, height=max(ys) - top)
+
+
+def _parse_v5(view: memoryview, version: int, tools: T.AbstractSet[int]) -> List[Stroke]:
+    """ Parse the layers of a version 3 or 5 file. Only the points of strokes drawn with tools are read. """
+    line = _LINE_V5 if version == 5 else _LINE_V3
+    strokes: List[Stroke] = []
+    offset = HEADER_LENGTH
+    (layers,) = _INT.unpack_from(view, offset)
+    offset += _INT.size
+    for _ in range(layers):
+        (lines,) = _INT.unpack_from(view, offset)
+        offset += _INT.size
+        for _ in range(lines):
+            fields = line.unpack_from(view, offset)
+            offset += line.size
+            end = offset + fields[-1] * _POINT_SIZE_V5
+            if end > len(view):
+                raise RmFormatException("Stroke points run past the end of the file")
+            if fields[0] in tools:
+                with view[offset:end] as points:
+                    stroke = _bounding_stroke(fields[0], fields[1], points, _POINT_SIZE_V5)
+                if stroke:
+                    strokes.append(stroke)
+            offset = end
+    return strokes
+
+
+def _read_varuint(view: memoryview, offset: int) -> Tuple[int, int]:
+    """ Return a LEB128 encoded unsigned integer and the offset following it. """
+    result = 0
+    shift = 0
+    while True:
+        byte = view[offset]
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, offset
+        shift += 7
+
+
+def _tagged_fields(view: memoryview, offset: int, end: int) -> Dict[int, Tuple[int, int, int]]:
+    """ Return the tagged fields between offset and end, by index, as their type and the span of their value.
+
+        Fields of unknown index are kept as well, so fields added by newer firmware are skipped over.
+    """
+    fields: Dict[int, Tuple[int, int, int]] = {}
+    while offset < end:
+        tag, offset = _read_varuint(view, offset)
+        index, tag_type = tag >> 4, tag & 0xF
+        start = offset
+        if tag_type == _TAG_BYTE1:
+            offset += 1
+        elif tag_type == _TAG_BYTE4:
+            offset += 4
+        elif tag_type == _TAG_BYTE8:
+            offset += 8
+        elif tag_type == _TAG_LENGTH4:
+            (length,) = _UINT.unpack_from(view, offset)
+            start = offset + _UINT.size
+            offset = start + length
+        elif tag_type == _TAG_ID:
+            _, offset = _read_varuint(view, offset + 1)
+        else:
+            raise RmFormatException(f"Unknown tag type {tag_type:#x}")
+        fields[index] = (tag_type, start, offset)
+    if offset != end:
+        raise RmFormatException("Tagged value runs past the end of its block")
+    return fields
+
+
+def _parse_line_block(view: memoryview, start: int, end: int, version: int,
+                      tools: T.AbstractSet[int]) -> T.Optional[Stroke]:
+    """ Return the stroke of a scene line item block, or None if it was deleted or not drawn with tools. """
+    value = _tagged_fields(view, start, end).get(6)
+    if value is None:
+        return None
+    _, value_start, value_end = value
+    if view[value_start] != _LINE_ITEM:
+        return None
+    fields = _tagged_fields(view, value_start + 1, value_end)
+    if 1 not in fields or 5 not in fields:
+        raise RmFormatException("Line item has no tool or points")
+    (tool,) = _UINT.unpack_from(view, fields[1][1])
+    if tool not in tools:
+        return None
+    color = _UINT.unpack_from(view, fields[2][1])[0] if 2 in fields else 0
+    _, points_start, points_end = fields[5]
+    with view[points_start:points_end] as points:
+        return _bounding_stroke(tool, color, points, _POINT_SIZE_V6 if version >= 2 else _POINT_SIZE_V6_LEGACY)
+
+
+def _parse_v6(view: memoryview, tools: T.AbstractSet[int]) -> List[Stroke]:
+    """ Parse the blocks of a version 6 file, only scene line items are decoded. """
+    strokes: List[Stroke] = []
+    offset = HEADER_LENGTH
+    while offset < len(view):
+        length, _, _, version, block_type = _BLOCK_HEADER.unpack_from(view, offset)
+        start = offset + _BLOCK_HEADER.size
+        offset = start + length
+        if offset > len(view):
+            raise RmFormatException("Block runs past the end of the file")
+        if block_type == _LINE_BLOCK:
+            stroke = _parse_line_block(view, start, offset, version, tools)
+            if stroke:
+                strokes.append(stroke)
+    return strokes
+
+
+def parse_strokes(buffer: T.Union[bytes, memoryview], tools: T.AbstractSet[int] = HIGHLIGHTER_TOOLS) -> List[Stroke]:
+    """ Return the bounding box of every stroke drawn with one of tools in a version 3, 5 or 6 ``.rm`` file.
+
+    The buffer is read in place with :mod:`struct`, the points of strokes drawn with other tools are never decoded
+    and the coordinates of a stroke are unpacked in a single call.
+
+    :param buffer: The contents of the file, e.g. from :meth:`remarking.document_source.DocumentSource.map_bytes`.
+    :param tools: The pen ids of the strokes to return, highlighters by default.
+
+    :raises RmFormatException: If the file is not a supported ``.rm`` file or is truncated.
+    """
+    with memoryview(buffer) as view:
+        if bytes(view[:len(HEADER_PREFIX)]) != HEADER_PREFIX:
+            raise RmFormatException("Not a reMarkable .lines file")
+        try:
+            version = int(bytes(view[len(HEADER_PREFIX):HEADER_LENGTH]).strip())
+        except ValueError as exc:
+            raise RmFormatException("The .lines file has no version") from exc
+        try:
+            if version in (3, 5):
+                return _parse_v5(view, version, tools)
+            if version == 6:
+                return _parse_v6(view, tools)
+        except (struct.error, IndexError) as exc:
+            raise RmFormatException(f"Truncated .lines file: {exc}") from exc
+    raise RmFormatException(f"Unsupported .lines file version {version}")
+
+
+class RemarkableStrokeExtractor(highlight_extractor.HighlightExtractor):
+    """ Extracts the bounding boxes of highlighter strokes drawn on the pages of reMarkable documents.
+
+        Highlighting a PDF that has no text layer draws highlighter strokes into the ``.rm`` file of the page
+        instead of the ``highlights`` folder. Every stroke becomes a highlight with empty text, as strokes carry
+        no text of their own, and its bounding box in the ``x``, ``y``, ``width`` and ``height`` fields.
+    """
+
+    @classmethod
+    def get_extractor_instance_data(cls) -> List[highlight_extractor.ExtractorData]:
+        return [
+            highlight_extractor.ExtractorData(
+                extractor_name="remarkable_strokes",
+                instance=cls(),
+                description=cls.__doc__
+            )
+        ]
+
+    def get_highlights(self,
+                       working_path: T.Union[str, document_source_.DocumentSource],
+                       document: models.Document) -> List[models.Highlight]:
+        source = document_source_.as_document_source(working_path)
+        page_id_to_page_num = remarkable_highlight_extractor.get_page_number_mapping(source, document.id)
+        if page_id_to_page_num is None or not source.exists(document.id):
+            logging.info(f"Found no pages for {document.id}")
+            return []
+
+        strokes_by_page: List[Tuple[int, List[Stroke]]] = []
+        for file_name in source.listdir(document.id):
+            page_id, extension = file_name.rsplit(".", 1) if "." in file_name else (file_name, "")
+            if extension != "rm" or page_id not in page_id_to_page_num:
+                continue
+            try:
+                with source.map_bytes(f"{document.id}/{file_name}") as buffer:
+                    strokes = parse_strokes(buffer)
+            except RmFormatException as exc:
+                logging.warning(f"Skipping page {page_id} of {document.id}: {exc}")
+                continue
+            strokes_by_page.append((page_id_to_page_num[page_id], strokes))
+
+        highlights = []
+        for page_number, strokes in sorted(strokes_by_page, key=lambda page: page[0]):
+            for stroke in sorted(strokes, key=lambda stroke: (stroke.y, stroke.x)):
+                highlights.append(models.Highlight.create_highlight(
+                    document.id, "", page_number, self.__class__.__name__,
+                    bounding_box=(stroke.x, stroke.y, stroke.width, stroke.height)
+                ))
+        return highlights
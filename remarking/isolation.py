@@ -0,0 +1,239 @@
+""" Run extractors in worker processes that are replaced when a document exceeds their limits """
+import collections
+import logging
+import multiprocessing
+import pickle
+import time
+import traceback
+import typing as T
+from dataclasses import dataclass
+from multiprocessing import connection as connection_
+from typing import Deque, List, Tuple
+
+from remarking import document_source as document_source_
+from remarking import models
+from remarking.highlight_extractor import highlight_extractor
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None  # type: ignore  # pylint: disable=invalid-name
+
+
+@dataclass
+class ExtractionLimits:
+    """ Limits extractors are held to on every document when they are run in worker processes.
+
+    :param timeout: Seconds an extractor may spend on a document, unlimited when None.
+    :param memory: Bytes of address space a worker process may use, including the Python interpreter.
+                   Unlimited when None. Only enforced on Unix.
+    :param workers: The number of worker processes extracting documents concurrently.
+    """
+    timeout: T.Optional[float] = None
+    memory: T.Optional[int] = None
+    workers: int = 1
+
+
+@dataclass
+class ExtractionResult:
+    """ The outcome of running an extractor on a document in a worker process.
+
+    When the document exceeded a limit, ``skip_reason`` describes which and ``highlights`` is empty.
+    """
+    extractor: highlight_extractor.HighlightExtractor
+    document: models.Document
+    highlights: List[models.Highlight]
+    ms: float
+    skip_reason: T.Optional[str] = None
+
+
+class ExtractorWorkerException(RuntimeError):
+    """ Raised when an extractor raised an exception in its worker process """
+
+
+def _limit_memory(memory: int) -> None:
+    if resource is None:
+        logging.warning("Memory limits of extractors are not supported on this platform")
+        return
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+
+
+def _work(connection: connection_.Connection,
+          extractors: List[highlight_extractor.HighlightExtractor],
+          memory: T.Optional[int]) -> None:
+    """ Entry point of worker processes. Extracts the documents sent over connection until it is closed.
+
+    Messages are either ``("source", source)``, setting the source documents are read from,
+    or ``("extract", extractor_index, document)``, which is answered with ``(status, payload)``.
+    """
+    if memory is not None:
+        _limit_memory(memory)
+    connection.send(("ready", None))
+    source: T.Optional[document_source_.DocumentSource] = None
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+        if message[0] == "source":
+            source = message[1]
+            continue
+        _, extractor_index, document = message
+        try:
+            connection.send(("ok", extractors[extractor_index].get_highlights(source, document)))
+        except MemoryError:
+            connection.send(("memory", None))
+            return
+        except Exception as exc:  # pylint: disable=broad-except
+            formatted = traceback.format_exc()
+            try:
+                pickle.dumps(exc)
+            except Exception:  # pylint: disable=broad-except
+                exc = ExtractorWorkerException(str(exc))
+            connection.send(("error", (exc, formatted)))
+
+
+class _Worker():
+    """ A worker process and the task it is running. """
+
+    def __init__(self,
+                 context: T.Any,
+                 extractors: List[highlight_extractor.HighlightExtractor],
+                 memory: T.Optional[int]) -> None:
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_work, args=(child_connection, extractors, memory), daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.ready = False
+        self.source: T.Optional[document_source_.DocumentSource] = None
+        self.task: T.Optional[Tuple[int, models.Document]] = None
+        self.started = 0.0
+
+    def start_task(self, source: document_source_.DocumentSource, task: Tuple[int, models.Document]) -> None:
+        if self.source is not source:
+            self.connection.send(("source", source))
+            self.source = source
+        self.connection.send(("extract", *task))
+        self.task = task
+        self.started = time.monotonic()
+
+    def stop(self) -> None:
+        try:
+            self.connection.close()
+        finally:
+            if self.process.is_alive():
+                self.process.kill()
+            self.process.join()
+
+
+class ExtractorPool():
+    """ Runs extractors on documents in worker processes, holding every document to limits.
+
+        A worker that exceeds the time or memory limit on a document, or crashes, is killed and replaced
+        and the document is reported as skipped. The remaining documents keep being extracted by the other
+        workers. Exceptions raised by extractors are raised again as :class:`ExtractorWorkerException`.
+
+        Workers are started when the pool is first used and live until :meth:`close` is called, so
+        extractors can keep setup they do on their first document. Extractors and documents must be picklable.
+
+        :param extractors: The extractors to run.
+        :param limits: The limits documents are held to.
+    """
+
+    def __init__(self,
+                 extractors: List[highlight_extractor.HighlightExtractor],
+                 limits: ExtractionLimits) -> None:
+        self.extractors = extractors
+        self.limits = limits
+        self._context = multiprocessing.get_context("spawn")
+        self._workers: List[_Worker] = []
+
+    def __enter__(self) -> 'ExtractorPool':
+        return self
+
+    def __exit__(self, exc_type: T.Any, exc_value: T.Any, traceback_: T.Any) -> None:
+        self.close()
+
+    def _start_worker(self) -> _Worker:
+        return _Worker(self._context, self.extractors, self.limits.memory)
+
+    def _replace(self, worker: _Worker) -> None:
+        worker.stop()
+        self._workers[self._workers.index(worker)] = self._start_worker()
+
+    def _skip_reason(self, worker: _Worker, status: T.Optional[str]) -> str:
+        if status == "timeout":
+            return f"took longer than {self.limits.timeout:g} seconds"
+        if status == "memory":
+            return f"exceeded the memory limit of {(self.limits.memory or 0) // 2 ** 20} MiB"
+        worker.process.join(timeout=1)
+        return f"crashed its worker process with exit code {worker.process.exitcode}"
+
+    def extract(self,
+                source: document_source_.DocumentSource,
+                documents: List[models.Document]) -> T.Iterator[ExtractionResult]:
+        """ Run every extractor on every document, yielding results as they complete.
+
+        :param source: The source the documents are read from, it is sent to every worker.
+        :param documents: The documents to extract.
+
+        :raises ExtractorWorkerException: If an extractor raised an exception.
+        """
+        tasks: Deque[Tuple[int, models.Document]] = collections.deque(
+            (index, document) for index in range(len(self.extractors)) for document in documents
+        )
+        while len(self._workers) < max(self.limits.workers, 1):
+            self._workers.append(self._start_worker())
+
+        while tasks or any(worker.task for worker in self._workers):
+            for worker in self._workers:
+                if worker.ready and worker.task is None and tasks:
+                    worker.start_task(source, tasks.popleft())
+
+            now = time.monotonic()
+            deadlines = [worker.started + self.limits.timeout - now
+                         for worker in self._workers if worker.task and self.limits.timeout is not None]
+            ready = connection_.wait([worker.connection for worker in self._workers],
+                                     timeout=max(min(deadlines), 0) if deadlines else None)
+
+            for worker in list(self._workers):
+                status: T.Optional[str] = None
+                payload: T.Any = None
+                if worker.connection in ready:
+                    try:
+                        status, payload = worker.connection.recv()
+                    except EOFError:
+                        status = "crashed"
+                    if status == "ready":
+                        worker.ready = True
+                        continue
+                    if worker.task is None:
+                        # A worker crashed before it was ready.
+                        raise ExtractorWorkerException(self._skip_reason(worker, status))
+                elif (worker.task and self.limits.timeout is not None and
+                      time.monotonic() - worker.started >= self.limits.timeout):
+                    status = "timeout"
+                else:
+                    continue
+
+                extractor_index, document = T.cast(Tuple[int, models.Document], worker.task)
+                ms = round((time.monotonic() - worker.started) * 1000, 3)
+                worker.task = None
+                if status == "ok":
+                    yield ExtractionResult(self.extractors[extractor_index], document, payload, ms)
+                elif status == "error":
+                    exc, formatted = payload
+                    raise ExtractorWorkerException(
+                        f"{self.extractors[extractor_index].__class__.__name__} failed on \"{document.name}\":\n"
+                        f"{formatted}"
+                    ) from exc
+                else:
+                    reason = self._skip_reason(worker, status)
+                    self._replace(worker)
+                    yield ExtractionResult(self.extractors[extractor_index], document, [], ms, skip_reason=reason)
+
+    def close(self) -> None:
+        """ Stop all worker processes. """
+        for worker in self._workers:
+            worker.stop()
+        self._workers = []
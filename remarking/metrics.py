@@ -0,0 +1,177 @@
+""" Run metrics that can be written out in the OpenMetrics text format """
+import contextlib
+import math
+import os
+import tempfile
+import threading
+import time
+import typing as T
+from typing import Dict, List, Tuple
+
+LabelValues = Tuple[Tuple[str, str], ...]
+
+
+class Metric():
+    """ A named metric family holding one value per set of label values.
+
+    Should be created from :meth:`Registry.counter` or :meth:`Registry.gauge`.
+
+    :param name: The name of the metric family. Counter samples are exposed with a ``_total`` suffix.
+    :param help_: A description of the metric.
+    :param type_: Either ``counter`` or ``gauge``.
+    """
+
+    def __init__(self, name: str, help_: str, type_: str) -> None:
+        self.name = name
+        self.help = help_
+        self.type = type_
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, value: float = 1.0, **labels: str) -> None:
+        """ Increment the value for the given labels. """
+        if value < 0 and self.type == "counter":
+            raise ValueError(f"Counter {self.name} cannot be decremented")
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def set(self, value: float, **labels: str) -> None:
+        """ Set the value for the given labels. Only valid for gauges. """
+        if self.type != "gauge":
+            raise ValueError(f"Only gauges can be set, {self.name} is a {self.type}")
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def get(self, **labels: str) -> float:
+        """ Return the value for the given labels, 0 if it was never incremented or set. """
+        with self._lock:
+            return self._values.get(tuple(sorted(labels.items())), 0.0)
+
+    @contextlib.contextmanager
+    def time(self, **labels: str) -> T.Iterator[None]:
+        """ Increment the value for the given labels by the seconds spent in the block. """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.inc(time.perf_counter() - start, **labels)
+
+    def reset(self) -> None:
+        """ Forget all values. """
+        with self._lock:
+            self._values.clear()
+
+    def samples(self) -> List[Tuple[LabelValues, float]]:
+        """ Return the label values and value of every sample, sorted by label values. """
+        with self._lock:
+            return sorted(self._values.items())
+
+
+class Registry():
+    """ A collection of metrics that can be rendered together. """
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+
+    def _register(self, name: str, help_: str, type_: str) -> Metric:
+        if name in self._metrics:
+            raise ValueError(f"Metric {name} is already registered")
+        metric = Metric(name, help_, type_)
+        self._metrics[name] = metric
+        return metric
+
+    def counter(self, name: str, help_: str) -> Metric:
+        """ Register and return a counter. """
+        return self._register(name, help_, "counter")
+
+    def gauge(self, name: str, help_: str) -> Metric:
+        """ Register and return a gauge. """
+        return self._register(name, help_, "gauge")
+
+    def reset(self) -> None:
+        """ Forget the values of all metrics. """
+        for metric in self._metrics.values():
+            metric.reset()
+
+    def to_openmetrics(self) -> str:
+        """ Render all metrics in the OpenMetrics text format. """
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.append(f"# HELP {metric.name} {_escape(metric.help)}")
+            samples = metric.samples()
+            if not samples and metric.type == "counter":
+                samples = [((), 0.0)]
+            suffix = "_total" if metric.type == "counter" else ""
+            for labels, value in samples:
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str) -> None:
+        """ Write all metrics to path in the OpenMetrics text format.
+
+        The file is replaced atomically so a collector never reads a partially written file.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        file_descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix=".remarking-metrics-")
+        try:
+            with os.fdopen(file_descriptor, "w") as metrics_file:
+                metrics_file.write(self.to_openmetrics())
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: LabelValues) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+REGISTRY = Registry()
+""" The registry all remarking metrics are registered with. """
+
+RUNS = REGISTRY.counter("remarking_runs", "Runs of the highlight extractor started.")
+RUN_ERRORS = REGISTRY.counter("remarking_run_errors", "Runs of the highlight extractor that failed.")
+LAST_RUN_SUCCESS = REGISTRY.gauge("remarking_last_run_success", "1 if the last run succeeded, 0 if it failed.")
+LAST_RUN_TIMESTAMP = REGISTRY.gauge("remarking_last_run_timestamp_seconds",
+                                    "Unix time at which the last run finished.")
+STAGE_DURATION = REGISTRY.counter("remarking_stage_duration_seconds",
+                                  "Seconds spent in each stage of a run.")
+DOCUMENTS_LISTED = REGISTRY.counter("remarking_documents_listed",
+                                    "Documents found in the requested collections of the reMarkable cloud.")
+DOCUMENTS_NEW = REGISTRY.counter("remarking_documents_new", "Documents not seen by a previous run.")
+DOCUMENTS_CHANGED = REGISTRY.counter("remarking_documents_changed", "Documents modified since a previous run.")
+DOCUMENTS_DOWNLOADED = REGISTRY.counter("remarking_documents_downloaded", "Documents downloaded.")
+DOCUMENTS_SKIPPED = REGISTRY.counter("remarking_documents_skipped",
+                                     "Documents skipped because an extractor exceeded its limits on them.")
+HIGHLIGHTS_EXTRACTED = REGISTRY.counter("remarking_highlights_extracted", "Highlights found by extractors.")
+HIGHLIGHTS_NEW = REGISTRY.counter("remarking_highlights_new", "Highlights not already in storage.")
+CLOUD_REQUESTS = REGISTRY.counter("remarking_cloud_requests", "Calls made to the reMarkable cloud.")
+CLOUD_ERRORS = REGISTRY.counter("remarking_cloud_errors", "Calls to the reMarkable cloud that failed.")
+DOWNLOADED_BYTES = REGISTRY.counter("remarking_downloaded_bytes", "Bytes of document archives downloaded.")
+DB_ROUND_TRIPS = REGISTRY.counter("remarking_db_round_trips", "Statements sent to the database.")
+DB_ERRORS = REGISTRY.counter("remarking_db_errors", "Statements sent to the database that failed.")
+STORAGE_CACHE_HITS = REGISTRY.counter("remarking_storage_cache_hits",
+                                      "Documents and highlights served from the storage cache.")
+STORAGE_CACHE_MISSES = REGISTRY.counter("remarking_storage_cache_misses",
+                                        "Documents and highlights looked up in storage because they were not cached.")
+BLOOM_FILTER_LOOKUPS = REGISTRY.counter("remarking_bloom_filter_lookups",
+                                        "Highlight hashes checked against the bloom filter, by whether they were "
+                                        "possibly stored or skipped as definitely new.")
@@ -1,18 +1,40 @@
 """ Contains SqlAlchemy models and their helper methods """
 import datetime
 import hashlib
+import re
 import typing as T
-from typing import Dict
+from typing import Dict, List
 
 from dateutil import parser as date_parser
 from rmapy import document as rmapy_document
-from sqlalchemy import (TIMESTAMP, Boolean, Column, ForeignKey, Integer,
-                        String, Text)
+from sqlalchemy import (TIMESTAMP, Boolean, Column, Float, ForeignKey,
+                        Integer, String, Text)
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
 C = T.TypeVar('C', bound='ModelMixIn')  # pylint: disable=C0103
 
+_ISO_TIMESTAMP = re.compile(
+    r"(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(?:[.,](\d+))?(?:Z|[+-]\d{2}(?::?\d{2})?)?\Z"
+)
+
+
+def parse_timestamp(value: str) -> datetime.datetime:
+    """ Parse a timestamp of the reMarkable cloud metadata, e.g. ``2021-07-05T14:18:22.123456789Z``.
+
+    Timestamps in the ISO-8601 format the cloud uses are parsed with a regular expression, anything else falls back
+    to :func:`dateutil.parser.parse`. Either way the result is naive: a timezone is dropped, not converted, and
+    fractions of a second are truncated to microseconds.
+
+    :raises ValueError: If value is not a timestamp.
+    """
+    match = _ISO_TIMESTAMP.match(value)
+    if match is None:
+        return date_parser.parse(value).replace(tzinfo=None)
+    year, month, day, hour, minute, second, fraction = match.groups()
+    return datetime.datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                             int(fraction[:6].ljust(6, "0")) if fraction else 0)
+
 
 class ModelMixIn():
     """ MixIn for common functionality used for SqlAlchemy models. """
@@ -58,6 +80,8 @@ class Document(Base, ModelMixIn):
     """ Indicate if the document is bookmarked. """
     parent: str = Column(String(256), nullable=False)
     """ The parent of the document. This is usually a folder ID. """
+    account: T.Optional[str] = Column(String(256), nullable=True)
+    """ The name of the account the document was synced for when running several accounts at once. """
 
     def equal(self, other: 'Document') -> bool:
         """ Check for equality with other documents. """
@@ -66,31 +90,28 @@ class Document(Base, ModelMixIn):
     @classmethod
     def from_cloud_document(cls, cloud_document: rmapy_document.Document) -> 'Document':
         """ Create a Document model from a reMarkable cloud document.  """
-        cloud_document_metadata = cloud_document.to_dict()
-        cloud_document_mapping = {
-            "ID": "id",
-            "Version": "version",
-            "Message": "message",
-            "Success": "success",
-            "ModifiedClient": "modified_client",
-            "Type": "type",
-            "VissibleName": "name",
-            "CurrentPage": "current_page",
-            "Bookmarked": "bookmarked",
-            "Parent": "parent"
+        return cls.from_cloud_documents([cloud_document])[0]
 
-        }
-        cleaned_metadata = {}
-        for key, value in cloud_document_metadata.items():
-            if key not in cloud_document_mapping:
-                continue
-            new_key = cloud_document_mapping[key]
-            if key == "ModifiedClient":
-                cleaned_metadata[new_key] = date_parser.parse(value).replace(tzinfo=None)
-            else:
-                cleaned_metadata[new_key] = value
-
-        return cls.from_dict(cleaned_metadata)
+    @classmethod
+    def from_cloud_documents(cls, cloud_documents: T.Iterable[rmapy_document.Document]) -> List['Document']:
+        """ Create Document models from reMarkable cloud documents in a single pass.
+
+        The attributes of the cloud documents are read directly and ``ModifiedClient`` is parsed with
+        :func:`parse_timestamp`, so large listings are converted without going through dictionaries.
+        """
+        return [
+            cls(
+                id=cloud_document.ID,
+                version=cloud_document.Version,
+                modified_client=parse_timestamp(cloud_document.ModifiedClient),
+                type=cloud_document.Type,
+                name=cloud_document.VissibleName,
+                current_page=cloud_document.CurrentPage,
+                bookmarked=cloud_document.Bookmarked,
+                parent=cloud_document.Parent
+            )
+            for cloud_document in cloud_documents
+        ]
 
     def to_metadata_dict(self) -> Dict[str, T.Any]:
         """ Return a dictionary that matches the .content file used by the reMarkable. """
@@ -124,9 +145,18 @@ class Highlight(Base, ModelMixIn):
     """ A unix timestamp of when the highlight was extracted. """
     extraction_method: str = Column(String(256), nullable=True)
     """ What method was used to perform the highlight extraction. """
+    x: T.Optional[float] = Column(Float, nullable=True)
+    """ The left edge of the highlighted area on the page, for highlights located by geometry instead of text. """
+    y: T.Optional[float] = Column(Float, nullable=True)
+    """ The top edge of the highlighted area on the page. """
+    width: T.Optional[float] = Column(Float, nullable=True)
+    """ The width of the highlighted area on the page. """
+    height: T.Optional[float] = Column(Float, nullable=True)
+    """ The height of the highlighted area on the page. """
 
     @classmethod
-    def create_highlight(cls, doc_id: str, text: str, page_number: int, extraction_method: str) -> 'Highlight':
+    def create_highlight(cls, doc_id: str, text: str, page_number: int, extraction_method: str,
+                         bounding_box: T.Optional[T.Tuple[float, float, float, float]] = None) -> 'Highlight':
         """ Create a Highlight.
         This should be used in place of the default constructor as it properly constructs the highlight hash.
 
@@ -134,16 +164,26 @@ class Highlight(Base, ModelMixIn):
         :param text: The text of the highlight.
         :param page_number: The page number where the highlight is located.
         :param extract_method: The extraction method.
+        :param bounding_box: The x, y, width and height of the highlighted area on the page, if known.
+                             It is part of the hash, so highlights without text are told apart by their location.
 
         :return: An instance of highlight for these values.
         """
+        key = text + doc_id
+        x, y, width, height = bounding_box if bounding_box is not None else (None, None, None, None)
+        if bounding_box is not None:
+            key += f"#{page_number}:{x:.1f},{y:.1f},{width:.1f},{height:.1f}"
         return Highlight(
             document_id=doc_id,
             text=text,
-            hash=hashlib.sha224((text + doc_id).encode()).hexdigest(),
+            hash=hashlib.sha224(key.encode()).hexdigest(),
             page_number=page_number,
             extraction_method=extraction_method,
-            extracted_at=datetime.datetime.now()
+            extracted_at=datetime.datetime.now(),
+            x=x,
+            y=y,
+            width=width,
+            height=height
         )
 
     def equal(self, other: 'Highlight') -> bool:
@@ -152,3 +192,54 @@ class Highlight(Base, ModelMixIn):
                 self.text == other.text and
                 self.document_id == other.document_id and
                 self.page_number == other.page_number)
+
+
+class PendingHighlight(Base, ModelMixIn):
+    """ Marks a highlight that was committed to storage but has not been delivered to a writer yet.
+
+    Highlights are committed as documents are processed. Keeping track of the ones that were never written out
+    lets an interrupted run return them on the next run instead of losing them.
+    """
+    __tablename__ = "pending_highlight"
+    hash: str = Column(String(256), ForeignKey('highlight.hash'), primary_key=True, nullable=False)
+    """ The hash of the pending highlight. """
+
+
+class SkippedDocument(Base, ModelMixIn):
+    """ A document extractors are not run on because it exceeded the limits of the extractor worker processes.
+
+    The document is retried once it is modified, see :class:`remarking.isolation.ExtractionLimits`.
+    """
+    __tablename__ = "skipped_document"
+    document_id: str = Column(String(256), primary_key=True, nullable=False)
+    """ The id of the skipped document. """
+    version: int = Column(Integer, nullable=False)
+    """ The version of the document when it was skipped. """
+    modified_client: datetime.datetime = Column(TIMESTAMP, nullable=False)
+    """ The time the document was last modified when it was skipped. """
+    reason: str = Column(Text, nullable=False)
+    """ Which extractor exceeded which limit on the document. """
+    skipped_at: datetime.datetime = Column(TIMESTAMP, nullable=False)
+    """ The time the document was skipped. """
+
+    @classmethod
+    def create_skipped_document(cls, document: Document, reason: str) -> 'SkippedDocument':
+        """ Create a SkippedDocument for the current version of document.
+
+        :param document: The document that exceeded a limit.
+        :param reason: Which extractor exceeded which limit.
+        """
+        return SkippedDocument(
+            document_id=document.id,
+            version=int(document.version),
+            modified_client=document.modified_client,
+            reason=reason,
+            skipped_at=datetime.datetime.now()
+        )
+
+    def skips(self, document: Document) -> bool:
+        """ Return if document is unchanged since it was skipped. """
+        # The cloud metadata may hold the version as a string.
+        return (self.document_id == document.id and
+                self.version == int(document.version) and
+                self.modified_client == document.modified_client)
@@ -1,15 +1,28 @@
 """ RMCloud used for downloading and extracting from Remarkable Cloud """
 import os
+import time
 import typing as T
-import zipfile
-from typing import List
+from typing import Dict, List
 
+import requests
 import rmapy
 import rmapy.api as rmapi
+import yaml
+from requests import adapters as requests_adapters
 from rmapy import collections as rmapy_collections
+from rmapy import const as rmapy_const
 from rmapy import document as rmapy_document
 from rmapy import folder as rmapy_folder
 
+from remarking import document_source as document_source_
+from remarking import events, metrics
+
+
+TRASH = "trash"
+""" The parent of items moved to the trash. The trash has no meta item of its own. """
+
+MetaItem = T.Union[rmapy_document.Document, rmapy_folder.Folder]
+
 
 class RMCloudException(RuntimeError):
     """ Wrapper for Exceptions throw from RMCloud """
@@ -23,13 +36,111 @@ class RenewAuthError(RMCloudException):
     """ Raised when renewing a token fails """
 
 
+def create_session(pool_size: int = 10) -> requests.Session:
+    """ Return a requests session whose connection pool can be shared by several :class:`RMCloud` instances. """
+    session = requests.Session()
+    adapter = requests_adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class _TokenSet(dict):
+    """ Tokens of a :class:`_ConfiguredClient`, remembering the config file they are saved to. """
+
+    def __init__(self, config_path: str) -> None:
+        super().__init__(devicetoken="", usertoken="")
+        self.config_path = config_path
+
+
+_rmapy_dump = rmapi.dump
+
+
+def _dump_config(config: T.Dict[str, str]) -> None:
+    """ Stands in for the config dump of :mod:`rmapy.api` so tokens of a :class:`_ConfiguredClient`
+    are saved to its own config file rather than ``~/.rmapi``.
+    """
+    if isinstance(config, _TokenSet):
+        with open(config.config_path, "w") as config_file:
+            config_file.write(yaml.dump(dict(config)))
+    else:
+        _rmapy_dump(config)
+
+
+rmapi.dump = _dump_config
+
+
+class _ConfiguredClient(rmapi.Client):
+    """ rmapy client that keeps its tokens in the given config file and sends requests through a shared session.
+
+    :class:`rmapy.api.Client` keeps its tokens in a class attribute and always reads and writes ``~/.rmapi``,
+    which makes it impossible to use several accounts in one process. Registering and renewing tokens is left
+    to rmapy, which saves the tokens through :func:`_dump_config`.
+    """
+
+    def __init__(self, config_path: str, session: T.Optional[requests.Session] = None) -> None:
+        # pylint: disable=super-init-not-called
+        self.token_set = _TokenSet(os.path.expanduser(config_path))
+        self._session = session or create_session(pool_size=1)
+        if os.path.exists(self.token_set.config_path):
+            with open(self.token_set.config_path, "r") as config_file:
+                config = yaml.load(config_file.read(), Loader=yaml.BaseLoader) or {}
+            for key in self.token_set:
+                if key in config:
+                    self.token_set[key] = config[key]
+
+    def request(self,  # type: ignore
+                method: str,
+                path: str,
+                data: T.Any = None,
+                body: T.Any = None,
+                headers: T.Optional[T.Dict[str, str]] = None,
+                params: T.Any = None,
+                stream: bool = False) -> requests.Response:
+        # rmapy sends every request through this method with the module level requests.request,
+        # so it is the only place the shared session can be used.
+        url = path if path.startswith("http") else f"{rmapy_const.BASE_URL}/{path.lstrip('/')}"
+        request_headers = {"user-agent": rmapy_const.USER_AGENT}
+        if self.token_set["usertoken"]:
+            request_headers["Authorization"] = f"Bearer {self.token_set['usertoken']}"
+        request_headers.update(headers or {})
+        return self._session.request(method, url, json=body, data=data, headers=request_headers,
+                                     params=params, stream=stream)
+
+
+class _MetaItemIndex():
+    """ Meta items by id, and the children of every item by parent id, built in a single pass. """
+
+    def __init__(self, items: T.Iterable[MetaItem]) -> None:
+        self.by_id: Dict[str, MetaItem] = {}
+        self.children: Dict[str, List[MetaItem]] = {}
+        for item in items:
+            self.by_id[item.ID] = item
+            self.children.setdefault(item.Parent, []).append(item)
+
+
 class RMCloud():
     """
     Download and extract documents from reMarkable cloud.
+
+    :param auth_token: One time code used to register remarking if it is not registered yet.
+    :param config_path: The rmapy config file holding this account's tokens. ``~/.rmapi`` is used by default.
+    :param session: A requests session to send requests through, see :func:`create_session`.
+                    Sharing one session lets several accounts share a connection pool.
     """
 
-    def __init__(self, auth_token: str):
-        self._api_client = rmapi.Client()
+    def __init__(self,
+                 auth_token: str,
+                 config_path: T.Optional[str] = None,
+                 session: T.Optional[requests.Session] = None):
+        if config_path is None and session is None:
+            self._api_client = rmapi.Client()
+        else:
+            self._api_client = _ConfiguredClient(config_path or "~/.rmapi", session)
+        self._meta_items: T.Optional[List[rmapy_collections.Collection]] = None
+        self._index: T.Optional[_MetaItemIndex] = None
+        self.downloaded_bytes = 0
+        """ Bytes of document archives downloaded by this instance. """
         is_auth = self._api_client.is_auth()
         is_renewable = True
         renewable_exc = None
@@ -55,11 +166,71 @@ class RMCloud():
         if not self._api_client.is_auth():
             raise AuthError()
 
+    def renew_auth(self) -> None:
+        """
+        Fetch a new user token for the existing device registration.
+
+        Long running sessions call this after a failure in case the user token expired.
+        """
+        try:
+            self._api_client.renew_token()
+        except rmapy.exceptions.AuthError as exc:
+            raise RenewAuthError() from exc
+
     def get_meta_items(self) -> List[rmapy_collections.Collection]:
         """
         Fetch all meta items from the Remarkable Cloud.
         """
-        return self._api_client.get_meta_items()
+        metrics.CLOUD_REQUESTS.inc(operation="meta_items")
+        start = time.perf_counter()
+        try:
+            meta_items = self._api_client.get_meta_items()
+        except Exception:
+            metrics.CLOUD_ERRORS.inc(operation="meta_items")
+            raise
+        events.emit("meta_items_retrieved", items=len(meta_items), ms=events.elapsed_ms(start))
+        return meta_items
+
+    def refresh_meta_items(self) -> List[rmapy_collections.Collection]:
+        """
+        Fetch all meta items and keep them as the snapshot used by
+        :meth:`get_folders`, :meth:`get_documents` and :meth:`crawl_folders`.
+        """
+        self._meta_items = self.get_meta_items()
+        self._index = None
+        return self._meta_items
+
+    def _get_meta_items_snapshot(self) -> List[rmapy_collections.Collection]:
+        """ Return the last fetched meta items, fetching them if there is no snapshot yet. """
+        if self._meta_items is None:
+            return self.refresh_meta_items()
+        return self._meta_items
+
+    def _get_index(self) -> _MetaItemIndex:
+        """ Return the index of the meta items snapshot, building it on first use. """
+        items = self._get_meta_items_snapshot()
+        if self._index is None:
+            self._index = _MetaItemIndex(items)
+        return self._index
+
+    def is_excluded(self, item: MetaItem, excluded_folders: T.Collection[str] = ()) -> bool:
+        """
+        Return if item is in the trash, or is or is inside a folder named in excluded_folders.
+
+        Only the parents of item are visited. Folder names are compared case insensitively.
+        """
+        excluded_names = {name.lower() for name in excluded_folders}
+        index = self._get_index()
+        visited = set()
+        current: T.Optional[MetaItem] = item
+        while current is not None and current.ID not in visited:
+            if current.Parent == TRASH:
+                return True
+            if isinstance(current, rmapy_folder.Folder) and current.VissibleName.lower() in excluded_names:
+                return True
+            visited.add(current.ID)
+            current = index.by_id.get(current.Parent)
+        return False
 
     def get_folders(self, folders: List[str] = None) -> List[rmapy_folder.Folder]:
         """
@@ -67,7 +238,7 @@ class RMCloud():
 
         Return all folders by default.
         """
-        items = self.get_meta_items()
+        items = self._get_meta_items_snapshot()
         folder_items = [item for item in items if isinstance(item, rmapy_folder.Folder)]
         if folders is None:
             return folder_items
@@ -81,7 +252,7 @@ class RMCloud():
 
         Return all documents by default.
         """
-        items = self.get_meta_items()
+        items = self._get_meta_items_snapshot()
         document_items = [item for item in items if isinstance(item, rmapy_document.Document)]
         if documents is None:
             return document_items
@@ -89,34 +260,54 @@ class RMCloud():
         lowered = [document.lower() for document in documents]
         return [document for document in document_items if document.VissibleName.lower() in lowered]
 
-    def crawl_folders(self, folders: List[rmapy_folder.Folder]) -> List[rmapy_document.Document]:
+    def crawl_folders(self,
+                      folders: List[rmapy_folder.Folder],
+                      excluded_folders: T.Collection[str] = ()) -> List[rmapy_document.Document]:
         """
         Recursively crawl a list of folders for all documents they contain.
+
+        Folders in the trash and folders named in excluded_folders are pruned with everything inside them,
+        they are never walked. See :meth:`is_excluded`.
         """
-        items = self.get_meta_items()
+        index = self._get_index()
+        excluded_names = {name.lower() for name in excluded_folders}
 
-        def _get_documents(
-            docs_or_folders: T.Union[rmapy_document.Document, rmapy_folder.Folder]
-        ) -> List[rmapy_document.Document]:
+        def _get_documents(docs_or_folders: T.Iterable[MetaItem]) -> List[rmapy_document.Document]:
             documents = []
             for collection in docs_or_folders:
                 if isinstance(collection, rmapy_document.Document):
                     documents.append(collection)
-                elif isinstance(collection, rmapy_folder.Folder):
-                    children = [item for item in items if item.Parent == collection.ID]
-                    documents.extend(_get_documents(children))
+                elif (isinstance(collection, rmapy_folder.Folder) and
+                      collection.VissibleName.lower() not in excluded_names):
+                    documents.extend(_get_documents(index.children.get(collection.ID, [])))
             return documents
-        return _get_documents(folders)
+        return _get_documents([folder for folder in folders if not self.is_excluded(folder, excluded_folders)])
 
-    def download_document(self, doc_id: str, path: str) -> None:
+    def download_document(self, doc_id: str, path: T.Optional[str] = None) -> document_source_.ZipDocumentSource:
         """
-        Download the document zip with the given doc id and expands it into the given path.
+        Download the document zip with the given doc id and return a source that reads from the archive.
+
+        The archive is never unpacked. When path is set the archive is written to ``<path>/<doc_id>.zip``,
+        otherwise it is kept in memory.
 
         Path is created if it does not exist
         """
+        metrics.CLOUD_REQUESTS.inc(operation="download")
+        start = time.perf_counter()
+        try:
+            zip_document = self._api_client.download(self._api_client.get_doc(doc_id))
+        except Exception:
+            metrics.CLOUD_ERRORS.inc(operation="download")
+            raise
+        archive = zip_document.zipfile.getvalue()
+        metrics.DOWNLOADED_BYTES.inc(len(archive))
+        self.downloaded_bytes += len(archive)
+        events.emit("document_downloaded", document_id=doc_id, bytes=len(archive), ms=events.elapsed_ms(start))
+        if path is None:
+            return document_source_.ZipDocumentSource(archive)
+
         path_to_zip = os.path.join(path, doc_id + ".zip")
         os.makedirs(path, exist_ok=True)
-        self._api_client.download(self._api_client.get_doc(doc_id)).dump(path_to_zip)
-
-        with zipfile.ZipFile(path_to_zip, 'r') as zip_ref:
-            zip_ref.extractall(path)
+        with open(path_to_zip, "wb") as zip_file:
+            zip_file.write(archive)
+        return document_source_.ZipDocumentSource(path_to_zip)
@@ -0,0 +1,154 @@
+import importlib.util
+import typing as T
+from typing import Dict, List, Sequence, Tuple, Union
+
+import sqlalchemy
+from sqlalchemy import orm
+from sqlalchemy.ext import asyncio as sqlalchemy_asyncio
+
+from remarking import models as models_
+from remarking.storage import async_storage
+from remarking.storage import sqlalchemy_storage
+
+ASYNC_DRIVERS: Dict[str, Tuple[str, str]] = {
+    "sqlite": ("aiosqlite", "aiosqlite"),
+    "postgresql": ("asyncpg", "asyncpg"),
+    "mysql": ("aiomysql", "aiomysql"),
+}
+""" The asyncio driver and the module it needs for each database backend, e.g. ``sqlite+aiosqlite`` """
+
+
+class MissingAsyncDriverException(RuntimeError):
+    """ Raised when no asyncio driver is installed for a database """
+
+
+def to_async_url(db_string: str) -> sqlalchemy.engine.URL:
+    """ Return the connection string with its driver replaced by the asyncio driver of its backend.
+
+    Connection strings that already name a driver from :data:`ASYNC_DRIVERS` are returned unchanged.
+
+    :raises MissingAsyncDriverException: If the backend has no known asyncio driver or it is not installed.
+    """
+    url = sqlalchemy.engine.make_url(db_string)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise MissingAsyncDriverException(f"No asyncio driver is known for {backend} databases")
+    driver, module = ASYNC_DRIVERS[backend]
+    if importlib.util.find_spec(module) is None:
+        raise MissingAsyncDriverException(f"Using {backend} with asyncio requires {module}, "
+                                          f"install it with `pip install {module}`")
+    return url.set(drivername=f"{backend}+{driver}")
+
+
+class AsyncSqlAlchemyStorage(async_storage.AsyncStorage):
+    """ Storage implementation for the asyncio extension of SqlAlchemy
+
+    The database is accessed with the asyncio driver of its backend, see :data:`ASYNC_DRIVERS`.
+    It shares its schema with :class:`remarking.storage.sqlalchemy_storage.SqlAlchemyStorage`,
+    so either can be used on the same database. Tables are created when storage is first used.
+
+    :param db_string: The SqlAlchemy connection string. Its driver is replaced by the asyncio driver.
+    :param echo: If SqlAlchemy should log all statements.
+
+    :raises MissingAsyncDriverException: If no asyncio driver is installed for the database.
+    """
+
+    def __init__(self, db_string: str, echo: bool = False) -> None:
+        self._engine = sqlalchemy_asyncio.create_async_engine(to_async_url(db_string), echo=echo)
+        sqlalchemy_storage.count_round_trips(self._engine.sync_engine)
+        self.echo = echo
+        self._session = sqlalchemy_asyncio.AsyncSession(self._engine, expire_on_commit=False)
+        self._search_index: T.Optional[bool] = None
+        self._deduplicate_text = False
+
+    async def _search_index_ready(self) -> bool:
+        """ Create the schema on first use. Returns if the search index is maintained. """
+        if self._search_index is None:
+            async with self._engine.begin() as connection:
+                await connection.run_sync(sqlalchemy_storage.ensure_schema)
+                self._search_index = await connection.run_sync(sqlalchemy_storage.create_search_index)
+                self._deduplicate_text = await connection.run_sync(sqlalchemy_storage.uses_deduplicated_text)
+        return self._search_index
+
+    async def _select_models(self, model_class: T.Any, statement: T.Any) -> List[T.Any]:
+        """ Run a Core select in the session's transaction and build a detached model from each row. """
+        result = await self._session.execute(statement)
+        return [model_class(**row._mapping) for row in result]
+
+    async def get_documents(self, document_ids: T.Optional[List[str]] = None) -> List[models_.Document]:
+        await self._search_index_ready()
+        table = models_.Document.__table__
+        statement = sqlalchemy.select(table)
+        if document_ids:
+            statement = statement.where(table.c.id.in_(document_ids))
+        return await self._select_models(models_.Document, statement)
+
+    async def get_highlights(self, combined_text_hashes: List[str]) -> List[models_.Highlight]:
+        await self._search_index_ready()
+        statement = sqlalchemy_storage.select_highlights()
+        if combined_text_hashes:
+            statement = statement.where(sqlalchemy_storage.highlight_table.c.hash.in_(combined_text_hashes))
+        return await self._select_models(models_.Highlight, statement)
+
+    async def save_models(self, models: Sequence[Union[models_.Document,
+                                                       models_.Highlight,
+                                                       models_.PendingHighlight]]) -> None:
+        search_index = await self._search_index_ready()
+        await self._session.run_sync(sqlalchemy_storage.save_models_in, models, self._deduplicate_text, search_index)
+
+    async def update_documents(self, documents: List[models_.Document]) -> None:
+        search_index = await self._search_index_ready()
+
+        def update(session: orm.Session) -> None:
+            session.bulk_update_mappings(models_.Document, [doc.to_dict() for doc in documents])
+            if search_index:
+                sqlalchemy_storage.index_document_names(session, documents)
+
+        await self._session.run_sync(update)
+
+    async def get_pending_highlights(self) -> List[models_.Highlight]:
+        await self._search_index_ready()
+        pending_table = models_.PendingHighlight.__table__
+        return await self._select_models(models_.Highlight, sqlalchemy_storage.select_highlights().where(
+            sqlalchemy_storage.highlight_table.c.hash.in_(sqlalchemy.select(pending_table.c.hash))
+        ))
+
+    async def clear_pending_highlights(self, combined_text_hashes: List[str]) -> None:
+        if not combined_text_hashes:
+            return
+        await self._search_index_ready()
+        await self._session.execute(
+            sqlalchemy.delete(models_.PendingHighlight).where(
+                models_.PendingHighlight.hash.in_(combined_text_hashes)
+            ).execution_options(synchronize_session=False)
+        )
+
+    async def get_skipped_documents(self) -> List[models_.SkippedDocument]:
+        await self._search_index_ready()
+        return await self._select_models(models_.SkippedDocument,
+                                         sqlalchemy.select(models_.SkippedDocument.__table__))
+
+    async def save_skipped_documents(self, skipped_documents: List[models_.SkippedDocument]) -> None:
+        if not skipped_documents:
+            return
+        await self.clear_skipped_documents([skipped.document_id for skipped in skipped_documents])
+        await self._session.execute(models_.SkippedDocument.__table__.insert(),
+                                    [skipped.to_dict() for skipped in skipped_documents])
+
+    async def clear_skipped_documents(self, document_ids: List[str]) -> None:
+        if not document_ids:
+            return
+        await self._search_index_ready()
+        await self._session.execute(models_.SkippedDocument.__table__.delete().where(
+            models_.SkippedDocument.document_id.in_(document_ids)
+        ))
+
+    async def commit(self) -> None:
+        await self._session.commit()
+
+    async def rollback(self) -> None:
+        await self._session.rollback()
+
+    async def close(self) -> None:
+        await self._session.close()
+        await self._engine.dispose()
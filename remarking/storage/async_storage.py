@@ -0,0 +1,131 @@
+import asyncio
+import concurrent.futures
+import functools
+import typing as T
+from abc import ABCMeta, abstractmethod
+from typing import List, Sequence, Union
+
+from remarking import models as models_
+from remarking.storage import storage as storage_
+
+
+class AsyncStorage(metaclass=ABCMeta):
+    """ Asynchronous storage interface
+
+        The coroutine counterpart of :class:`remarking.storage.storage.Storage`, so that storage round trips
+        can be awaited while other work, like downloading documents, continues.
+
+        All changes to storage should be committed only when commit is awaited.
+        Operations must not run concurrently, each one should be awaited before the next is started.
+    """
+
+    @abstractmethod
+    async def get_documents(self, document_ids: T.Optional[List[str]] = None) -> List[models_.Document]:
+        """ Return all documents with matching ID.
+        If no IDs are passed, return all stored documents.
+        """
+
+    @abstractmethod
+    async def get_highlights(self, combined_text_hashes: List[str]) -> List[models_.Highlight]:
+        """ Return all highlights with matching CombinedTextHashs.
+        If no hashes are passed, return all stored highlights.
+        """
+
+    @abstractmethod
+    async def save_models(self, models: Sequence[Union[models_.Document,
+                                                       models_.Highlight,
+                                                       models_.PendingHighlight]]) -> None:
+        """ Save passed models into storage """
+
+    @abstractmethod
+    async def update_documents(self, documents: List[models_.Document]) -> None:
+        """ Update existing documents in the database.
+        The passed models must already exist in storage.
+        """
+
+    @abstractmethod
+    async def get_pending_highlights(self) -> List[models_.Highlight]:
+        """ Return all highlights that have a matching :class:`models.PendingHighlight` """
+
+    @abstractmethod
+    async def clear_pending_highlights(self, combined_text_hashes: List[str]) -> None:
+        """ Remove the pending marker of the highlights with matching hashes """
+
+    async def get_skipped_documents(self) -> List[models_.SkippedDocument]:
+        """ Return the documents skipped because they exceeded the limits of extractors.
+
+        Storage that does not keep a skip list returns nothing, skipped documents are then retried every run.
+        """
+        return []
+
+    async def save_skipped_documents(self, skipped_documents: List[models_.SkippedDocument]) -> None:
+        """ Add documents to the skip list, replacing earlier entries for the same documents. """
+
+    async def clear_skipped_documents(self, document_ids: List[str]) -> None:
+        """ Remove documents from the skip list """
+
+    @abstractmethod
+    async def commit(self) -> None:
+        """ Commit changes to storage """
+
+    @abstractmethod
+    async def rollback(self) -> None:
+        """ Discard all changes made since the last commit """
+
+    async def close(self) -> None:
+        """ Release the connections held by storage. It should not be used afterwards. """
+
+
+class SyncStorageAdapter(AsyncStorage):
+    """ Run a synchronous :class:`remarking.storage.storage.Storage` as an :class:`AsyncStorage`.
+
+    Every call is made from the same worker thread, so storages that are not thread safe can be adapted.
+
+    :param storage: The storage to adapt.
+    """
+
+    def __init__(self, storage: storage_.Storage) -> None:
+        self.storage = storage
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="remarking-storage")
+
+    async def _call(self, method: T.Callable[..., T.Any], *args: T.Any) -> T.Any:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(method, *args))
+
+    async def get_documents(self, document_ids: T.Optional[List[str]] = None) -> List[models_.Document]:
+        return await self._call(self.storage.get_documents, document_ids)
+
+    async def get_highlights(self, combined_text_hashes: List[str]) -> List[models_.Highlight]:
+        return await self._call(self.storage.get_highlights, combined_text_hashes)
+
+    async def save_models(self, models: Sequence[Union[models_.Document,
+                                                       models_.Highlight,
+                                                       models_.PendingHighlight]]) -> None:
+        await self._call(self.storage.save_models, models)
+
+    async def update_documents(self, documents: List[models_.Document]) -> None:
+        await self._call(self.storage.update_documents, documents)
+
+    async def get_pending_highlights(self) -> List[models_.Highlight]:
+        return await self._call(self.storage.get_pending_highlights)
+
+    async def clear_pending_highlights(self, combined_text_hashes: List[str]) -> None:
+        await self._call(self.storage.clear_pending_highlights, combined_text_hashes)
+
+    async def get_skipped_documents(self) -> List[models_.SkippedDocument]:
+        return await self._call(self.storage.get_skipped_documents)
+
+    async def save_skipped_documents(self, skipped_documents: List[models_.SkippedDocument]) -> None:
+        await self._call(self.storage.save_skipped_documents, skipped_documents)
+
+    async def clear_skipped_documents(self, document_ids: List[str]) -> None:
+        await self._call(self.storage.clear_skipped_documents, document_ids)
+
+    async def commit(self) -> None:
+        await self._call(self.storage.commit)
+
+    async def rollback(self) -> None:
+        await self._call(self.storage.rollback)
+
+    async def close(self) -> None:
+        self._executor.shutdown(wait=True)
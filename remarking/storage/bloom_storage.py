@@ -0,0 +1,270 @@
+import datetime
+import hashlib
+import logging
+import math
+import os
+import struct
+import tempfile
+import threading
+import typing as T
+from typing import List, Sequence, Set, Union
+
+from remarking import metrics
+from remarking import models as models_
+from remarking.storage import storage as storage_
+
+_MAGIC = b"RMBLOOM1"
+# bits, hash functions, items, capacity, mtime_ns and size of the storage file the filter was saved with
+_HEADER = struct.Struct("<8sQQQQqq")
+
+
+class BloomFilter():
+    """ Probabilistic set of strings.
+
+    Membership tests never return a false negative. False positives happen at roughly
+    ``error_rate`` once ``capacity`` items were added, and more often after that.
+
+    :param capacity: The number of items the filter is sized for.
+    :param error_rate: The false positive rate at capacity.
+    """
+
+    def __init__(self, capacity: int = 100000, error_rate: float = 0.01) -> None:
+        self.reset(capacity, error_rate)
+
+    def reset(self, capacity: int, error_rate: float) -> None:
+        """ Remove all items and resize the filter. """
+        self.capacity = max(capacity, 1)
+        self.num_bits = max(int(-self.capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.num_hashes = max(int(round(self.num_bits / self.capacity * math.log(2))), 1)
+        self.count = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item: str) -> T.Iterator[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = struct.unpack("<QQ", digest)
+        for i in range(self.num_hashes):
+            yield (first + i * second) % self.num_bits
+
+    def add(self, item: str) -> None:
+        """ Add item to the set. """
+        added = False
+        for position in self._positions(item):
+            byte, bit = divmod(position, 8)
+            if not self._bits[byte] & (1 << bit):
+                self._bits[byte] |= 1 << bit
+                added = True
+        if added:
+            self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        for position in self._positions(item):
+            byte, bit = divmod(position, 8)
+            if not self._bits[byte] & (1 << bit):
+                return False
+        return True
+
+    @property
+    def full(self) -> bool:
+        """ True once more items were added than the filter is sized for. """
+        return self.count > self.capacity
+
+    def save(self, path: str, source_stat: T.Tuple[int, int] = (0, 0)) -> None:
+        """ Atomically write the filter to path.
+
+        :param path: The file to write.
+        :param source_stat: The mtime in nanoseconds and the size of the storage file the filter describes.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        file_descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix=".remarking-bloom-")
+        try:
+            with os.fdopen(file_descriptor, "wb") as bloom_file:
+                bloom_file.write(_HEADER.pack(_MAGIC, self.num_bits, self.num_hashes, self.count,
+                                              self.capacity, *source_stat))
+                bloom_file.write(self._bits)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> T.Tuple['BloomFilter', T.Tuple[int, int]]:
+        """ Read a filter written by :meth:`save`.
+
+        Returns the filter and the storage file stat it was saved with.
+        Raises ValueError if path does not hold a valid filter.
+        """
+        with open(path, "rb") as bloom_file:
+            header = bloom_file.read(_HEADER.size)
+            bits = bloom_file.read()
+        if len(header) != _HEADER.size:
+            raise ValueError(f"{path} is not a bloom filter")
+        magic, num_bits, num_hashes, count, capacity, mtime_ns, size = _HEADER.unpack(header)
+        if magic != _MAGIC or len(bits) != (num_bits + 7) // 8:
+            raise ValueError(f"{path} is not a bloom filter")
+        bloom_filter = cls.__new__(cls)
+        bloom_filter.capacity = capacity
+        bloom_filter.num_bits = num_bits
+        bloom_filter.num_hashes = num_hashes
+        bloom_filter.count = count
+        bloom_filter._bits = bytearray(bits)
+        return bloom_filter, (mtime_ns, size)
+
+
+def _file_stat(path: T.Optional[str]) -> T.Tuple[int, int]:
+    if path is None or not os.path.exists(path):
+        return (0, 0)
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class BloomFilterStorage(storage_.Storage):
+    """ Storage decorator that skips :meth:`get_highlights` lookups for hashes that are definitely not stored.
+
+    A :class:`BloomFilter` of every stored highlight hash is kept in memory and updated on :meth:`commit`.
+    Only the hashes the filter reports as possibly stored are looked up in the wrapped storage,
+    so highlights that were never seen before cost no query.
+
+    When path is given the filter is saved there after every commit and loaded on start.
+    The filter is rebuilt from the wrapped storage when the file is missing or unreadable, when the file at
+    storage_path changed since the filter was saved, or when it holds more hashes than it was sized for.
+
+    :param storage: The storage to wrap.
+    :param path: The file the filter is saved to, or None to only keep it in memory.
+    :param storage_path: The file holding the wrapped storage, used to detect changes made without this filter.
+    :param error_rate: The false positive rate of the filter.
+    """
+
+    def __init__(self,
+                 storage: storage_.Storage,
+                 path: T.Optional[str] = None,
+                 storage_path: T.Optional[str] = None,
+                 error_rate: float = 0.01) -> None:
+        self.storage = storage
+        # The storage the filter is rebuilt from. Storages returned by for_account share the filter,
+        # so it must hold the highlights of every account.
+        self._unscoped_storage = storage
+        self.path = path
+        self.storage_path = storage_path
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self._uncommitted: Set[str] = set()
+        self._saved_stat = (0, 0)
+        self._filter = self._load()
+
+    def _load(self) -> BloomFilter:
+        if self.path is not None and os.path.exists(self.path):
+            try:
+                bloom_filter, source_stat = BloomFilter.load(self.path)
+            except (OSError, ValueError):
+                logging.warning(f"Rebuilding unreadable bloom filter {self.path}")
+            else:
+                if source_stat == _file_stat(self.storage_path) and not bloom_filter.full:
+                    self._saved_stat = source_stat
+                    return bloom_filter
+                logging.info(f"Rebuilding out of date bloom filter {self.path}")
+        self._filter = BloomFilter(error_rate=self.error_rate)
+        self.rebuild()
+        return self._filter
+
+    def rebuild(self) -> None:
+        """ Refill the filter with every highlight in the wrapped storage, resizing it to fit.
+
+        Storages returned by :meth:`for_account` refill it with the highlights of every account.
+        """
+        hashes = [highlight.hash for batch in self._unscoped_storage.iter_highlight_batches() for highlight in batch]
+        # The filter is shared with the storages returned by for_account, so it is refilled in place.
+        self._filter.reset(max(2 * len(hashes), 100000), self.error_rate)
+        for text_hash in hashes:
+            self._filter.add(text_hash)
+        self._save()
+
+    def _save(self) -> None:
+        if self.path is not None:
+            self._saved_stat = _file_stat(self.storage_path)
+            self._filter.save(self.path, self._saved_stat)
+
+    def get_documents(self, document_ids: T.Optional[List[str]] = None) -> List[models_.Document]:
+        return self.storage.get_documents(document_ids)
+
+    def get_highlights(self, combined_text_hashes: List[str]) -> List[models_.Highlight]:
+        if not combined_text_hashes:
+            return self.storage.get_highlights(combined_text_hashes)
+        with self._lock:
+            possible = [
+                text_hash for text_hash in combined_text_hashes
+                if text_hash in self._filter or text_hash in self._uncommitted
+            ]
+        metrics.BLOOM_FILTER_LOOKUPS.inc(len(possible), result="possible")
+        metrics.BLOOM_FILTER_LOOKUPS.inc(len(combined_text_hashes) - len(possible), result="skipped")
+        if not possible:
+            return []
+        return self.storage.get_highlights(possible)
+
+    def save_models(self, models: Sequence[Union[models_.Document,
+                                                 models_.Highlight,
+                                                 models_.PendingHighlight]]) -> None:
+        self.storage.save_models(models)
+        with self._lock:
+            self._uncommitted.update(model.hash for model in models if isinstance(model, models_.Highlight))
+
+    def update_documents(self, documents: List[models_.Document]) -> None:
+        self.storage.update_documents(documents)
+
+    def get_pending_highlights(self) -> List[models_.Highlight]:
+        return self.storage.get_pending_highlights()
+
+    def clear_pending_highlights(self, combined_text_hashes: List[str]) -> None:
+        self.storage.clear_pending_highlights(combined_text_hashes)
+
+    def get_skipped_documents(self) -> List[models_.SkippedDocument]:
+        return self.storage.get_skipped_documents()
+
+    def save_skipped_documents(self, skipped_documents: List[models_.SkippedDocument]) -> None:
+        self.storage.save_skipped_documents(skipped_documents)
+
+    def clear_skipped_documents(self, document_ids: List[str]) -> None:
+        self.storage.clear_skipped_documents(document_ids)
+
+    def iter_highlight_batches(self,
+                               since: T.Optional[datetime.datetime] = None,
+                               document_ids: T.Optional[List[str]] = None,
+                               batch_size: int = 1000) -> T.Iterator[List[models_.Highlight]]:
+        return self.storage.iter_highlight_batches(since, document_ids, batch_size)
+
+    def search_highlights(self, query: str, limit: int = 20) -> List[models_.Highlight]:
+        return self.storage.search_highlights(query, limit)
+
+    def commit(self) -> None:
+        self.storage.commit()
+        with self._lock:
+            added = bool(self._uncommitted)
+            for text_hash in self._uncommitted:
+                self._filter.add(text_hash)
+            self._uncommitted = set()
+            if self._filter.full:
+                self.rebuild()
+            elif added or _file_stat(self.storage_path) != self._saved_stat:
+                # Commits without new highlights, e.g. acknowledging them, still change the storage file,
+                # which would otherwise make the saved filter look out of date on the next start.
+                self._save()
+
+    def rollback(self) -> None:
+        self.storage.rollback()
+        with self._lock:
+            self._uncommitted = set()
+
+    def close(self) -> None:
+        self.storage.close()
+
+    def for_account(self, account: str) -> 'BloomFilterStorage':
+        storage = BloomFilterStorage.__new__(BloomFilterStorage)
+        storage.storage = self.storage.for_account(account)
+        storage._unscoped_storage = self._unscoped_storage
+        storage.path = self.path
+        storage.storage_path = self.storage_path
+        storage.error_rate = self.error_rate
+        storage._lock = self._lock
+        storage._uncommitted = set()
+        storage._saved_stat = self._saved_stat
+        storage._filter = self._filter
+        return storage
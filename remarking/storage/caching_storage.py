@@ -0,0 +1,206 @@
+import collections
+import datetime
+import typing as T
+from typing import Dict, List, Sequence, Set, Union
+
+from remarking import metrics
+from remarking import models as models_
+from remarking.storage import storage as storage_
+
+ModelT = T.TypeVar("ModelT", models_.Document, models_.Highlight)
+
+
+class _LRUCache(T.Generic[ModelT]):
+    """ Mapping of key to model that evicts the least recently used entries past max_size. """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._entries: "collections.OrderedDict[str, ModelT]" = collections.OrderedDict()
+
+    def get(self, key: str) -> T.Optional[ModelT]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, model: ModelT) -> None:
+        self._entries[key] = model
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _copy(model: ModelT) -> ModelT:
+    """ Return a detached copy so callers cannot change cached state by mutating returned models. """
+    return model.__class__(**model.to_dict())
+
+
+class CachingStorage(storage_.Storage):
+    """ Storage decorator that serves :meth:`get_documents` and :meth:`get_highlights` from memory.
+
+    Documents and highlights read from or written to the wrapped storage are kept in bounded LRU caches.
+    The ids of all stored documents and the hashes of all stored highlights are read once, on the first lookup,
+    so ids and hashes that are not stored are answered without a query. Lookups only query the wrapped storage
+    for entries that are stored but not cached. When there are more than max_keys documents or highlights,
+    their keys are not kept and every entry that is not cached is looked up.
+    Writes go through to the wrapped storage immediately, and reach the caches once they are committed.
+
+    The cache is only correct while nothing but this storage writes to the wrapped storage,
+    as when ``persist --watch`` owns its database.
+
+    Cache hits and misses are counted in :data:`remarking.metrics.REGISTRY`.
+
+    :param storage: The storage to wrap.
+    :param max_documents: The maximum number of documents to keep in memory.
+    :param max_highlights: The maximum number of highlights to keep in memory.
+    :param max_keys: The maximum number of document ids, and of highlight hashes, to keep in memory.
+    """
+
+    def __init__(self,
+                 storage: storage_.Storage,
+                 max_documents: int = 10000,
+                 max_highlights: int = 100000,
+                 max_keys: int = 1000000) -> None:
+        self.storage = storage
+        self.max_keys = max_keys
+        self._documents: _LRUCache[models_.Document] = _LRUCache(max_documents)
+        self._highlights: _LRUCache[models_.Highlight] = _LRUCache(max_highlights)
+        self._uncommitted: List[T.Union[models_.Document, models_.Highlight]] = []
+        self._keys_loaded = False
+        # None when the wrapped storage holds more than max_keys entries.
+        self._document_ids: T.Optional[Set[str]] = None
+        self._highlight_hashes: T.Optional[Set[str]] = None
+
+    def _load_keys(self) -> None:
+        """ Read the ids of all stored documents and the hashes of all stored highlights, once. """
+        if self._keys_loaded:
+            return
+        self._keys_loaded = True
+        documents = self.storage.get_documents()
+        if len(documents) <= self.max_keys:
+            self._document_ids = {doc.id for doc in documents}
+        for doc in documents[-self._documents.max_size:]:
+            self._documents.put(doc.id, _copy(doc))
+
+        highlight_hashes: Set[str] = set()
+        for batch in self.storage.iter_highlight_batches():
+            highlight_hashes.update(highlight.hash for highlight in batch)
+            if len(highlight_hashes) > self.max_keys:
+                return
+        self._highlight_hashes = highlight_hashes
+
+    def _uncommitted_keys(self) -> Set[str]:
+        return {model.id if isinstance(model, models_.Document) else model.hash for model in self._uncommitted}
+
+    def _cached_lookup(self,
+                       cache: _LRUCache[ModelT],
+                       keys: List[str],
+                       fetch: T.Callable[[List[str]], List[ModelT]],
+                       key_of: T.Callable[[ModelT], str],
+                       kind: str,
+                       stored_keys: T.Optional[Set[str]]) -> List[ModelT]:
+        """ Look keys up in cache, then in storage for those that may be stored.
+
+        :param stored_keys: The keys of every committed entry, or None if they are not known.
+        """
+        found: Dict[str, ModelT] = {}
+        missing = []
+        absent = 0
+        uncommitted_keys = self._uncommitted_keys() if stored_keys is not None else set()
+        for key in dict.fromkeys(keys):
+            cached = cache.get(key)
+            if cached is not None:
+                found[key] = cached
+            elif stored_keys is not None and key not in stored_keys and key not in uncommitted_keys:
+                absent += 1
+            else:
+                missing.append(key)
+        metrics.STORAGE_CACHE_HITS.inc(len(found) + absent, kind=kind)
+        metrics.STORAGE_CACHE_MISSES.inc(len(missing), kind=kind)
+        if missing:
+            for model in fetch(missing):
+                cache.put(key_of(model), _copy(model))
+                found[key_of(model)] = model
+        return [_copy(found[key]) for key in dict.fromkeys(keys) if key in found]
+
+    def get_documents(self, document_ids: T.Optional[List[str]] = None) -> List[models_.Document]:
+        if not document_ids:
+            return self.storage.get_documents(document_ids)
+        self._load_keys()
+        return self._cached_lookup(self._documents, document_ids, self.storage.get_documents,
+                                   lambda doc: doc.id, "document", self._document_ids)
+
+    def get_highlights(self, combined_text_hashes: List[str]) -> List[models_.Highlight]:
+        if not combined_text_hashes:
+            return self.storage.get_highlights(combined_text_hashes)
+        self._load_keys()
+        return self._cached_lookup(self._highlights, combined_text_hashes, self.storage.get_highlights,
+                                   lambda highlight: highlight.hash, "highlight", self._highlight_hashes)
+
+    def save_models(self, models: Sequence[Union[models_.Document,
+                                                 models_.Highlight,
+                                                 models_.PendingHighlight]]) -> None:
+        self.storage.save_models(models)
+        self._uncommitted.extend(_copy(model) for model in models
+                                 if isinstance(model, (models_.Document, models_.Highlight)))
+
+    def update_documents(self, documents: List[models_.Document]) -> None:
+        self.storage.update_documents(documents)
+        self._uncommitted.extend(_copy(document) for document in documents)
+
+    def get_pending_highlights(self) -> List[models_.Highlight]:
+        return self.storage.get_pending_highlights()
+
+    def clear_pending_highlights(self, combined_text_hashes: List[str]) -> None:
+        self.storage.clear_pending_highlights(combined_text_hashes)
+
+    def get_skipped_documents(self) -> List[models_.SkippedDocument]:
+        return self.storage.get_skipped_documents()
+
+    def save_skipped_documents(self, skipped_documents: List[models_.SkippedDocument]) -> None:
+        self.storage.save_skipped_documents(skipped_documents)
+
+    def clear_skipped_documents(self, document_ids: List[str]) -> None:
+        self.storage.clear_skipped_documents(document_ids)
+
+    def iter_highlight_batches(self,
+                               since: T.Optional[datetime.datetime] = None,
+                               document_ids: T.Optional[List[str]] = None,
+                               batch_size: int = 1000) -> T.Iterator[List[models_.Highlight]]:
+        return self.storage.iter_highlight_batches(since, document_ids, batch_size)
+
+    def search_highlights(self, query: str, limit: int = 20) -> List[models_.Highlight]:
+        return self.storage.search_highlights(query, limit)
+
+    def commit(self) -> None:
+        self.storage.commit()
+        for model in self._uncommitted:
+            if isinstance(model, models_.Document):
+                self._documents.put(model.id, model)
+                if self._document_ids is not None:
+                    self._document_ids.add(model.id)
+            else:
+                self._highlights.put(model.hash, model)
+                if self._highlight_hashes is not None:
+                    self._highlight_hashes.add(model.hash)
+        self._uncommitted = []
+        if self._document_ids is not None and len(self._document_ids) > self.max_keys:
+            self._document_ids = None
+        if self._highlight_hashes is not None and len(self._highlight_hashes) > self.max_keys:
+            self._highlight_hashes = None
+
+    def rollback(self) -> None:
+        self.storage.rollback()
+        self._uncommitted = []
+
+    def close(self) -> None:
+        self.storage.close()
+
+    def for_account(self, account: str) -> 'CachingStorage':
+        return CachingStorage(self.storage.for_account(account),
+                              max_documents=self._documents.max_size,
+                              max_highlights=self._highlights.max_size,
+                              max_keys=self.max_keys)
@@ -0,0 +1,280 @@
+import datetime
+import json
+import logging
+import os
+import tempfile
+import typing as T
+from typing import Dict, List, Sequence, Set, Type, Union
+
+from remarking import models as models_
+from remarking.storage import storage as storage_
+
+LOG_URL_SCHEME = "log://"
+""" Storage URLs starting with this scheme are opened with :class:`LogStorage`, e.g. ``log:///path/to/file.log`` """
+
+_FORMAT_HEADER = {"format": "remarking-log", "version": 1}
+
+
+class CorruptLogException(RuntimeError):
+    """ Raised when a storage log cannot be read """
+
+
+def is_log_url(url: str) -> bool:
+    """ Return True if url should be opened with :class:`LogStorage` """
+    return url.startswith(LOG_URL_SCHEME)
+
+
+def _datetime_columns(model_class: Type[models_.Base]) -> Set[str]:
+    return {
+        column.name for column in model_class.__table__.columns  # type: ignore
+        if column.type.python_type is datetime.datetime
+    }
+
+
+class LogStorage(storage_.Storage):
+    """ Storage backed by an append-only log of JSON records with an in-memory index.
+
+    Every saved document, highlight, pending marker and skip list entry is appended to the log file when :meth:`commit`
+    is called, followed by a commit marker. When opened, the log is replayed into an index held in memory
+    and records after the last commit marker, e.g. from a crash halfway through a commit, are discarded.
+
+    Once the log holds more than ``compaction_ratio`` times as many records as are live,
+    it is compacted by atomically replacing it with one record per live row.
+
+    Only one process should use a log at a time.
+
+    :param path: The path to the log file. It is created if it does not exist.
+    :param compaction_ratio: How many records per live row the log may hold before it is compacted.
+    :param min_compaction_records: Logs with fewer records than this are never compacted.
+    """
+
+    def __init__(self,
+                 path: str,
+                 compaction_ratio: float = 2.0,
+                 min_compaction_records: int = 1000) -> None:
+        if is_log_url(path):
+            path = path[len(LOG_URL_SCHEME):]
+        self.path = path
+        self.compaction_ratio = compaction_ratio
+        self.min_compaction_records = min_compaction_records
+        self._datetime_columns = {
+            "document": _datetime_columns(models_.Document),
+            "highlight": _datetime_columns(models_.Highlight),
+            "skipped_document": _datetime_columns(models_.SkippedDocument),
+        }
+        self._documents: Dict[str, Dict[str, T.Any]] = {}
+        self._highlights: Dict[str, Dict[str, T.Any]] = {}
+        self._pending: Set[str] = set()
+        self._skipped: Dict[str, Dict[str, T.Any]] = {}
+        self._log_records = 0
+        self._uncommitted: List[Dict[str, T.Any]] = []
+        self._load()
+
+    def _load(self) -> None:
+        """ Replay the log into the in-memory index. """
+        self._documents = {}
+        self._highlights = {}
+        self._pending = set()
+        self._skipped = {}
+        self._log_records = 0
+        self._uncommitted = []
+        if not os.path.exists(self.path):
+            self._rewrite([])
+            return
+
+        committed_size = 0
+        transaction: List[Dict[str, T.Any]] = []
+        with open(self.path, "rb") as log_file:
+            header = log_file.readline()
+            try:
+                if json.loads(header) != _FORMAT_HEADER:
+                    raise ValueError(header)
+            except ValueError as exc:
+                raise CorruptLogException(f"{self.path} is not a remarking storage log") from exc
+            committed_size = log_file.tell()
+            for line in log_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if record["op"] == "commit":
+                    for transaction_record in transaction:
+                        self._apply(transaction_record)
+                    self._log_records += len(transaction)
+                    transaction = []
+                    committed_size = log_file.tell()
+                else:
+                    transaction.append(record)
+
+        if transaction or committed_size != os.path.getsize(self.path):
+            logging.warning(f"Discarding an incomplete commit at the end of {self.path}")
+            with open(self.path, "rb+") as log_file:
+                log_file.truncate(committed_size)
+
+    def _apply(self, record: Dict[str, T.Any]) -> None:
+        operation = record["op"]
+        if operation == "document":
+            self._documents[record["row"]["id"]] = record["row"]
+        elif operation == "highlight":
+            self._highlights[record["row"]["hash"]] = record["row"]
+        elif operation == "pending":
+            self._pending.add(record["hash"])
+        elif operation == "delivered":
+            self._pending.discard(record["hash"])
+        elif operation == "skipped":
+            self._skipped[record["row"]["document_id"]] = record["row"]
+        elif operation == "unskipped":
+            self._skipped.pop(record["document_id"], None)
+        else:
+            raise CorruptLogException(f"Unknown record {operation} in {self.path}")
+
+    def _to_row(self, table: str, model: models_.ModelMixIn) -> Dict[str, T.Any]:
+        row = model.to_dict()
+        for column in self._datetime_columns[table]:
+            if row[column] is not None:
+                row[column] = row[column].isoformat()
+        return row
+
+    def _from_row(self, model_class: T.Any, table: str, row: Dict[str, T.Any]) -> T.Any:
+        values = dict(row)
+        for column in self._datetime_columns[table]:
+            if values.get(column) is not None:
+                values[column] = datetime.datetime.fromisoformat(values[column])
+        return model_class(**values)
+
+    def _record(self, record: Dict[str, T.Any]) -> None:
+        """ Apply a change to the index now and append it to the log on the next commit. """
+        self._apply(record)
+        self._uncommitted.append(record)
+
+    def save_models(self, models: Sequence[Union[models_.Document,
+                                                 models_.Highlight,
+                                                 models_.PendingHighlight]]) -> None:
+        for model in models:
+            if isinstance(model, models_.Document):
+                self._record({"op": "document", "row": self._to_row("document", model)})
+            elif isinstance(model, models_.Highlight):
+                self._record({"op": "highlight", "row": self._to_row("highlight", model)})
+            elif isinstance(model, models_.PendingHighlight):
+                self._record({"op": "pending", "hash": model.hash})
+
+    def update_documents(self, documents: List[models_.Document]) -> None:
+        for document in documents:
+            self._record({"op": "document", "row": self._to_row("document", document)})
+
+    def get_documents(self, document_ids: T.Optional[List[str]] = None) -> List[models_.Document]:
+        if document_ids:
+            rows = [self._documents[doc_id] for doc_id in dict.fromkeys(document_ids) if doc_id in self._documents]
+        else:
+            rows = list(self._documents.values())
+        return [self._from_row(models_.Document, "document", row) for row in rows]
+
+    def get_highlights(self, combined_text_hashes: T.Optional[List[str]] = None) -> List[models_.Highlight]:
+        if combined_text_hashes:
+            rows = [self._highlights[text_hash] for text_hash in dict.fromkeys(combined_text_hashes)
+                    if text_hash in self._highlights]
+        else:
+            rows = list(self._highlights.values())
+        return [self._from_row(models_.Highlight, "highlight", row) for row in rows]
+
+    def get_pending_highlights(self) -> List[models_.Highlight]:
+        return self.get_highlights(list(self._pending)) if self._pending else []
+
+    def clear_pending_highlights(self, combined_text_hashes: List[str]) -> None:
+        for text_hash in combined_text_hashes:
+            if text_hash in self._pending:
+                self._record({"op": "delivered", "hash": text_hash})
+
+    def get_skipped_documents(self) -> List[models_.SkippedDocument]:
+        return [self._from_row(models_.SkippedDocument, "skipped_document", row) for row in self._skipped.values()]
+
+    def save_skipped_documents(self, skipped_documents: List[models_.SkippedDocument]) -> None:
+        for skipped in skipped_documents:
+            self._record({"op": "skipped", "row": self._to_row("skipped_document", skipped)})
+
+    def clear_skipped_documents(self, document_ids: List[str]) -> None:
+        for document_id in document_ids:
+            if document_id in self._skipped:
+                self._record({"op": "unskipped", "document_id": document_id})
+
+    def iter_highlight_batches(self,
+                               since: T.Optional[datetime.datetime] = None,
+                               document_ids: T.Optional[List[str]] = None,
+                               batch_size: int = 1000) -> T.Iterator[List[models_.Highlight]]:
+        highlights = self.get_highlights()
+        if since is not None:
+            highlights = [highlight for highlight in highlights if highlight.extracted_at >= since]
+        if document_ids:
+            wanted = set(document_ids)
+            highlights = [highlight for highlight in highlights if highlight.document_id in wanted]
+        highlights.sort(key=lambda highlight: (highlight.extracted_at or datetime.datetime.min, highlight.hash))
+        for start in range(0, len(highlights), batch_size):
+            yield highlights[start:start + batch_size]
+
+    def search_highlights(self, query: str, limit: int = 20) -> List[models_.Highlight]:
+        terms = [term.lower() for term in query.split()]
+        if not terms:
+            return []
+        matches = []
+        for row in self._highlights.values():
+            document = self._documents.get(row["document_id"])
+            searchable = f"{row['text'] or ''} {document['name'] if document else ''}".lower()
+            if all(term in searchable for term in terms):
+                matches.append(row)
+        matches.sort(key=lambda row: row["extracted_at"] or "", reverse=True)
+        return [self._from_row(models_.Highlight, "highlight", row) for row in matches[:limit]]
+
+    def commit(self) -> None:
+        if not self._uncommitted:
+            return
+        lines = [json.dumps(record) for record in self._uncommitted]
+        lines.append(json.dumps({"op": "commit"}))
+        with open(self.path, "a") as log_file:
+            log_file.write("\n".join(lines) + "\n")
+            log_file.flush()
+            os.fsync(log_file.fileno())
+        self._log_records += len(self._uncommitted)
+        self._uncommitted = []
+        self._maybe_compact()
+
+    def rollback(self) -> None:
+        if self._uncommitted:
+            self._load()
+
+    def _live_records(self) -> List[Dict[str, T.Any]]:
+        return (
+            [{"op": "document", "row": row} for row in self._documents.values()] +
+            [{"op": "highlight", "row": row} for row in self._highlights.values()] +
+            [{"op": "pending", "hash": text_hash} for text_hash in sorted(self._pending)] +
+            [{"op": "skipped", "row": row} for row in self._skipped.values()]
+        )
+
+    def _maybe_compact(self) -> None:
+        live = len(self._documents) + len(self._highlights) + len(self._pending) + len(self._skipped)
+        if self._log_records >= self.min_compaction_records and self._log_records > live * self.compaction_ratio:
+            self.compact()
+
+    def compact(self) -> None:
+        """ Replace the log with one holding a record for each live row. Uncommitted changes are committed. """
+        self._uncommitted = []
+        records = self._live_records()
+        self._rewrite(records)
+        self._log_records = len(records)
+
+    def _rewrite(self, records: List[Dict[str, T.Any]]) -> None:
+        """ Atomically replace the log with the given records, committed together. """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        file_descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix=".remarking-log-")
+        try:
+            with os.fdopen(file_descriptor, "w") as log_file:
+                log_file.write(json.dumps(_FORMAT_HEADER) + "\n")
+                for record in records:
+                    log_file.write(json.dumps(record) + "\n")
+                if records:
+                    log_file.write(json.dumps({"op": "commit"}) + "\n")
+                log_file.flush()
+                os.fsync(log_file.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
@@ -1,50 +1,488 @@
+import datetime
+import hashlib
+import logging
 import typing as T
 from typing import List, Sequence, Union
 
 import sqlalchemy
-from sqlalchemy import orm
+from sqlalchemy import event, exc, orm
 
+from remarking import metrics
 from remarking import models as models_
 from remarking.storage import storage as storage_
 
 
+SCHEMA_VERSION = 5
+""" Version of the tables created by :func:`ensure_schema`. Increase it whenever the models change. """
+
+_schema_metadata = sqlalchemy.MetaData()
+schema_version_table = sqlalchemy.Table(
+    "remarking_schema_version", _schema_metadata,
+    sqlalchemy.Column("version", sqlalchemy.Integer, nullable=False),
+)
+""" Single row table holding the :data:`SCHEMA_VERSION` the database was last set up with. """
+
+highlight_text_table = sqlalchemy.Table(
+    "highlight_text", _schema_metadata,
+    sqlalchemy.Column("text_hash", sqlalchemy.String(64), primary_key=True),
+    sqlalchemy.Column("text", sqlalchemy.Text, nullable=False),
+)
+""" Content addressed highlight text, keyed by :func:`text_hash`.
+
+Highlights saved with the deduplicated text layout have no text of their own and reference a row of this table,
+so a passage highlighted in several documents is only stored once.
+"""
+
+highlight_table = models_.Highlight.__table__.to_metadata(sqlalchemy.MetaData())  # type: ignore
+""" The highlight table as it is stored, with the text_hash column referencing :data:`highlight_text_table`.
+
+The column is not part of :class:`remarking.models.Highlight`, highlights read from storage have their text filled in.
+"""
+highlight_table.append_column(sqlalchemy.Column("text_hash", sqlalchemy.String(64), nullable=True))
+
+
+def ensure_schema(bind: T.Union[sqlalchemy.engine.Engine, sqlalchemy.engine.Connection]) -> bool:
+    """ Create missing tables and columns unless the database was already set up for :data:`SCHEMA_VERSION`.
+
+    Returns True if the schema had to be set up.
+
+    :param bind: An engine, or a connection whose transaction the schema is set up in.
+    """
+    if isinstance(bind, sqlalchemy.engine.Engine):
+        with bind.begin() as connection:
+            return ensure_schema(connection)
+    _schema_metadata.create_all(bind)
+    version = bind.execute(sqlalchemy.select(schema_version_table.c.version)).scalar()
+    if version == SCHEMA_VERSION:
+        return False
+    logging.info(f"Setting up database schema version {SCHEMA_VERSION}, it was at {version}")
+    models_.Base.metadata.create_all(bind)
+    add_missing_columns(bind)
+    bind.execute(schema_version_table.delete())
+    bind.execute(schema_version_table.insert().values(version=SCHEMA_VERSION))
+    return True
+
+
+def add_missing_columns(bind: T.Union[sqlalchemy.engine.Engine, sqlalchemy.engine.Connection]) -> None:
+    """ Add columns that were added to the models after their table was created.
+
+    Only nullable columns can be added this way, which is all columns added since the first release.
+
+    :param bind: An engine, or a connection whose transaction the columns are added in.
+    """
+    if isinstance(bind, sqlalchemy.engine.Engine):
+        with bind.begin() as connection:
+            add_missing_columns(connection)
+        return
+    inspector = sqlalchemy.inspect(bind)
+    for table in models_.Base.metadata.sorted_tables:
+        if table.name == highlight_table.name:
+            table = highlight_table
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            column_type = column.type.compile(dialect=bind.dialect)
+            bind.execute(sqlalchemy.text(
+                f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+            ))
+
+
+def count_round_trips(engine: sqlalchemy.engine.Engine) -> None:
+    """ Count the statements sent through engine, and those that failed, in :mod:`remarking.metrics`. """
+
+    def before_cursor_execute(*args: T.Any) -> None:
+        metrics.DB_ROUND_TRIPS.inc()
+
+    def handle_error(*args: T.Any) -> None:
+        metrics.DB_ERRORS.inc()
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+
+
+def create_search_index(bind: T.Union[sqlalchemy.engine.Engine, sqlalchemy.engine.Connection]) -> bool:
+    """ Create the SQLite FTS5 table indexing highlight text and document names, and fill it if it is out of date.
+
+    Returns False if the database is not SQLite or SQLite was built without FTS5.
+
+    :param bind: An engine, or a connection whose transaction the index is created in.
+    """
+    if bind.dialect.name != "sqlite":
+        return False
+    if isinstance(bind, sqlalchemy.engine.Engine):
+        with bind.begin() as connection:
+            return create_search_index(connection)
+    try:
+        bind.execute(sqlalchemy.text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS highlight_fts USING fts5("
+            "text, document_name, hash UNINDEXED, document_id UNINDEXED, tokenize='porter unicode61')"
+        ))
+    except exc.OperationalError:
+        logging.info("SQLite FTS5 is not available, searching highlights will not use an index")
+        return False
+
+    indexed = bind.execute(sqlalchemy.text("SELECT count(*) FROM highlight_fts")).scalar()
+    stored = bind.execute(sqlalchemy.text("SELECT count(*) FROM highlight")).scalar()
+    if indexed != stored:
+        logging.info(f"Rebuilding search index for {stored} highlights")
+        bind.execute(sqlalchemy.text("DELETE FROM highlight_fts"))
+        bind.execute(sqlalchemy.text(
+            "INSERT INTO highlight_fts (text, document_name, hash, document_id) "
+            "SELECT coalesce(highlight.text, highlight_text.text), document.name, highlight.hash, highlight.document_id "
+            "FROM highlight LEFT JOIN highlight_text ON highlight_text.text_hash = highlight.text_hash "
+            "LEFT JOIN document ON document.id = highlight.document_id"
+        ))
+    return True
+
+
+def index_highlights(session: orm.Session,
+                     highlights: List[models_.Highlight],
+                     documents: List[models_.Document]) -> None:
+    """ Add highlights to the search index created by :func:`create_search_index`,
+    in the same transaction as the highlights themselves.
+
+    :param documents: Documents saved along with the highlights, whose names are not in the database yet.
+    """
+    if not highlights:
+        return
+    document_names = {doc.id: doc.name for doc in documents}
+    missing_ids = {highlight.document_id for highlight in highlights} - set(document_names)
+    if missing_ids:
+        document_names.update(
+            session.query(models_.Document.id, models_.Document.name).filter(
+                models_.Document.id.in_(missing_ids)
+            ).all()
+        )
+    session.execute(
+        sqlalchemy.text("INSERT INTO highlight_fts (text, document_name, hash, document_id) "
+                        "VALUES (:text, :document_name, :hash, :document_id)"),
+        [{"text": highlight.text,
+          "document_name": document_names.get(highlight.document_id),
+          "hash": highlight.hash,
+          "document_id": highlight.document_id} for highlight in highlights]
+    )
+
+
+def index_document_names(session: orm.Session, documents: List[models_.Document]) -> None:
+    """ Update the document names of indexed highlights after documents were renamed. """
+    if documents:
+        session.execute(
+            sqlalchemy.text("UPDATE highlight_fts SET document_name = :name WHERE document_id = :id"),
+            [{"name": doc.name, "id": doc.id} for doc in documents]
+        )
+
+
+def to_match_expression(query: str) -> str:
+    """ Quote every term of query so that punctuation in user input is not read as FTS5 query syntax.
+
+    The terms are ANDed together.
+    """
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+def text_hash(text: str) -> str:
+    """ Return the key of text in :data:`highlight_text_table`. """
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def uses_deduplicated_text(bind: T.Union[sqlalchemy.engine.Engine, sqlalchemy.engine.Connection]) -> bool:
+    """ Return True if highlight text in the database was moved to :data:`highlight_text_table`. """
+    statement = sqlalchemy.select(highlight_text_table.c.text_hash).limit(1)
+    if isinstance(bind, sqlalchemy.engine.Engine):
+        with bind.connect() as connection:
+            return connection.execute(statement).first() is not None
+    return bind.execute(statement).first() is not None
+
+
+def select_highlights() -> T.Any:
+    """ Return a Core select of highlight rows whose text is read from :data:`highlight_text_table` when moved there.
+
+    Rows have the columns of :class:`remarking.models.Highlight` whichever layout they are stored in.
+    """
+    text_column = sqlalchemy.func.coalesce(highlight_table.c.text, highlight_text_table.c.text)
+    return sqlalchemy.select(*[
+        text_column.label("text") if column.name == "text" else highlight_table.c[column.name]
+        for column in models_.Highlight.__table__.columns  # type: ignore
+    ]).select_from(highlight_table.outerjoin(
+        highlight_text_table, highlight_text_table.c.text_hash == highlight_table.c.text_hash
+    ))
+
+
+def save_models_in(session: orm.Session,
+                   models: Sequence[Union[models_.Document, models_.Highlight, models_.PendingHighlight]],
+                   deduplicate_text: bool,
+                   search_index: bool) -> None:
+    """ Save models in the transaction of session.
+
+    :param deduplicate_text: If highlight text should be saved to :data:`highlight_text_table`.
+    :param search_index: If highlights should be added to the index created by :func:`create_search_index`.
+    """
+    documents = [model for model in models if isinstance(model, models_.Document)]
+    highlights = [model for model in models if isinstance(model, models_.Highlight)]
+    session.bulk_save_objects(documents)
+    if deduplicate_text and highlights:
+        _save_deduplicated_highlights(session, highlights)
+    else:
+        session.bulk_save_objects(highlights)
+    session.bulk_save_objects([model for model in models if isinstance(model, models_.PendingHighlight)])
+    if search_index:
+        index_highlights(session, highlights, documents)
+
+
+def _save_deduplicated_highlights(session: orm.Session, highlights: List[models_.Highlight]) -> None:
+    texts = {text_hash(highlight.text): highlight.text for highlight in highlights if highlight.text is not None}
+    _insert_missing_texts(session, texts)
+    rows = []
+    for highlight in highlights:
+        row = highlight.to_dict()
+        row["text_hash"] = text_hash(row["text"]) if row["text"] is not None else None
+        row["text"] = None
+        rows.append(row)
+    session.execute(highlight_table.insert(), rows)
+
+
+def _insert_missing_texts(bind: T.Union[orm.Session, sqlalchemy.engine.Connection], texts: T.Dict[str, str]) -> None:
+    if not texts:
+        return
+    existing = set(bind.execute(
+        sqlalchemy.select(highlight_text_table.c.text_hash).where(highlight_text_table.c.text_hash.in_(list(texts)))
+    ).scalars())
+    missing = [{"text_hash": key, "text": text} for key, text in texts.items() if key not in existing]
+    if missing:
+        bind.execute(highlight_text_table.insert(), missing)
+
+
+def deduplicate_highlight_text(bind: T.Union[sqlalchemy.engine.Engine, sqlalchemy.engine.Connection],
+                               batch_size: int = 1000) -> int:
+    """ Move the text of highlights saved with their own text to :data:`highlight_text_table`.
+
+    Once any text was moved, :class:`SqlAlchemyStorage` saves new highlights the same way.
+    Returns the number of highlights whose text was moved.
+
+    :param bind: An engine, or a connection whose transaction the text is moved in.
+    :param batch_size: The number of highlights moved per statement.
+    """
+    if isinstance(bind, sqlalchemy.engine.Engine):
+        with bind.begin() as connection:
+            return deduplicate_highlight_text(connection, batch_size)
+    moved = 0
+    update = highlight_table.update().where(
+        highlight_table.c.hash == sqlalchemy.bindparam("highlight_hash")
+    ).values(text=None, text_hash=sqlalchemy.bindparam("new_text_hash"))
+    while True:
+        rows = bind.execute(
+            sqlalchemy.select(highlight_table.c.hash, highlight_table.c.text).where(
+                highlight_table.c.text_hash.is_(None), highlight_table.c.text.isnot(None)
+            ).limit(batch_size)
+        ).all()
+        if not rows:
+            return moved
+        hashes = {row.hash: text_hash(row.text) for row in rows}
+        _insert_missing_texts(bind, {hashes[row.hash]: row.text for row in rows})
+        bind.execute(update, [
+            {"highlight_hash": highlight_hash, "new_text_hash": new_text_hash}
+            for highlight_hash, new_text_hash in hashes.items()
+        ])
+        moved += len(rows)
+
+
 class SqlAlchemyStorage(storage_.Storage):
-    """ Storage implmentation for SqlAlchemy """
+    """ Storage implmentation for SqlAlchemy
+
+    Tables are only created or altered when the database was set up for an older :data:`SCHEMA_VERSION`.
+    Reads are Core selects whose rows are turned into detached models, so nothing accumulates in the session.
 
-    def __init__(self, db_string: str, echo: bool = False) -> None:
-        self._engine = sqlalchemy.create_engine(db_string, echo=echo)
+    Close the storage, or use it as a context manager, to return its connection to the pool
+    and dispose of the pool.
+
+    :param db_string: The SqlAlchemy connection string.
+    :param echo: If SqlAlchemy should log all statements.
+    :param account: When set, documents saved are tagged with this account name, and documents, highlights
+                    and pending highlights are only read and cleared for documents tagged with it.
+    :param pool_size: The number of connections kept open in the pool. Defaults to the SqlAlchemy default.
+    :param max_overflow: The number of connections that may be opened beyond pool_size when all are in use.
+    :param pool_recycle: Seconds after which pooled connections are replaced, for servers that drop idle connections.
+    :param deduplicate_text: If highlight text should be saved once per distinct text in
+                             :data:`highlight_text_table`. Defaults to doing so once :func:`deduplicate_highlight_text`
+                             was run on the database. Highlights are read the same way in either layout.
+    """
+
+    def __init__(self,
+                 db_string: str,
+                 echo: bool = False,
+                 account: T.Optional[str] = None,
+                 pool_size: T.Optional[int] = None,
+                 max_overflow: T.Optional[int] = None,
+                 pool_recycle: T.Optional[int] = None,
+                 deduplicate_text: T.Optional[bool] = None) -> None:
+        pool_options = {
+            name: value for name, value in
+            (("pool_size", pool_size), ("max_overflow", max_overflow), ("pool_recycle", pool_recycle))
+            if value is not None
+        }
+        self._engine = sqlalchemy.create_engine(db_string, echo=echo, **pool_options)
+        count_round_trips(self._engine)
         self.echo = echo
+        self.account = account
+        self._owns_engine = True
         self._sessionmaker = orm.sessionmaker(bind=self._engine)
-        models_.Base.metadata.create_all(self._engine)
+        ensure_schema(self._engine)
+        self._search_index = create_search_index(self._engine)
+        self.deduplicate_text = uses_deduplicated_text(self._engine) if deduplicate_text is None else deduplicate_text
         self._session = self._sessionmaker()
 
+    def for_account(self, account: str) -> 'SqlAlchemyStorage':
+        storage = SqlAlchemyStorage.__new__(SqlAlchemyStorage)
+        storage._engine = self._engine
+        storage.echo = self.echo
+        storage.account = account
+        storage._owns_engine = False
+        storage._search_index = self._search_index
+        storage.deduplicate_text = self.deduplicate_text
+        storage._sessionmaker = self._sessionmaker
+        storage._session = self._sessionmaker()
+        return storage
+
+    def close(self) -> None:
+        """ Close the session. The connection pool is disposed of unless it is shared with the storage
+        this one was created from by :meth:`for_account`.
+        """
+        self._session.close()
+        if self._owns_engine:
+            self._engine.dispose()
+
+    def deduplicate_highlight_text(self, batch_size: int = 1000) -> int:
+        """ Move the text of stored highlights to :data:`highlight_text_table` and save new highlights there.
+
+        Returns the number of highlights whose text was moved. See :func:`deduplicate_highlight_text`.
+        """
+        moved = deduplicate_highlight_text(self._engine, batch_size)
+        self.deduplicate_text = True
+        return moved
+
+    def _select_models(self, model_class: T.Any, statement: T.Any) -> List[T.Any]:
+        """ Run a Core select in the session's transaction and build a detached model from each row. """
+        return [model_class(**row._mapping) for row in self._session.execute(statement)]
+
+    def _scope_to_account(self, statement: T.Any, document_id_column: T.Any) -> T.Any:
+        """ Restrict a statement to rows whose document_id_column references a document of :attr:`account`. """
+        if self.account is None:
+            return statement
+        document_table = models_.Document.__table__
+        return statement.where(document_id_column.in_(
+            sqlalchemy.select(document_table.c.id).where(document_table.c.account == self.account)
+        ))
+
+    def _tag_documents(self, models: T.Iterable[T.Any]) -> None:
+        if self.account is None:
+            return
+        for model in models:
+            if isinstance(model, models_.Document):
+                model.account = self.account
+
     def save_models(self, models: Sequence[Union[models_.Document,
-                    models_.Highlight]]) -> None:
-        self._session.bulk_save_objects(models)
+                    models_.Highlight, models_.PendingHighlight]]) -> None:
+        self._tag_documents(models)
+        save_models_in(self._session, models, self.deduplicate_text, self._search_index)
 
     def update_documents(self, documents: List[models_.Document]) -> None:
+        self._tag_documents(documents)
         self._session.bulk_update_mappings(models_.Document, [doc.to_dict() for doc in documents])
+        if self._search_index:
+            index_document_names(self._session, documents)
+
+    def iter_highlight_batches(self,
+                               since: T.Optional[datetime.datetime] = None,
+                               document_ids: T.Optional[List[str]] = None,
+                               batch_size: int = 1000) -> T.Iterator[List[models_.Highlight]]:
+        statement = select_highlights().order_by(highlight_table.c.extracted_at, highlight_table.c.hash)
+        if since is not None:
+            statement = statement.where(highlight_table.c.extracted_at >= since)
+        if document_ids:
+            statement = statement.where(highlight_table.c.document_id.in_(document_ids))
+        statement = self._scope_to_account(statement, highlight_table.c.document_id)
+
+        # Rows are read with a server side cursor and turned into detached models without going
+        # through the session, so nothing accumulates in its identity map.
+        with self._engine.connect() as connection:
+            result = connection.execution_options(stream_results=True).execute(statement)
+            for rows in result.partitions(batch_size):
+                yield [models_.Highlight(**row._mapping) for row in rows]
+
+    def search_highlights(self, query: str, limit: int = 20) -> List[models_.Highlight]:
+        if not query.split():
+            return []
+        if self._search_index:
+            statement = select_highlights().join(
+                sqlalchemy.table("highlight_fts", sqlalchemy.column("hash")),
+                sqlalchemy.literal_column("highlight_fts.hash") == highlight_table.c.hash
+            ).where(
+                sqlalchemy.text("highlight_fts MATCH :query")
+            ).order_by(sqlalchemy.literal_column("highlight_fts.rank")).limit(limit).params(
+                query=to_match_expression(query)
+            )
+        else:
+            document_table = models_.Document.__table__
+            statement = select_highlights().outerjoin(
+                document_table, document_table.c.id == highlight_table.c.document_id
+            )
+            text_column = sqlalchemy.func.coalesce(highlight_table.c.text, highlight_text_table.c.text)
+            for term in query.split():
+                pattern = f"%{term}%"
+                statement = statement.where(
+                    sqlalchemy.or_(text_column.ilike(pattern), document_table.c.name.ilike(pattern))
+                )
+            statement = statement.order_by(highlight_table.c.extracted_at.desc()).limit(limit)
+        return self._select_models(models_.Highlight, self._scope_to_account(statement, highlight_table.c.document_id))
 
     def get_documents(self, document_ids: T.Optional[List[str]] = None) -> List[models_.Document]:
-        partial_query = self._session.query(models_.Document)
+        table = models_.Document.__table__
+        statement = sqlalchemy.select(table)
         if document_ids:
-            partial_query = partial_query.filter(
-                models_.Document.id.in_(document_ids))
-        documents = partial_query.all()
-        for document in documents:
-            self._session.expunge(document)
-        return documents
+            statement = statement.where(table.c.id.in_(document_ids))
+        return self._select_models(models_.Document, self._scope_to_account(statement, table.c.id))
 
     def get_highlights(self, combined_text_hashes: T.Optional[List[str]] = None) -> List[models_.Highlight]:
-        partial_query = self._session.query(models_.Highlight)
+        statement = select_highlights()
         if combined_text_hashes:
-            partial_query = partial_query.filter(
-                models_.Highlight.hash.in_(combined_text_hashes)
-            )
-        highlights = partial_query.all()
-        for highlight in highlights:
-            self._session.expunge(highlight)
-        return highlights
+            statement = statement.where(highlight_table.c.hash.in_(combined_text_hashes))
+        return self._select_models(models_.Highlight, self._scope_to_account(statement, highlight_table.c.document_id))
+
+    def get_pending_highlights(self) -> List[models_.Highlight]:
+        pending_table = models_.PendingHighlight.__table__
+        statement = select_highlights().where(highlight_table.c.hash.in_(sqlalchemy.select(pending_table.c.hash)))
+        return self._select_models(models_.Highlight, self._scope_to_account(statement, highlight_table.c.document_id))
+
+    def clear_pending_highlights(self, combined_text_hashes: List[str]) -> None:
+        if not combined_text_hashes:
+            return
+        pending_table = models_.PendingHighlight.__table__
+        account_hashes = self._scope_to_account(
+            sqlalchemy.select(highlight_table.c.hash).where(highlight_table.c.hash.in_(combined_text_hashes)),
+            highlight_table.c.document_id
+        )
+        self._session.execute(pending_table.delete().where(pending_table.c.hash.in_(account_hashes)))
+
+    def get_skipped_documents(self) -> List[models_.SkippedDocument]:
+        return self._select_models(models_.SkippedDocument, sqlalchemy.select(models_.SkippedDocument.__table__))
+
+    def save_skipped_documents(self, skipped_documents: List[models_.SkippedDocument]) -> None:
+        if not skipped_documents:
+            return
+        self.clear_skipped_documents([skipped.document_id for skipped in skipped_documents])
+        self._session.execute(models_.SkippedDocument.__table__.insert(),
+                              [skipped.to_dict() for skipped in skipped_documents])
+
+    def clear_skipped_documents(self, document_ids: List[str]) -> None:
+        if not document_ids:
+            return
+        self._session.execute(models_.SkippedDocument.__table__.delete().where(
+            models_.SkippedDocument.document_id.in_(document_ids)
+        ))
 
     def commit(self) -> None:
         self._session.commit()
+
+    def rollback(self) -> None:
+        self._session.rollback()
@@ -1,3 +1,4 @@
+import datetime
 import typing as T
 from abc import ABCMeta, abstractmethod
 from typing import List, Sequence, Union
@@ -9,8 +10,27 @@ class Storage(metaclass=ABCMeta):
     """ Storage interface
 
         All changes to storage should be committed only when commit is called.
+
+        Storage can be used as a context manager, which closes it on exit.
+        Uncommitted changes are rolled back when the block raises.
     """
 
+    def __enter__(self) -> 'Storage':
+        return self
+
+    def __exit__(self, exc_type: T.Any, exc_value: T.Any, traceback: T.Any) -> None:
+        try:
+            if exc_type is not None:
+                self.rollback()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """ Release the connections and other resources held by storage. It should not be used afterwards.
+
+        Uncommitted changes are discarded.
+        """
+
     @abstractmethod
     def get_documents(self, document_ids: T.Optional[List[str]] = None) -> List[models_.Document]:
         """ Return all documents with matching ID.
@@ -24,7 +44,9 @@ class Storage(metaclass=ABCMeta):
         """
 
     @abstractmethod
-    def save_models(self, models: Sequence[Union[models_.Document, models_.Highlight]]) -> None:
+    def save_models(self, models: Sequence[Union[models_.Document,
+                                                 models_.Highlight,
+                                                 models_.PendingHighlight]]) -> None:
         """ Save passed models into storage """
 
     @abstractmethod
@@ -33,10 +55,71 @@ class Storage(metaclass=ABCMeta):
         The passed models must already exist in storage.
         """
 
+    def get_pending_highlights(self) -> List[models_.Highlight]:
+        """ Return all highlights that have a matching :class:`models.PendingHighlight`
+
+        Storage that does not keep pending markers returns nothing, highlights are then only returned by the run
+        that extracted them.
+        """
+        return []
+
+    def clear_pending_highlights(self, combined_text_hashes: List[str]) -> None:
+        """ Remove the pending marker of the highlights with matching hashes """
+
     @abstractmethod
     def commit(self) -> None:
         """ Commit changes to storage """
 
+    def rollback(self) -> None:
+        """ Discard all changes made since the last commit
+
+        Storage that cannot roll back keeps the changes.
+        """
+
+    def get_skipped_documents(self) -> List[models_.SkippedDocument]:
+        """ Return the documents skipped because they exceeded the limits of extractors.
+
+        Storage that does not keep a skip list returns nothing, skipped documents are then retried every run.
+        """
+        return []
+
+    def save_skipped_documents(self, skipped_documents: List[models_.SkippedDocument]) -> None:
+        """ Add documents to the skip list, replacing earlier entries for the same documents. """
+
+    def clear_skipped_documents(self, document_ids: List[str]) -> None:
+        """ Remove documents from the skip list """
+
+    def iter_highlight_batches(self,
+                               since: T.Optional[datetime.datetime] = None,
+                               document_ids: T.Optional[List[str]] = None,
+                               batch_size: int = 1000) -> T.Iterator[List[models_.Highlight]]:
+        """ Iterate over stored highlights in batches of at most batch_size, ordered by extraction time.
+
+        Unlike :meth:`get_highlights`, highlights are read from storage one batch at a time
+        so that exporting every highlight does not load them all into memory.
+
+        :param since: Only return highlights extracted at or after this time.
+        :param document_ids: Only return highlights of these documents.
+        :param batch_size: The number of highlights to read from storage at a time.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not support iterating over highlights")
+
+    def search_highlights(self, query: str, limit: int = 20) -> List[models_.Highlight]:
+        """ Return up to limit highlights whose text or document name contains every term in query.
+
+        The best matches are returned first.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not support searching highlights")
+
+    def for_account(self, account: str) -> 'Storage':
+        """ Return a storage for syncing the given account.
+
+        The returned storage tags the documents it saves with the account, and only reads and clears the documents,
+        highlights and pending highlights of the account. It may be used from a different thread than this storage.
+        Implementations should share expensive resources such as connection pools.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not support syncing several accounts")
+
 
 # TODO: This doesn't seem like a great idea? Then it means any time we use any storage
 # we won't have any guarantees of something we store being there...
@@ -51,11 +134,34 @@ class NoStorage(Storage):
     def get_highlights(self, combined_text_hashes: List[str]) -> List[models_.Highlight]:
         return []
 
-    def save_models(self, models: Sequence[Union[models_.Document, models_.Highlight]]) -> None:
+    def save_models(self, models: Sequence[Union[models_.Document,
+                                                 models_.Highlight,
+                                                 models_.PendingHighlight]]) -> None:
         pass
 
     def update_documents(self, documents: List[models_.Document]) -> None:
         pass
 
+    def get_pending_highlights(self) -> List[models_.Highlight]:
+        return []
+
+    def clear_pending_highlights(self, combined_text_hashes: List[str]) -> None:
+        pass
+
     def commit(self) -> None:
         pass
+
+    def rollback(self) -> None:
+        pass
+
+    def iter_highlight_batches(self,
+                               since: T.Optional[datetime.datetime] = None,
+                               document_ids: T.Optional[List[str]] = None,
+                               batch_size: int = 1000) -> T.Iterator[List[models_.Highlight]]:
+        return iter([])
+
+    def search_highlights(self, query: str, limit: int = 20) -> List[models_.Highlight]:
+        return []
+
+    def for_account(self, account: str) -> Storage:
+        return self
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# pylint: disable=all
+""" Compare normalizing highlights with their documents by filtering full rows and by projecting columns.
+
+Usage: scripts/benchmark_normalize.py [number of highlights]
+"""
+
+import datetime
+import gc
+import sys
+import time
+import typing as T
+
+from remarking import models
+from remarking.cli import common
+
+COLUMN_SELECTIONS = {
+    "csv/table default": ["highlight_text", "document_name", "highlight_page_number"],
+    "all columns": None,
+}
+
+
+def create_models(count: int) -> T.Tuple[T.List[models.Document], T.List[models.Highlight]]:
+    documents = [models.Document(id=f"document-{index}", version=1, modified_client=datetime.datetime.now(),
+                                 type="DocumentType", name=f"Document {index}", current_page=0,
+                                 bookmarked=False, parent="") for index in range(100)]
+    highlights = [models.Highlight.create_highlight(f"document-{index % 100}", f"highlight {index}",
+                                                    index % 300, "bench") for index in range(count)]
+    return documents, highlights
+
+
+def filter_full_rows(documents: T.List[models.Document],
+                     highlights: T.List[models.Highlight],
+                     columns: T.Optional[T.List[str]]) -> T.List[T.Dict[str, T.Any]]:
+    """ Build every column of every row, then drop the unselected ones. """
+    mappings = common.generate_normalized_column_mappings()
+    document_lookup = {doc['id']: doc for doc in (doc.to_dict() for doc in documents)}
+    rows = []
+    for highlight in (highlight.to_dict() for highlight in highlights):
+        row = {mappings['highlight'][key]: value for key, value in highlight.items()}
+        document = document_lookup[highlight['document_id']]
+        row.update({mappings['document'][key]: value for key, value in document.items()})
+        rows.append(row)
+    if columns is not None:
+        for row in rows:
+            for key in [key for key in row if key not in columns]:
+                row.pop(key)
+    return rows
+
+
+def seconds(function: T.Callable[[], T.Any]) -> float:
+    gc.collect()
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    documents, highlights = create_models(count)
+    print(f"{count} highlights")
+    print(f"{'columns':<20} {'full rows (s)':>14} {'projected (s)':>14}")
+    for name, columns in COLUMN_SELECTIONS.items():
+        assert filter_full_rows(documents, highlights[:1000], columns) == \
+            common.get_column_filtered_highlights_and_header(documents, highlights[:1000], columns)[0]
+        full = seconds(lambda: filter_full_rows(documents, highlights, columns))
+        projected = seconds(lambda: common.get_column_filtered_highlights_and_header(documents, highlights, columns))
+        print(f"{name:<20} {full:>14.2f} {projected:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# pylint: disable=all
+""" Compare startup time and highlight dedupe throughput of LogStorage and SqlAlchemyStorage.
+
+Usage: scripts/benchmark_storage.py [number of stored highlights]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import typing as T
+
+from remarking import models
+from remarking.storage import log_storage, sqlalchemy_storage
+
+STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+from remarking.cli import common
+common.create_storage({url!r})
+print(time.perf_counter() - start)
+"""
+
+
+def create_highlights(count: int) -> T.List[models.Highlight]:
+    return [models.Highlight.create_highlight(f"document-{index % 100}", f"highlight {index}", index % 300, "bench")
+            for index in range(count)]
+
+
+def fill(storage: T.Any, highlights: T.List[models.Highlight]) -> None:
+    for start in range(0, len(highlights), 1000):
+        storage.save_models(highlights[start:start + 1000])
+        storage.commit()
+
+
+def startup_seconds(url: str, runs: int = 5) -> float:
+    """ Best of runs, measured in a fresh interpreter so imports are included. """
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT.format(url=url)],
+                                check=True, capture_output=True, text=True).stdout
+        timings.append(float(output))
+    return min(timings)
+
+
+def dedupe_per_second(storage: T.Any, highlights: T.List[models.Highlight], batch_size: int = 20) -> float:
+    """ Highlights checked per second by looking up batches of hashes, half of which are stored. """
+    hashes = [highlight.hash for highlight in highlights[:5000]]
+    hashes += [highlight.hash + "-new" for highlight in highlights[:5000]]
+    start = time.perf_counter()
+    for index in range(0, len(hashes), batch_size):
+        storage.get_highlights(hashes[index:index + batch_size])
+    return len(hashes) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    highlights = create_highlights(count)
+    with tempfile.TemporaryDirectory() as directory:
+        urls = {
+            "LogStorage": f"log://{os.path.join(directory, 'bench.log')}",
+            "SqlAlchemyStorage (sqlite)": f"sqlite:///{os.path.join(directory, 'bench.sqlite3')}",
+        }
+        storages = {
+            "LogStorage": log_storage.LogStorage(urls["LogStorage"]),
+            "SqlAlchemyStorage (sqlite)": sqlalchemy_storage.SqlAlchemyStorage(urls["SqlAlchemyStorage (sqlite)"]),
+        }
+        print(f"{count} stored highlights")
+        print(f"{'storage':<28} {'startup (s)':>12} {'dedupe (highlights/s)':>22}")
+        for name, storage in storages.items():
+            fill(storage, highlights)
+            print(f"{name:<28} {startup_seconds(urls[name]):>12.3f} {dedupe_per_second(storage, highlights):>22.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# pylint: disable=no-self-use,missing-function-docstring
+import sys
+from typing import List
+from unittest.mock import MagicMock
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from click.testing import CliRunner
+
+from remarking import models
+from remarking.cli import app as app_
+from remarking.cli import cli, common, log
+from remarking.cli.commands import arrow_writer_command
+
+pyarrow = pytest.importorskip("pyarrow")
+pytest.importorskip("pyarrow.ipc")
+pytest.importorskip("pyarrow.parquet")
+
+
+@pytest.fixture()
+def typed_documents(documents: List[models.Document]) -> List[models.Document]:
+    for document in documents:
+        document.version = int(document.version)
+    return documents
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "arrow"])
+def test_arrow_writer(tmpdir: str,
+                      file_format: str,
+                      typed_documents: List[models.Document],
+                      highlights: List[models.Highlight]) -> None:
+    path = f"{tmpdir}/highlights.{file_format}"
+    with open(path, "w") as file_p:
+        logger = log.CommandLineLogger(spinners_enabled=False, file_output=file_p)
+        arrow_writer_command.ArrowWriter(typed_documents, [highlights[:3], highlights[3:]],
+                                         file_format=file_format, row_group_size=2).write(logger)
+
+    if file_format == "parquet":
+        parquet_file = pyarrow.parquet.ParquetFile(path)
+        assert parquet_file.num_row_groups == 2
+        table = parquet_file.read()
+    else:
+        table = pyarrow.ipc.open_file(path).read_all()
+
+    assert table.column_names == common.generate_column_choices()
+    assert table.schema.field("highlight_page_number").type == pyarrow.int64()
+    assert table.schema.field("highlight_extracted_at").type == pyarrow.timestamp("us")
+    assert table.schema.field("document_bookmarked").type == pyarrow.bool_()
+    assert table.column("highlight_hash").to_pylist() == [highlight.hash for highlight in highlights]
+
+
+def test_parquet_writer_command(mock_app: app_.App,
+                                mock_rmcloud: MagicMock,
+                                tmpdir: str,
+                                typed_documents: List[models.Document],
+                                highlights: List[models.Highlight]) -> None:
+    path = f"{tmpdir}/highlights.parquet"
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(cli.command_line, args=[
+        "run", "parquet", "--columns", "highlight_text,document_name", "--compression", "snappy", "-o", path, "books"
+    ])
+    assert result.exit_code == 0
+    table = pyarrow.parquet.read_table(path)
+    assert table.column_names == ["highlight_text", "document_name"]
+    assert table.column("highlight_text").to_pylist() == [highlight.text for highlight in highlights]
+
+
+def test_missing_pyarrow(monkeypatch: MonkeyPatch,
+                         logger: log.CommandLineLogger,
+                         typed_documents: List[models.Document],
+                         highlights: List[models.Highlight]) -> None:
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    with pytest.raises(arrow_writer_command.MissingPyArrowException):
+        arrow_writer_command.ArrowWriter(typed_documents, [highlights]).write(logger)
@@ -194,3 +194,20 @@ class TestCSVWriterCommand():
         assert "," in result.stderr
         assert result.exit_code == 2
         assert "document_id" in result.stderr
+
+
+def test_csv_stream_writer_matches_csv_writer(capsys: CaptureFixture,
+                                              logger: log.CommandLineLogger,
+                                              documents: List[models.Document],
+                                              highlights: List[models.Highlight]) -> None:
+    csv_writer_command.CSVWriter(documents, highlights, ["highlight_text", "document_name"], "|").write(logger)
+    expected = capsys.readouterr().out
+
+    batches = [highlights[:1], [], highlights[1:]]
+    csv_writer_command.CSVStreamWriter(documents, batches, ["highlight_text", "document_name"], "|").write(logger)
+    assert capsys.readouterr().out == expected
+
+    csv_writer_command.CSVWriter(documents, []).write(logger)
+    expected = capsys.readouterr().out
+    csv_writer_command.CSVStreamWriter(documents, []).write(logger)
+    assert capsys.readouterr().out == expected
@@ -96,3 +96,19 @@ class TestJSONWriterCommand():
         assert "Collections:" in result.stderr
         assert "Connecting to RM cloud" in result.stderr
         assert json.loads(result.stdout)
+
+
+def test_json_stream_writer_matches_json_writer(capsys: CaptureFixture,
+                                                logger: log.CommandLineLogger,
+                                                documents: List[models.Document],
+                                                highlights: List[models.Highlight]) -> None:
+    json_writer_command.JSONWriter(documents, highlights).write(logger)
+    expected = capsys.readouterr().out
+
+    json_writer_command.JSONStreamWriter(documents, [[], highlights[:2], [], highlights[2:]]).write(logger)
+    assert capsys.readouterr().out == expected
+
+    json_writer_command.JSONWriter(documents, []).write(logger)
+    expected = capsys.readouterr().out
+    json_writer_command.JSONStreamWriter(documents, [[]]).write(logger)
+    assert capsys.readouterr().out == expected
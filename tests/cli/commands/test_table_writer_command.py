@@ -2,6 +2,9 @@
 
 import typing as T
 from typing import Dict, List
+from unittest.mock import MagicMock
+
+import pytest
 
 from _pytest.capture import CaptureFixture
 from click.testing import CliRunner
@@ -144,6 +147,40 @@ def test_table_writer_plain_empty(capsys: CaptureFixture, logger: log.CommandLin
 
 
 # TODO: refactor table and table writer into table based output writer
+
+def test_table_stream_writer(logger: log.CommandLineLogger,
+                             documents: List[models.Document],
+                             highlights: List[models.Highlight]) -> None:
+    output = MagicMock()
+    logger = log.CommandLineLogger(spinners_enabled=False, file_output=output)
+    columns = ["highlight_text", "highlight_page_number"]
+    table_writer_command.TableStreamWriter(documents, [highlights[:1], highlights[1:]], columns,
+                                           sample_rows=1, max_width=20, flush_rows=2).write(logger)
+
+    writes = [call.args[0] for call in output.write.call_args_list]
+    lines = "".join(writes).splitlines()
+    assert len(writes) == 3
+    assert all(write.endswith("\n") for write in writes)
+    assert lines[0] == "highlight_text  highlight_page_number"
+    assert lines[1] == "-" * 14 + "  " + "-" * 21
+    assert lines[2] == "text_1" + " " * 29 + "10"
+    assert lines[3].startswith("long_highli...  ")
+    assert len(lines) == 2 + len(highlights)
+
+
+def test_table_stream_writer_column_widths(capsys: CaptureFixture,
+                                           logger: log.CommandLineLogger,
+                                           documents: List[models.Document],
+                                           highlights: List[models.Highlight]) -> None:
+    table_writer_command.TableStreamWriter(documents, [highlights], ["highlight_text"], print_plain=True,
+                                           column_widths=[8]).write(logger)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[:2] == ["highl...", "text_1"]
+    assert max(len(line) for line in lines) == 8
+
+    with pytest.raises(ValueError):
+        table_writer_command.TableStreamWriter(documents, [highlights], ["highlight_text"], column_widths=[8, 2])
+
 class TestTableWriterCommand():
 
     def test_run_table(self, mock_app: app_.App, normalized_highlights: List[Dict[str, T.Any]]) -> None:
@@ -190,3 +227,18 @@ class TestTableWriterCommand():
                                      "books"])
         assert result.exit_code == 2
         assert "document_id" in result.stderr
+
+    def test_stream(self, mock_app: app_.App, normalized_highlights: List[Dict[str, T.Any]]) -> None:
+        runner = CliRunner(mix_stderr=False)
+        result = runner.invoke(cli.command_line,
+                               args=["run", "table", "--stream", "--columns", "document_name,highlight_text",
+                                     "--token", "test", "books"])
+        assert result.exit_code == 0
+        assert result.stdout.splitlines()[0].split() == ["highlight_text", "document_name"]
+        assert normalized_highlights[0]['highlight_text'] in result.stdout
+
+        result = runner.invoke(cli.command_line,
+                               args=["run", "table", "--stream", "--columns", "document_name,highlight_text",
+                                     "--column-widths", "10", "--token", "test", "books"])
+        assert result.exit_code == 2
+        assert "Expected 2 column widths, got 1" in result.stderr
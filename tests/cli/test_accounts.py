@@ -0,0 +1,117 @@
+# pylint: disable=no-self-use,missing-function-docstring
+
+import json
+import pathlib
+from typing import Any, Dict, List
+from unittest.mock import MagicMock
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from click.testing import CliRunner
+
+from remarking.cli import accounts as accounts_
+from remarking.cli import app as app_
+from remarking.cli import cli, extract
+
+
+def write_manifest(tmpdir: pathlib.Path, manifest: Dict[str, Any]) -> str:
+    path = tmpdir / "accounts.json"
+    with open(path, "w") as file_p:
+        json.dump(manifest, file_p)
+    return str(path)
+
+
+def account_entries(tmpdir: pathlib.Path) -> List[Dict[str, Any]]:
+    return [
+        {"name": "alice", "rmapi_config": str(tmpdir / "alice.rmapi"), "collections": ["books"],
+         "output": str(tmpdir / "alice.json")},
+        {"name": "bob", "rmapi_config": str(tmpdir / "bob.rmapi"), "collections": ["papers"],
+         "output": str(tmpdir / "bob.json")},
+    ]
+
+
+def test_load_manifest(tmpdir: pathlib.Path) -> None:
+    manifest = accounts_.load_manifest(write_manifest(tmpdir, {"concurrency": 2, "accounts": account_entries(tmpdir)}))
+    assert manifest.concurrency == 2
+    assert [account.name for account in manifest.accounts] == ["alice", "bob"]
+    assert manifest.accounts[1].collections == ["papers"]
+    assert manifest.accounts[0].token is None
+
+
+@pytest.mark.parametrize("manifest", [
+    [],
+    {"accounts": [{"name": "alice"}]},
+    {"accounts": [{"name": "alice", "rmapi_config": "a", "collections": [], "unknown": 1}]},
+    {"accounts": [{"name": "alice", "rmapi_config": "a", "collections": []},
+                  {"name": "alice", "rmapi_config": "b", "collections": []}]},
+    {"concurrency": 0, "accounts": []},
+])
+def test_load_manifest_invalid(tmpdir: pathlib.Path, manifest: Any) -> None:
+    with pytest.raises(accounts_.BadAccountManifestException):
+        accounts_.load_manifest(write_manifest(tmpdir, manifest))
+
+
+def test_run_accounts_command(monkeypatch: MonkeyPatch, mock_app: app_.App, tmpdir: pathlib.Path) -> None:
+    mock_rmcloud = MagicMock()
+    monkeypatch.setattr(extract.rmcloud_, "RMCloud", mock_rmcloud)
+    manifest_path = write_manifest(tmpdir, {"concurrency": 2, "accounts": account_entries(tmpdir)})
+
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(
+        cli.command_line,
+        args=["persist", "--sqlalchemy", "dne", "json", "--accounts", manifest_path, "ignored"]
+    )
+    assert result.exit_code == 0
+    assert result.stdout == ""
+    assert "Accounts: alice, bob" in result.stderr
+    assert "[alice] Connected to RM cloud." in result.stderr
+
+    for name in ("alice", "bob"):
+        with open(tmpdir / f"{name}.json") as file_p:
+            assert json.load(file_p)["highlights"]
+
+    config_paths = sorted(call.kwargs["config_path"] for call in mock_rmcloud.call_args_list)
+    assert config_paths == [str(tmpdir / "alice.rmapi"), str(tmpdir / "bob.rmapi")]
+    sessions = {id(call.kwargs["session"]) for call in mock_rmcloud.call_args_list}
+    assert len(sessions) == 1
+
+    collections = sorted(call.args[1] for call in mock_app.run_app.call_args_list)
+    assert collections == [["books"], ["papers"]]
+    assert mock_app.acknowledge.call_count == 2
+
+
+def test_run_accounts_command_failing_account(monkeypatch: MonkeyPatch,
+                                              mock_app: app_.App,
+                                              tmpdir: pathlib.Path) -> None:
+    def create_rmcloud(token: str, config_path: str, session: Any) -> MagicMock:
+        if config_path.endswith("bob.rmapi"):
+            raise extract.rmcloud_.AuthError()
+        return MagicMock()
+
+    monkeypatch.setattr(extract.rmcloud_, "RMCloud", create_rmcloud)
+    manifest_path = write_manifest(tmpdir, {"accounts": account_entries(tmpdir)})
+
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(cli.command_line, args=["run", "json", "--accounts", manifest_path])
+    assert result.exit_code == 1
+    assert "[bob] Sync failed" in result.stderr
+    with open(tmpdir / "alice.json") as file_p:
+        assert json.load(file_p)["highlights"]
+
+
+def test_run_accounts_with_watch(mock_app: app_.App, tmpdir: pathlib.Path) -> None:
+    manifest_path = write_manifest(tmpdir, {"accounts": account_entries(tmpdir)})
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(cli.command_line,
+                           args=["persist", "--sqlalchemy", "dne", "--watch", "json", "--accounts", manifest_path])
+    assert result.exit_code == 2
+    assert "cannot be used with `--watch`" in result.stderr
+
+
+def test_run_accounts_with_log_storage(mock_app: app_.App, tmpdir: pathlib.Path) -> None:
+    manifest_path = write_manifest(tmpdir, {"accounts": account_entries(tmpdir)})
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(cli.command_line, args=["persist", "--sqlalchemy", f"log://{tmpdir}/highlights.log",
+                                                   "json", "--accounts", manifest_path])
+    assert result.exit_code == 2
+    assert "cannot be used with log storage" in result.stderr
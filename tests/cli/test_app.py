@@ -1,21 +1,27 @@
 # pylint: disable=no-self-use,missing-function-docstring
+import asyncio
 import datetime
 import itertools
-from typing import Dict, Iterator, List
+import typing as T
+import logging
+from typing import Dict, Iterator, List, Tuple
 from unittest.mock import MagicMock
 
 import pytest
 from _pytest.capture import CaptureFixture
+from _pytest.logging import LogCaptureFixture
 from _pytest.monkeypatch import MonkeyPatch
 from pytest_unordered import unordered
 from rmapy import collections as collections_
 from rmapy import document as document_
 
-from remarking import models
+from remarking import isolation, metrics, models
 from remarking import rmcloud as rmcloud_
 from remarking.cli import app as app_
 from remarking.cli import log
 from remarking.highlight_extractor import highlight_extractor
+from remarking.storage import async_sqlalchemy_storage as async_sqlalchemy_storage_
+from remarking.storage import async_storage as async_storage_
 from remarking.storage import sqlalchemy_storage as sqlalchemy_storage_
 
 
@@ -52,6 +58,23 @@ class MockExtractor(highlight_extractor.HighlightExtractor):
         return list(itertools.chain(*[highlights]))
 
 
+class MockBatchExtractor(MockExtractor):
+    """ Mock extractor implementing the batch API """
+
+    def __init__(self, highlights: List[models.Highlight]) -> None:
+        super().__init__(highlights)
+        self.batches: List[List[str]] = []
+
+    def get_highlights(self, working_path: str, document: models.Document) -> List[models.Highlight]:
+        raise AssertionError("get_highlights_batch should be used")
+
+    def get_highlights_batch(self,
+                             working_path: T.Any,
+                             documents: List[models.Document]) -> Dict[str, List[models.Highlight]]:
+        self.batches.append([document.id for document in documents])
+        return {document.id: list(self.documents_to_highlights.get(document.id, [])) for document in documents}
+
+
 @pytest.fixture
 def rmcloud(monkeypatch: MonkeyPatch,
             rmapy_collection: collections_.Collection,
@@ -315,8 +338,6 @@ def test_app_run_prints_extractor_running(rmcloud: rmcloud_.RMCloud,
     assert len(new_highlights) > 0
     assert len(new_documents) > 0
     assert "Running extractors on documents" in captured.err
-    assert "MockExtractor" in captured.err
-    assert f"on \"{documents[1].name}\"" in captured.err
     assert f"found {len(new_highlights)} highlights, {len(new_highlights)} are new." in captured.err
 
 
@@ -336,7 +357,7 @@ def test_app_run_prints_downloading_doc(rmcloud: rmcloud_.RMCloud,
     assert len(new_highlights) > 0
     assert len(new_documents) > 0
     assert "Downloading documents" in captured.err
-    assert f"Downloading \"{documents[1].name}\"" in captured.err
+    assert "Downloaded 3 documents." in captured.err
 
 
 def test_app_run_returns_documents_sorted_by_name(rmcloud: rmcloud_.RMCloud,
@@ -774,3 +795,306 @@ def test_app_run_does_not_drop_duplicate_highlights_in_different_document(
     assert "1 are new" in captured.err
     verify_highlights([same_new_highlight], new_highlights)
     verify_documents([documents[1]], new_documents)
+
+
+def test_app_incremental_skips_documents_not_advanced(
+        rmcloud: rmcloud_.RMCloud,
+        logger: log.CommandLineLogger,
+        extractors: List[highlight_extractor.HighlightExtractor],
+        sqlalchemy_storage: sqlalchemy_storage_.SqlAlchemyStorage,
+        documents: List[models.Document],
+        highlights: List[models.Highlight],
+        mock_extractor: MockExtractor) -> None:
+    app = app_.App(rmcloud=rmcloud, extractors=extractors, logger=logger, storage=sqlalchemy_storage,
+                   incremental=True)
+    new_documents, new_highlights = app.run_app("/tmp/434324", ["a_folder"])
+    verify_highlights(highlights, new_highlights)
+    verify_documents(documents, new_documents)
+
+    sqlalchemy_storage.get_documents = MagicMock(wraps=sqlalchemy_storage.get_documents)  # type: ignore
+    new_documents, new_highlights = app.run_app("/tmp/434324", ["a_folder"])
+    assert new_documents == []
+    assert new_highlights == []
+    sqlalchemy_storage.get_documents.assert_not_called()
+
+    new_highlight = models.Highlight.create_highlight(documents[0].id, "new_text", 20, "manually added")
+    add_new_highlight(mock_extractor, new_highlight)
+    update_document_modified_at_and_store(rmcloud, documents[0])
+    rmcloud.download_document.reset_mock()  # type: ignore
+    new_documents, new_highlights = app.run_app("/tmp/434324", ["a_folder"])
+    verify_highlights([new_highlight], new_highlights)
+    sqlalchemy_storage.get_documents.assert_called_once_with([documents[0].id])
+    rmcloud.download_document.assert_called_once_with(documents[0].id, "/tmp/434324")  # type: ignore
+
+
+def test_app_resumes_after_interrupted_run(
+        rmcloud: rmcloud_.RMCloud,
+        logger: log.CommandLineLogger,
+        extractors: List[highlight_extractor.HighlightExtractor],
+        sqlalchemy_storage: sqlalchemy_storage_.SqlAlchemyStorage,
+        documents: List[models.Document],
+        highlights: List[models.Highlight],
+        mock_extractor: MockExtractor) -> None:
+    original_get_highlights = mock_extractor.get_highlights
+
+    def crash_on_last_document(working_path: str, document: models.Document) -> List[models.Highlight]:
+        if document.id == documents[0].id:
+            raise RuntimeError("process died")
+        return original_get_highlights(working_path, document)
+
+    mock_extractor.get_highlights = crash_on_last_document  # type: ignore
+    app = app_.App(rmcloud=rmcloud, extractors=extractors, logger=logger, storage=sqlalchemy_storage,
+                   checkpoint_size=1)
+    with pytest.raises(RuntimeError):
+        app.run_app("/tmp/434324", ["a_folder"])
+    sqlalchemy_storage.rollback()
+
+    assert unordered([doc.id for doc in sqlalchemy_storage.get_documents()]) == [documents[1].id, documents[2].id]
+
+    mock_extractor.get_highlights = original_get_highlights  # type: ignore
+    rmcloud.download_document.reset_mock()  # type: ignore
+    app = app_.App(rmcloud=rmcloud, extractors=extractors, logger=logger, storage=sqlalchemy_storage,
+                   checkpoint_size=1)
+    new_documents, new_highlights = app.run_app("/tmp/434324", ["a_folder"])
+
+    # Documents committed before the crash are not downloaded again,
+    # but their highlights were never delivered so they are still returned.
+    rmcloud.download_document.assert_called_once_with(documents[0].id, "/tmp/434324")  # type: ignore
+    verify_highlights(highlights, new_highlights)
+    verify_documents(documents, new_documents)
+
+    new_documents, new_highlights = app.run_app("/tmp/434324", ["a_folder"])
+    assert new_documents == []
+    assert new_highlights == []
+
+
+def test_app_returns_unacknowledged_highlights_again(
+        rmcloud: rmcloud_.RMCloud,
+        logger: log.CommandLineLogger,
+        extractors: List[highlight_extractor.HighlightExtractor],
+        sqlalchemy_storage: sqlalchemy_storage_.SqlAlchemyStorage,
+        documents: List[models.Document],
+        highlights: List[models.Highlight]) -> None:
+    app = app_.App(rmcloud=rmcloud, extractors=extractors, logger=logger, storage=sqlalchemy_storage)
+    _, new_highlights = app.run_app("/tmp/434324", ["a_folder"], acknowledge=False)
+    verify_highlights(highlights, new_highlights)
+
+    new_documents, unacknowledged_highlights = app.run_app("/tmp/434324", ["a_folder"], acknowledge=False)
+    verify_highlights(highlights, unacknowledged_highlights)
+    verify_documents(documents, new_documents)
+
+    app.acknowledge(unacknowledged_highlights)
+    new_documents, new_highlights = app.run_app("/tmp/434324", ["a_folder"], acknowledge=False)
+    assert new_documents == []
+    assert new_highlights == []
+
+
+def test_app_records_metrics(rmcloud: rmcloud_.RMCloud,
+                             extractors: List[highlight_extractor.HighlightExtractor],
+                             sqlalchemy_storage: sqlalchemy_storage_.SqlAlchemyStorage,
+                             documents: List[models.Document],
+                             highlights: List[models.Highlight]) -> None:
+    metrics.REGISTRY.reset()
+    app = app_.App(rmcloud=rmcloud, extractors=extractors, storage=sqlalchemy_storage)
+    app.run_app("/tmp/434324", ["a_folder"])
+
+    assert metrics.RUNS.get() == 1
+    assert metrics.LAST_RUN_SUCCESS.get() == 1
+    assert metrics.DOCUMENTS_LISTED.get() == len(documents)
+    assert metrics.DOCUMENTS_NEW.get() == len(documents)
+    assert metrics.DOCUMENTS_DOWNLOADED.get() == len(documents)
+    assert metrics.HIGHLIGHTS_NEW.get() == len({highlight.hash for highlight in highlights})
+    assert metrics.DB_ROUND_TRIPS.get() > 0
+    assert metrics.STAGE_DURATION.get(stage="extract") > 0
+
+    rmcloud.download_document.side_effect = RuntimeError("offline")  # type: ignore
+    update_document_modified_at_and_store(rmcloud, documents[1])
+    with pytest.raises(RuntimeError):
+        app.run_app("/tmp/434324", ["a_folder"])
+    assert metrics.RUNS.get() == 2
+    assert metrics.RUN_ERRORS.get() == 1
+    assert metrics.LAST_RUN_SUCCESS.get() == 0
+
+
+def test_async_app_with_sync_storage(rmcloud: rmcloud_.RMCloud,
+                                     logger: log.CommandLineLogger,
+                                     extractors: List[highlight_extractor.HighlightExtractor],
+                                     documents: List[models.Document],
+                                     highlights: List[models.Highlight],
+                                     tmpdir: str) -> None:
+    # Calls are made from a worker thread, which would get its own in-memory database.
+    sqlalchemy_storage = sqlalchemy_storage_.SqlAlchemyStorage(f"sqlite:///{tmpdir}/remarking.sqlite3")
+    app = app_.AsyncApp(rmcloud=rmcloud, extractors=extractors, logger=logger,
+                        storage=async_storage_.SyncStorageAdapter(sqlalchemy_storage), checkpoint_size=1)
+
+    async def run_twice() -> Tuple[Tuple[List[models.Document], List[models.Highlight]], ...]:
+        try:
+            return (await app.run_app_async("/tmp/434324", ["a_folder"]),
+                    await app.run_app_async("/tmp/434324", ["a_folder"]))
+        finally:
+            await app.close_async()
+
+    (new_documents, new_highlights), second_run = asyncio.run(run_twice())
+    verify_highlights(highlights, new_highlights)
+    verify_documents(documents, new_documents)
+    assert second_run == ([], [])
+    assert unordered(doc.id for doc in sqlalchemy_storage.get_documents()) == [doc.id for doc in documents]
+
+
+def test_async_app_with_async_storage(rmcloud: rmcloud_.RMCloud,
+                                      logger: log.CommandLineLogger,
+                                      extractors: List[highlight_extractor.HighlightExtractor],
+                                      documents: List[models.Document],
+                                      highlights: List[models.Highlight],
+                                      tmpdir: str) -> None:
+    pytest.importorskip("aiosqlite")
+    db_string = f"sqlite:///{tmpdir}/remarking.sqlite3"
+    app = app_.AsyncApp(rmcloud=rmcloud, extractors=extractors, logger=logger,
+                        storage=async_sqlalchemy_storage_.AsyncSqlAlchemyStorage(db_string), checkpoint_size=1)
+
+    async def run() -> Tuple[List[models.Document], List[models.Highlight]]:
+        try:
+            result = await app.run_app_async("/tmp/434324", ["a_folder"], acknowledge=False)
+            await app.acknowledge_async(result[1])
+            return result
+        finally:
+            await app.close_async()
+
+    new_documents, new_highlights = asyncio.run(run())
+    verify_highlights(highlights, new_highlights)
+    verify_documents(documents, new_documents)
+
+    storage = sqlalchemy_storage_.SqlAlchemyStorage(db_string)
+    assert unordered(doc.id for doc in storage.get_documents()) == [doc.id for doc in documents]
+    assert storage.get_pending_highlights() == []
+
+
+def test_async_app_has_no_synchronous_methods(rmcloud: rmcloud_.RMCloud,
+                                              extractors: List[highlight_extractor.HighlightExtractor]) -> None:
+    app = app_.AsyncApp(rmcloud=rmcloud, extractors=extractors)
+    assert isinstance(app, app_.BaseApp)
+    assert not isinstance(app, app_.App)
+    assert not hasattr(app, "run_app")
+    assert not hasattr(app, "acknowledge")
+
+
+def test_app_emits_events(rmcloud: rmcloud_.RMCloud,
+                          logger: log.CommandLineLogger,
+                          extractors: List[highlight_extractor.HighlightExtractor],
+                          sqlalchemy_storage: sqlalchemy_storage_.SqlAlchemyStorage,
+                          caplog: LogCaptureFixture) -> None:
+    caplog.set_level(logging.INFO, logger="remarking.events")
+    app = app_.App(rmcloud=rmcloud, extractors=extractors, logger=logger, storage=sqlalchemy_storage)
+    new_documents, new_highlights = app.run_app("/tmp/434324", ["a_folder"])
+
+    emitted = [(record.event, record.fields) for record in caplog.records]  # type: ignore
+    finished_stages = [fields["stage"] for event, fields in emitted if event == "stage_finished"]
+    assert finished_stages == ["metadata", "download", "extract", "lookup", "store", "store"]
+    extracted = [fields for event, fields in emitted if event == "document_extracted"]
+    assert len(extracted) == len(extractors) * 3
+    assert sum(fields["highlights"] for fields in extracted) >= len(new_highlights)
+    assert {fields["document_id"] for fields in extracted} >= {doc.id for doc in new_documents}
+
+
+def test_app_uses_batch_extractors(rmcloud: rmcloud_.RMCloud,
+                                   logger: log.CommandLineLogger,
+                                   sqlalchemy_storage: sqlalchemy_storage_.SqlAlchemyStorage,
+                                   documents: List[models.Document],
+                                   highlights: List[models.Highlight]) -> None:
+    extractor = MockBatchExtractor(highlights)
+    assert highlight_extractor.implements_batch(extractor)
+    app = app_.App(rmcloud=rmcloud, extractors=[extractor], logger=logger, storage=sqlalchemy_storage,
+                   checkpoint_size=2)
+    new_documents, new_highlights = app.run_app("/tmp/434324", ["a_folder"])
+
+    assert sorted(itertools.chain(*extractor.batches)) == sorted(doc.id for doc in documents)
+    assert [len(batch) for batch in extractor.batches] == [2, len(documents) - 2]
+    verify_highlights(highlights, new_highlights)
+    verify_documents(documents, new_documents)
+
+
+class SkippingPool():
+    """ Runs extractors in process like :class:`isolation.ExtractorPool`, skipping the documents in skip_ids """
+
+    def __init__(self, extractors: List[highlight_extractor.HighlightExtractor],
+                 limits: isolation.ExtractionLimits, skip_ids: T.Set[str]) -> None:
+        self.extractors = extractors
+        self.limits = limits
+        self.skip_ids = skip_ids
+        self.closed = False
+
+    def extract(self, source: T.Any, documents: List[models.Document]) -> Iterator[isolation.ExtractionResult]:
+        for extractor in self.extractors:
+            for doc in documents:
+                if doc.id in self.skip_ids:
+                    yield isolation.ExtractionResult(extractor, doc, [], 10.0, skip_reason="took longer than 1 seconds")
+                else:
+                    yield isolation.ExtractionResult(extractor, doc, extractor.get_highlights(source, doc), 1.0)
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_app_skips_documents_exceeding_limits(rmcloud: rmcloud_.RMCloud,
+                                              logger: log.CommandLineLogger,
+                                              extractors: List[highlight_extractor.HighlightExtractor],
+                                              sqlalchemy_storage: sqlalchemy_storage_.SqlAlchemyStorage,
+                                              documents: List[models.Document],
+                                              highlights: List[models.Highlight],
+                                              monkeypatch: MonkeyPatch) -> None:
+    skipped_doc = documents[0]
+    pools: List[SkippingPool] = []
+
+    def create_pool(extractors: List[highlight_extractor.HighlightExtractor],
+                    limits: isolation.ExtractionLimits) -> SkippingPool:
+        pools.append(SkippingPool(extractors, limits, {skipped_doc.id}))
+        return pools[-1]
+
+    monkeypatch.setattr(isolation, "ExtractorPool", create_pool)
+    limits = isolation.ExtractionLimits(timeout=1)
+    app = app_.App(rmcloud=rmcloud, extractors=extractors, logger=logger, storage=sqlalchemy_storage,
+                   extraction_limits=limits)
+    metrics.REGISTRY.reset()
+    _, new_highlights = app.run_app("/tmp/434324", ["a_folder"])
+
+    assert pools[-1].closed
+    assert metrics.DOCUMENTS_SKIPPED.get() == 1
+    assert skipped_doc.id not in {highlight.document_id for highlight in new_highlights}
+    verify_highlights([highlight for highlight in highlights if highlight.document_id != skipped_doc.id],
+                      new_highlights)
+    assert sqlalchemy_storage.get_documents([skipped_doc.id]) == []
+    skipped = sqlalchemy_storage.get_skipped_documents()
+    assert [(entry.document_id, entry.reason) for entry in skipped] == [
+        (skipped_doc.id, "MockExtractor took longer than 1 seconds")
+    ]
+
+    # The skipped document is unchanged, so it is not downloaded again.
+    rmcloud.download_document.reset_mock()  # type: ignore
+    _, new_highlights = app.run_app("/tmp/434324", ["a_folder"])
+    assert new_highlights == []
+    rmcloud.download_document.assert_not_called()  # type: ignore
+
+    # Retried documents that are extracted are removed from the skip list.
+    app = app_.App(rmcloud=rmcloud, extractors=extractors, logger=logger, storage=sqlalchemy_storage,
+                   extraction_limits=limits, retry_skipped=True)
+    monkeypatch.setattr(isolation, "ExtractorPool", lambda extractors, limits: SkippingPool(extractors, limits, set()))
+    _, new_highlights = app.run_app("/tmp/434324", ["a_folder"])
+    verify_highlights([highlight for highlight in highlights if highlight.document_id == skipped_doc.id],
+                      new_highlights)
+    assert [doc.id for doc in sqlalchemy_storage.get_documents([skipped_doc.id])] == [skipped_doc.id]
+    assert sqlalchemy_storage.get_skipped_documents() == []
+
+
+def test_app_prunes_excluded_folders(rmcloud: rmcloud_.RMCloud,
+                                     logger: log.CommandLineLogger,
+                                     extractors: List[highlight_extractor.HighlightExtractor],
+                                     sqlalchemy_storage: sqlalchemy_storage_.SqlAlchemyStorage,
+                                     documents: List[models.Document]) -> None:
+    app = app_.App(rmcloud=rmcloud, extractors=extractors, logger=logger, storage=sqlalchemy_storage,
+                   excluded_folders=["A_FOLDER_2"])
+    new_documents, _ = app.run_app("/tmp/434324", ["a_folder", "a_book_2"])
+
+    downloaded = [call.args[0] for call in rmcloud.download_document.call_args_list]  # type: ignore
+    assert downloaded == [documents[0].id]
+    assert [doc.id for doc in new_documents] == [documents[0].id]
+    assert sqlalchemy_storage.get_documents([doc.id for doc in documents[1:]]) == []
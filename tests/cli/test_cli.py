@@ -4,12 +4,12 @@ from unittest.mock import MagicMock
 from _pytest.monkeypatch import MonkeyPatch
 from click.testing import CliRunner
 
-from remarking.cli import cli
+from remarking.cli import cli, log
 
 
 def test_cli_verbosity_sets_debug(monkeypatch: MonkeyPatch) -> None:
     mock = MagicMock()
-    monkeypatch.setattr(cli.logging, "basicConfig", mock)
+    monkeypatch.setattr(log.logging, "basicConfig", mock)
     runner = CliRunner()
     result = runner.invoke(cli.command_line, "-vvv list")
     mock.assert_called_with(format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s', level=logging.DEBUG)
@@ -59,3 +59,14 @@ def test_cli_bug() -> None:
     result = runner.invoke(cli.command_line, "bug")
     assert result.exit_code == 0
     assert "You can file a bug" in result.output
+
+
+def test_cli_json_log_format(monkeypatch: MonkeyPatch) -> None:
+    root = logging.getLogger()
+    monkeypatch.setattr(root, "handlers", [])
+    monkeypatch.setattr(root, "level", root.level)
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(cli.command_line, "--log-format json list columns")
+    assert result.exit_code == 0
+    assert isinstance(root.handlers[0].formatter, log.JSONLogFormatter)
+    assert root.level == logging.INFO
@@ -1,5 +1,6 @@
 # pylint: disable=no-self-use,missing-function-docstring
 
+import concurrent.futures
 from typing import List
 
 import pytest
@@ -53,3 +54,41 @@ def test_normalize_highlights_and_documents_match_listing_columns(
     assert len(normalized) > 0
     keys = result.output.strip().split("\n")
     assert unordered(list(normalized[0].keys())) == keys
+
+
+def test_shared_normalization(documents: List[models.Document], highlights: List[models.Highlight]) -> None:
+    with common.shared_normalization():
+        normalized = common.normalize_highlights_and_documents(documents, highlights)
+        assert common.normalize_highlights_and_documents(documents, highlights) is normalized
+        filtered, headers = common.get_column_filtered_highlights_and_header(documents, highlights, ["highlight_text"])
+        assert headers == ["highlight_text"]
+        assert filtered == [{"highlight_text": highlight.text} for highlight in highlights]
+        assert len(normalized[0]) > 1
+    assert common.normalize_highlights_and_documents(documents, highlights) is not normalized
+
+
+def test_shared_normalization_is_local_to_thread(documents: List[models.Document],
+                                                 highlights: List[models.Highlight]) -> None:
+    with common.shared_normalization():
+        normalized = common.normalize_highlights_and_documents(documents, highlights)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            other_thread = executor.submit(common.normalize_highlights_and_documents, documents, highlights).result()
+    assert other_thread == normalized
+    assert other_thread is not normalized
+
+
+def test_row_projector(documents: List[models.Document], highlights: List[models.Highlight]) -> None:
+    projector = common.row_projector(["document_name", "highlight_text"])
+    assert common.row_projector(["document_name", "highlight_text"]) is projector
+    assert projector.headers == ["highlight_text", "document_name"]
+
+    document_names = {document.id: document.name for document in documents}
+    assert projector.project_all(documents, highlights) == [
+        {"highlight_text": highlight.text, "document_name": document_names[highlight.document_id]}
+        for highlight in highlights
+    ]
+    assert common.row_projector().project_all(documents, highlights) == \
+        common.normalize_highlights_and_documents(documents, highlights)
+
+    with pytest.raises(common.MissingDocumentException):
+        projector.project_all(documents[2:], highlights)
@@ -0,0 +1,33 @@
+# pylint: disable=no-self-use,missing-function-docstring
+import pathlib
+from typing import List
+
+from click.testing import CliRunner
+
+from remarking import models
+from remarking.cli import cli
+from remarking.storage import sqlalchemy_storage as sqlalchemy_storage_
+
+
+def test_deduplicate_text_command(tmpdir: pathlib.Path,
+                                  documents: List[models.Document],
+                                  highlights: List[models.Highlight]) -> None:
+    db_string = f"sqlite:///{tmpdir}/test.sqlite3"
+    unique_highlights = list({highlight.hash: highlight for highlight in highlights}.values())
+    with sqlalchemy_storage_.SqlAlchemyStorage(db_string) as storage:
+        storage.save_models(documents + unique_highlights)
+        storage.commit()
+
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(cli.command_line, args=["deduplicate-text", "--sqlalchemy", db_string])
+    assert result.exit_code == 0
+    assert f"Moved the text of {len(unique_highlights)} highlights." in result.stderr
+
+    with sqlalchemy_storage_.SqlAlchemyStorage(db_string) as storage:
+        assert storage.deduplicate_text
+        assert sorted(highlight.text for highlight in storage.get_highlights()) == \
+            sorted(highlight.text for highlight in unique_highlights)
+
+    result = runner.invoke(cli.command_line, args=["deduplicate-text", "--sqlalchemy", "log:///highlights.log"])
+    assert result.exit_code == 2
+    assert "Log storage cannot deduplicate highlight text" in result.stderr
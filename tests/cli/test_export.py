@@ -0,0 +1,74 @@
+# pylint: disable=no-self-use,missing-function-docstring
+import csv
+import io
+import json
+import pathlib
+from typing import List
+
+import pytest
+from click.testing import CliRunner
+
+from remarking import models
+from remarking.cli import cli
+from remarking.storage import log_storage as log_storage_
+from remarking.storage import sqlalchemy_storage as sqlalchemy_storage_
+
+
+@pytest.fixture
+def db_string(tmpdir: pathlib.Path, documents: List[models.Document], highlights: List[models.Highlight]) -> str:
+    db_string = f"sqlite:///{tmpdir}/test.sqlite3"
+    storage = sqlalchemy_storage_.SqlAlchemyStorage(db_string)
+    storage.save_models(documents)
+    storage.save_models(list({highlight.hash: highlight for highlight in highlights}.values()))
+    storage.commit()
+    return db_string
+
+
+def test_export_json(db_string: str, highlights: List[models.Highlight]) -> None:
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(cli.command_line, args=["export", "--sqlalchemy", db_string, "--batch-size", "1", "json"])
+    assert result.exit_code == 0
+    exported = json.loads(result.stdout)
+    assert {highlight["hash"] for highlight in exported["highlights"]} == {highlight.hash for highlight in highlights}
+
+
+def test_export_document_filter(db_string: str,
+                                documents: List[models.Document],
+                                highlights: List[models.Highlight]) -> None:
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(cli.command_line, args=["export", "--sqlalchemy", db_string,
+                                                   "--document", documents[1].name,
+                                                   "csv", "--columns", "highlight_hash,document_id"])
+    assert result.exit_code == 0
+    rows = list(csv.DictReader(io.StringIO(result.stdout)))
+    assert {row["highlight_hash"] for row in rows} == \
+        {highlight.hash for highlight in highlights if highlight.document_id == documents[1].id}
+    assert {row["document_id"] for row in rows} == {documents[1].id}
+
+    result = runner.invoke(cli.command_line, args=["export", "--sqlalchemy", db_string,
+                                                   "--document", "does not exist", "csv"])
+    assert result.exit_code == 2
+    assert "No stored documents match" in result.stderr
+
+
+def test_export_since(db_string: str) -> None:
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(cli.command_line, args=["export", "--sqlalchemy", db_string,
+                                                   "--since", "2999-01-01", "table"])
+    assert result.exit_code == 0
+    assert result.stdout == ""
+
+
+def test_export_log_storage(tmpdir: pathlib.Path,
+                            documents: List[models.Document],
+                            highlights: List[models.Highlight]) -> None:
+    log_url = f"log://{tmpdir}/highlights.log"
+    storage = log_storage_.LogStorage(log_url)
+    storage.save_models(documents + list({highlight.hash: highlight for highlight in highlights}.values()))
+    storage.commit()
+
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(cli.command_line, args=["export", "--sqlalchemy", log_url, "json"])
+    assert result.exit_code == 0
+    exported = json.loads(result.stdout)
+    assert {highlight["hash"] for highlight in exported["highlights"]} == {highlight.hash for highlight in highlights}
@@ -1,5 +1,6 @@
 # pylint: disable=no-self-use,missing-function-docstring
 
+import importlib.util
 import json
 import pathlib
 from typing import Iterator, List
@@ -9,8 +10,9 @@ import pytest
 from _pytest.monkeypatch import MonkeyPatch
 from click.testing import CliRunner
 
+from remarking import isolation
 from remarking.cli import app as app_
-from remarking.cli import cli, extract
+from remarking.cli import cli, extract, watch
 
 
 def verify_output_is_valid_json(stdout: str) -> None:
@@ -36,6 +38,22 @@ def test_run_command(mock_app: app_.App) -> None:
     assert "Connecting to RM cloud" in result.stderr
 
 
+def test_run_command_extraction_options(mock_app: app_.App) -> None:
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(cli.command_line, args=["run", "json", "--token", "test", "books"])
+    assert result.exit_code == 0
+    assert extract.app_.App.call_args.kwargs["extraction_limits"] is None  # type: ignore
+
+    result = runner.invoke(cli.command_line, args=["run", "json", "--token", "test", "--extractor-timeout", "5",
+                                                   "--extractor-memory", "512", "--retry-skipped",
+                                                   "--exclude-folder", "Archive", "--exclude-folder", "Old", "books"])
+    assert result.exit_code == 0
+    kwargs = extract.app_.App.call_args.kwargs  # type: ignore
+    assert kwargs["extraction_limits"] == isolation.ExtractionLimits(timeout=5, memory=512 * 2 ** 20, workers=1)
+    assert kwargs["retry_skipped"]
+    assert list(kwargs["excluded_folders"]) == ["Archive", "Old"]
+
+
 def test_persist_command(mock_app: app_.App) -> None:
     runner = CliRunner(mix_stderr=False)
     result = runner.invoke(
@@ -291,3 +309,70 @@ def test_run_lists_warning_on_empty_collection_names(mock_app: app_.App, cmd_sta
                            ])
     assert result.exit_code == 0
     assert "Empty list of collection names" in result.stderr
+
+
+def test_persist_watch(mock_app: app_.App, monkeypatch: MonkeyPatch) -> None:
+    def run_once(self: watch.Watcher) -> None:
+        assert self.interval == 5
+        self._iteration()  # pylint: disable=protected-access
+
+    monkeypatch.setattr(watch.Watcher, "run", run_once)
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(
+        cli.command_line,
+        args=["persist", "--sqlalchemy", "dne", "--watch", "--interval", "5", "json", "--token", "test", "books"])
+    assert result.exit_code == 0
+    verify_output_is_valid_json(result.stdout)
+    assert "Watching" in result.stderr
+
+
+def test_metrics_file(mock_app: app_.App, tmpdir: pathlib.Path, cmd_start: List[str]) -> None:
+    metrics_file = tmpdir / "remarking.prom"
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(cli.command_line,
+                           args=["--metrics-file", str(metrics_file)] + cmd_start + ["--token", "test", "books"])
+    assert result.exit_code == 0
+    with open(metrics_file) as file_p:
+        contents = file_p.read()
+    assert "# TYPE remarking_runs counter" in contents
+    assert contents.endswith("# EOF\n")
+
+
+def test_persist_log_storage(mock_app: app_.App, tmpdir: pathlib.Path) -> None:
+    log_path = tmpdir / "remarking.log"
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(cli.command_line,
+                           args=["persist", "--sqlalchemy", f"log://{log_path}", "json", "--token", "test", "books"])
+    assert result.exit_code == 0
+    assert log_path.exists()
+    verify_output_is_valid_json(result.stdout)
+
+
+def test_persist_bloom_filter(mock_app: app_.App, tmpdir: pathlib.Path) -> None:
+    log_path = tmpdir / "remarking.log"
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(cli.command_line,
+                           args=["persist", "--sqlalchemy", f"log://{log_path}", "--bloom-filter",
+                                 "json", "--token", "test", "books"])
+    assert result.exit_code == 0
+    assert (tmpdir / "remarking.log.bloom").exists()
+    verify_output_is_valid_json(result.stdout)
+
+
+def test_persist_asyncio_rejects_watch(mock_app: app_.App) -> None:
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(cli.command_line,
+                           args=["persist", "--sqlalchemy", "sqlite:///:memory:", "--asyncio", "--watch",
+                                 "json", "--token", "test", "books"])
+    assert result.exit_code == 2
+    assert "--asyncio" in result.stderr
+
+
+def test_persist_asyncio_missing_driver(mock_app: app_.App, monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(importlib.util, "find_spec", lambda module: None)
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(cli.command_line,
+                           args=["persist", "--sqlalchemy", "sqlite:///:memory:", "--asyncio",
+                                 "json", "--token", "test", "books"])
+    assert result.exit_code == 2
+    assert "pip install aiosqlite" in result.stderr
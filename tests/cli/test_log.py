@@ -411,3 +411,50 @@ def test_output_result_file(capsys: CaptureFixture) -> None:
     logger.output_result("This is a result")
 
     assert string_io.getvalue() == "This is a result"
+
+
+def test_progress_reporter(capsys: CaptureFixture) -> None:
+    now = [0.0]
+    logger = log.CommandLineLogger(spinners_enabled=False)
+    spinner = logger.spinner("Downloading documents", "bouncingBar")
+    progress = log.ProgressReporter(spinner, "Downloading documents", total=100, interval=1.0, clock=lambda: now[0])
+    for _ in range(10):
+        now[0] += 0.25
+        progress.advance(bytes_=1024 * 1024, current='"a_book"')
+    assert capsys.readouterr().err.splitlines() == [
+        'Downloading documents: 4/100, 4.0/s, 4.0 MiB/s, ETA 24s - "a_book"',
+        'Downloading documents: 8/100, 4.0/s, 4.0 MiB/s, ETA 23s - "a_book"',
+    ]
+    assert progress.items == 10
+
+
+class RecordingSpinner():
+    def __init__(self) -> None:
+        self.texts: T.List[str] = []
+
+    @property
+    def text(self) -> str:
+        return self.texts[-1]
+
+    @text.setter
+    def text(self, value: str) -> None:
+        self.texts.append(value)
+
+
+def test_progress_reporter_without_total() -> None:
+    now = [0.0]
+    spinner = RecordingSpinner()
+    progress = log.ProgressReporter(spinner, "Running extractors", interval=0.5, clock=lambda: now[0])  # type: ignore
+    for _ in range(4):
+        now[0] += 0.25
+        progress.advance()
+    assert spinner.texts == ["Running extractors: 2, 4.0/s", "Running extractors: 4, 4.0/s"]
+
+
+def test_format_bytes_and_duration() -> None:
+    assert log.format_bytes(512) == "512 B"
+    assert log.format_bytes(1536) == "1.5 KiB"
+    assert log.format_bytes(3 * 1024 ** 4) == "3072.0 GiB"
+    assert log.format_duration(12.4) == "12s"
+    assert log.format_duration(185) == "3m05s"
+    assert log.format_duration(3720) == "1h02m"
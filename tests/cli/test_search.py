@@ -0,0 +1,48 @@
+# pylint: disable=no-self-use,missing-function-docstring
+import pathlib
+from typing import List
+
+from click.testing import CliRunner
+
+from remarking import models
+from remarking.cli import cli
+from remarking.storage import log_storage as log_storage_
+from remarking.storage import sqlalchemy_storage as sqlalchemy_storage_
+
+
+def test_search_command(tmpdir: pathlib.Path,
+                        documents: List[models.Document],
+                        highlights: List[models.Highlight]) -> None:
+    db_string = f"sqlite:///{tmpdir}/test.sqlite3"
+    storage = sqlalchemy_storage_.SqlAlchemyStorage(db_string)
+    storage.save_models(documents)
+    storage.save_models(list({highlight.hash: highlight for highlight in highlights}.values()))
+    storage.commit()
+
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(cli.command_line, args=["search", "--sqlalchemy", db_string, "--plain",
+                                                   "--columns", "highlight_text,document_name",
+                                                   highlights[0].text])
+    assert result.exit_code == 0
+    assert highlights[0].text in result.stdout
+    assert documents[0].name in result.stdout
+
+    result = runner.invoke(cli.command_line, args=["search", "--sqlalchemy", db_string, "nothingmatches"])
+    assert result.exit_code == 1
+    assert result.stdout == ""
+    assert "No matching highlights." in result.stderr
+
+
+def test_search_command_log_storage(tmpdir: pathlib.Path,
+                                    documents: List[models.Document],
+                                    highlights: List[models.Highlight]) -> None:
+    log_url = f"log://{tmpdir}/highlights.log"
+    storage = log_storage_.LogStorage(log_url)
+    storage.save_models(documents + list({highlight.hash: highlight for highlight in highlights}.values()))
+    storage.commit()
+
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(cli.command_line, args=["search", "--sqlalchemy", log_url, "--plain",
+                                                   "--columns", "highlight_text", highlights[0].text])
+    assert result.exit_code == 0
+    assert highlights[0].text in result.stdout
@@ -0,0 +1,55 @@
+# pylint: disable=no-self-use,missing-function-docstring
+from typing import List
+from unittest.mock import MagicMock
+
+import pytest
+
+from remarking.cli import log, watch
+
+
+@pytest.fixture
+def quiet_logger() -> log.CommandLineLogger:
+    return log.CommandLineLogger(quiet=True)
+
+
+def test_watcher_runs_until_stopped(quiet_logger: log.CommandLineLogger) -> None:
+    calls: List[int] = []
+
+    def iteration() -> None:
+        calls.append(1)
+        if len(calls) == 3:
+            watcher.stop()
+
+    watcher = watch.Watcher(iteration, interval=0, logger=quiet_logger)
+    watcher.run()
+    assert len(calls) == 3
+
+
+def test_watcher_backs_off_on_errors(quiet_logger: log.CommandLineLogger) -> None:
+    on_error = MagicMock()
+    delays: List[float] = []
+
+    def iteration() -> None:
+        delays.append(watcher.next_delay())
+        if len(delays) == 4:
+            watcher.stop()
+            return
+        raise RuntimeError("sync failed")
+
+    watcher = watch.Watcher(iteration, interval=0.001, logger=quiet_logger, max_backoff=0.004, on_error=on_error)
+    watcher.run()
+    assert delays == [0.001, 0.002, 0.004, 0.004]
+    assert on_error.call_count == 3
+    assert watcher.consecutive_failures == 0
+
+
+def test_watcher_reports_failures(capsys: pytest.CaptureFixture) -> None:
+    def iteration() -> None:
+        watcher.stop()
+        raise RuntimeError("sync failed")
+
+    watcher = watch.Watcher(iteration, interval=0, logger=log.CommandLineLogger(spinners_enabled=False))
+    watcher.run()
+    captured = capsys.readouterr()
+    assert "Sync failed (RuntimeError: sync failed)" in captured.err
+    assert "Stopped watching." in captured.err
@@ -98,3 +98,37 @@ def test_token_prompting_does_not_run_when_authed_and_when_not_atty(mock_app: ap
     assert "Missing option '-t'" not in result.stderr
     assert "Are you in non-interactive" not in result.stderr
     assert "piping" not in result.stderr
+
+
+def test_sinks_write_a_single_extraction(mock_app: app_.App,
+                                         mock_rmcloud: MagicMock,
+                                         tmpdir: str,
+                                         cmd_start: List[str]) -> None:
+    csv_path = f"{tmpdir}/highlights.csv"
+    table_path = f"{tmpdir}/highlights.txt"
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(cli.command_line, args=cmd_start + [
+        "--sink", f"csv --output {csv_path} --delimiter '|'",
+        "--sink", f"table --plain --columns highlight_text -o {table_path}",
+        "books"
+    ])
+    assert result.exit_code == 0
+    assert "{\"documen" in result.stdout
+    mock_app.run_app.assert_called_once()
+
+    with open(csv_path) as file_p:
+        assert file_p.readline().startswith("highlight_text|")
+    with open(table_path) as file_p:
+        assert file_p.readline().strip() == "highlight_text"
+
+
+def test_sinks_are_validated(mock_app: app_.App, mock_rmcloud: MagicMock, cmd_start: List[str]) -> None:
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(cli.command_line, args=cmd_start + ["--sink", "xml", "books"])
+    assert result.exit_code == 2
+    assert "Unknown writer command in `--sink xml`" in result.stderr
+
+    result = runner.invoke(cli.command_line, args=cmd_start + ["--sink", "csv --columns nope", "books"])
+    assert result.exit_code == 2
+    assert "Invalid `--sink csv --columns nope`" in result.stderr
+    mock_app.run_app.assert_not_called()
@@ -14,7 +14,7 @@ from sqlalchemy import create_engine, orm
 from remarking import models
 from remarking import rmcloud as rmcloud_
 from remarking.cli import app as app_
-from remarking.cli import cli, common, extract, log
+from remarking.cli import common, extract, log
 from remarking.storage import sqlalchemy_storage as sqlalchemy_storage_
 
 
@@ -307,9 +307,9 @@ def mock_rmcloud(monkeypatch: MonkeyPatch, rmapy_collection: collections_.Collec
 def mock_sqlalchemy_storage(monkeypatch: MonkeyPatch,
                             highlights: T.List[models.Highlight],
                             documents: T.List[models.Document]) -> sqlalchemy_storage_.SqlAlchemyStorage:
-    mock_sqlalchemy_storage_inst = MagicMock(autospec=cli.sqlalchemy_storage.SqlAlchemyStorage)
+    mock_sqlalchemy_storage_inst = MagicMock(autospec=sqlalchemy_storage_.SqlAlchemyStorage)
     mock_sqlalchemy_storage_class = MagicMock(return_value=mock_sqlalchemy_storage_inst)
-    monkeypatch.setattr(cli.sqlalchemy_storage, "SqlAlchemyStorage", mock_sqlalchemy_storage_class)
+    monkeypatch.setattr(sqlalchemy_storage_, "SqlAlchemyStorage", mock_sqlalchemy_storage_class)
     return mock_sqlalchemy_storage_inst
 
 
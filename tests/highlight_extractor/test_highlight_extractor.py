@@ -0,0 +1,38 @@
+# pylint: disable=no-self-use,missing-function-docstring
+import typing as T
+from typing import Dict, List
+
+from remarking import models
+from remarking.highlight_extractor import highlight_extractor
+
+
+class PerDocumentExtractor(highlight_extractor.HighlightExtractor):
+    """ Extractor returning one highlight per document """
+
+    @classmethod
+    def get_extractor_instance_data(cls) -> List[highlight_extractor.ExtractorData]:
+        return []
+
+    def get_highlights(self, working_path: T.Any, document: models.Document) -> List[models.Highlight]:
+        return [models.Highlight.create_highlight(document.id, document.name, 0, "PerDocumentExtractor")]
+
+
+class BatchExtractor(PerDocumentExtractor):
+    """ Extractor implementing the batch API """
+
+    def get_highlights_batch(self,
+                             working_path: T.Any,
+                             documents: List[models.Document]) -> Dict[str, List[models.Highlight]]:
+        return {}
+
+
+def test_get_highlights_batch_defaults_to_get_highlights(documents: List[models.Document]) -> None:
+    extractor = PerDocumentExtractor()
+    highlights = extractor.get_highlights_batch("/tmp", documents)
+    assert list(highlights) == [document.id for document in documents]
+    assert [highlights[document.id][0].text for document in documents] == [document.name for document in documents]
+
+
+def test_implements_batch() -> None:
+    assert not highlight_extractor.implements_batch(PerDocumentExtractor())
+    assert highlight_extractor.implements_batch(BatchExtractor())
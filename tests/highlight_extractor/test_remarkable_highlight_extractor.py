@@ -1,9 +1,13 @@
 # pylint: disable=no-self-use,missing-function-docstring
 import datetime
+import io
+import os
+import zipfile
 from typing import List
 
 import pytest
 
+from remarking import document_source as document_source_
 from remarking import models
 from remarking.highlight_extractor import remarkable_highlight_extractor
 
@@ -109,3 +113,103 @@ def test_extractor_returns_nothing_for_no_highlights(test2_path: str,
                                                      expected_highlights: List[models.Highlight]) -> None:
     extractor = remarkable_highlight_extractor.RemarkableHighlightExtractor()
     assert extractor.get_highlights(test2_path, document) == []
+
+
+def test_extractor_reads_from_zip(test1_path: str,
+                                  document: models.Document,
+                                  expected_highlights: List[models.Highlight]) -> None:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zip_file:
+        for root, _, files in os.walk(test1_path):
+            for file_name in files:
+                full_path = os.path.join(root, file_name)
+                zip_file.write(full_path, os.path.relpath(full_path, test1_path))
+    source = document_source_.ZipDocumentSource(buffer.getvalue())
+
+    extractor = remarkable_highlight_extractor.RemarkableHighlightExtractor()
+    highlights = extractor.get_highlights(source, document)
+    assert len(highlights) == len(expected_highlights)
+    compare_highlights(highlights, expected_highlights)
+
+
+def fragment(start: int, text: str, x: float, y: float, width: float) -> remarkable_highlight_extractor.RawHighlight:
+    return remarkable_highlight_extractor.RawHighlight(
+        start=start, length=len(text), text=text,
+        rects=[remarkable_highlight_extractor.Rect(x=x, y=y, width=width, height=40)]
+    )
+
+
+def group_texts(fragments: List[remarkable_highlight_extractor.RawHighlight]) -> List[str]:
+    return [remarkable_highlight_extractor.join_group_text(group)
+            for group in remarkable_highlight_extractor.group_spatially(fragments)]
+
+
+def test_spatial_extractor(test1_path: str,
+                           document: models.Document,
+                           expected_highlights: List[models.Highlight]) -> None:
+    extractor = remarkable_highlight_extractor.RemarkableHighlightExtractor(merge="spatial")
+    highlights = extractor.get_highlights(test1_path, document)
+
+    wrapped = "Alice looked on with great interest as the King took an enorm memorandum-book out of his pocket"
+    assert (17, wrapped) in [(highlight.page_number, highlight.text) for highlight in highlights]
+    unchanged = [highlight for highlight in expected_highlights
+                 if highlight.page_number != 17 or "The poor King" in highlight.text]
+    assert len(highlights) == len(unchanged) + 1
+    assert {highlight.hash for highlight in unchanged} < {highlight.hash for highlight in highlights}
+
+
+def test_spatial_extractor_is_selectable() -> None:
+    instances = {data.extractor_name: data.instance
+                 for data in remarkable_highlight_extractor.RemarkableHighlightExtractor.get_extractor_instance_data()}
+    assert instances["remarkable"].merge == "offsets"  # type: ignore
+    assert instances["remarkable_spatial"].merge == "spatial"  # type: ignore
+    with pytest.raises(ValueError):
+        remarkable_highlight_extractor.RemarkableHighlightExtractor(merge="nearby")
+
+
+def test_group_spatially_joins_lines_and_columns() -> None:
+    assert group_texts([
+        fragment(0, "The first line runs", 100, 100, 800),
+        fragment(30, "to the margin", 100, 150, 300),
+        fragment(80, "ends mid line", 100, 200, 400),
+        fragment(110, "is not continued", 100, 250, 300),
+        fragment(140, "same line", 420, 250, 100),
+    ]) == [
+        "The first line runs to the margin",
+        "ends mid line",
+        "is not continued same line",
+    ]
+    assert group_texts([
+        fragment(0, "first column", 100, 100, 300),
+        fragment(200, "column ends", 100, 400, 300),
+        fragment(250, "next column", 450, 100, 300),
+        fragment(300, "not at the top", 450, 200, 300),
+    ]) == ["first column", "column ends next column", "not at the top"]
+
+
+def test_group_spatially_joins_overlapping_fragments_in_reading_order() -> None:
+    assert group_texts([
+        fragment(22, "sat down: the rapid", 400, 100, 300),
+        fragment(0, "The Queen gasped, and sat down", 100, 100, 400),
+        remarkable_highlight_extractor.RawHighlight(start=42, length=7, text="journey"),
+    ]) == ["The Queen gasped, and sat down: the rapid journey"]
+
+
+def test_spatial_extractor_joins_across_pages(document: models.Document) -> None:
+    extractor = remarkable_highlight_extractor.RemarkableHighlightExtractor(merge="spatial")
+    highlights = extractor._from_spatial_groups(  # pylint: disable=protected-access
+        document.id,
+        {"page-1": 1, "page-2": 2, "page-4": 4},
+        {
+            "page-1": [fragment(0, "Once upon", 100, 100, 800), fragment(500, "a time", 100, 900, 800)],
+            "page-2": [fragment(0, "there was", 100, 100, 300), fragment(600, "a page", 100, 900, 800)],
+            "page-4": [fragment(0, "far away", 100, 100, 300), fragment(600, "the end", 400, 900, 300)],
+        }
+    )
+    assert [(highlight.page_number, highlight.text) for highlight in highlights] == [
+        (1, "Once upon"),
+        (1, "a time there was"),
+        (2, "a page"),
+        (4, "far away"),
+        (4, "the end"),
+    ]
@@ -0,0 +1,195 @@
+# pylint: disable=no-self-use,missing-function-docstring
+import datetime
+import json
+import logging
+import pathlib
+import struct
+import zipfile
+from typing import Dict, List, Tuple
+
+import pytest
+from _pytest.logging import LogCaptureFixture
+
+from remarking import document_source as document_source_
+from remarking import models
+from remarking.highlight_extractor import remarkable_stroke_extractor
+
+Points = List[Tuple[float, float]]
+
+PEN = 2
+HIGHLIGHTER = 5
+HIGHLIGHTER_2 = 18
+
+
+def header(version: int) -> bytes:
+    return f"reMarkable .lines file, version={version}".encode().ljust(43)
+
+
+def lines_v5(strokes: List[Tuple[int, Points]]) -> bytes:
+    data = header(5) + struct.pack("<ii", 1, len(strokes))
+    for tool, points in strokes:
+        data += struct.pack("<iiiffi", tool, 0, 0, 2.0, 0.0, len(points))
+        data += b"".join(struct.pack("<6f", x, y, 0, 0, 0, 0) for x, y in points)
+    return data
+
+
+def varuint(value: int) -> bytes:
+    data = b""
+    while value >= 0x80:
+        data += bytes([(value & 0x7F) | 0x80])
+        value >>= 7
+    return data + bytes([value])
+
+
+def tag(index: int, tag_type: int) -> bytes:
+    return varuint(index << 4 | tag_type)
+
+
+def crdt_id(part1: int, part2: int) -> bytes:
+    return bytes([part1]) + varuint(part2)
+
+
+def subblock(index: int, data: bytes) -> bytes:
+    return tag(index, 0xC) + struct.pack("<I", len(data)) + data
+
+
+def block(block_type: int, content: bytes) -> bytes:
+    return struct.pack("<IBBBB", len(content), 0, 1, 2, block_type) + content
+
+
+def line_block(item: int, tool: int, points: Points, deleted: bool = False) -> bytes:
+    content = (tag(1, 0xF) + crdt_id(0, 11) + tag(2, 0xF) + crdt_id(1, item) +
+               tag(3, 0xF) + crdt_id(0, 0) + tag(4, 0xF) + crdt_id(0, 0) +
+               tag(5, 0x4) + struct.pack("<i", 1 if deleted else 0))
+    if not deleted:
+        point_data = b"".join(struct.pack("<ffHHBB", x, y, 1, 2, 3, 4) for x, y in points)
+        value = (bytes([3]) + tag(1, 0x4) + struct.pack("<I", tool) + tag(2, 0x4) + struct.pack("<I", 3) +
+                 tag(3, 0x8) + struct.pack("<d", 1.0) + tag(4, 0x4) + struct.pack("<f", 0.0) +
+                 subblock(5, point_data) + tag(6, 0xF) + crdt_id(1, item + 1))
+        content += subblock(6, value)
+    return block(0x05, content)
+
+
+def lines_v6(blocks: List[bytes]) -> bytes:
+    return header(6) + block(0x09, subblock(1, b"\x01\x02\x03")) + b"".join(blocks)
+
+
+@pytest.fixture
+def document() -> models.Document:
+    return models.Document(
+        id="9b6a0bb6-4c4b-4cbb-8d52-8bc9d2e2e2f1",
+        name="Scanned paper",
+        current_page=0,
+        bookmarked=False,
+        parent="",
+        version=2,
+        modified_client=datetime.datetime(year=2022, month=5, day=6)
+    )
+
+
+@pytest.fixture
+def pages() -> Dict[str, bytes]:
+    return {
+        "page-0": lines_v5([
+            (PEN, [(0, 0), (500, 500)]),
+            (HIGHLIGHTER, [(10, 20), (110, 20), (110, 45)]),
+        ]),
+        "page-1": lines_v6([
+            line_block(20, HIGHLIGHTER_2, [(-100, 300), (50, 330)]),
+            line_block(30, PEN, [(1, 1), (2, 2)]),
+            line_block(40, HIGHLIGHTER_2, [], deleted=True),
+            line_block(50, HIGHLIGHTER_2, [(-100, 100), (20, 120)]),
+        ]),
+        "page-2": header(6),
+    }
+
+
+def write_document(path: pathlib.Path, document: models.Document, pages: Dict[str, bytes]) -> None:
+    content = {"cPages": {"pages": [{"id": page_id} for page_id in sorted(pages)]}}
+    (path / f"{document.id}.content").write_text(json.dumps(content))
+    (path / document.id).mkdir()
+    for page_id, data in pages.items():
+        (path / document.id / f"{page_id}.rm").write_bytes(data)
+    (path / document.id / "page-0-metadata.json").write_text("{}")
+
+
+def test_parse_strokes_v5(pages: Dict[str, bytes]) -> None:
+    assert remarkable_stroke_extractor.parse_strokes(pages["page-0"]) == [
+        remarkable_stroke_extractor.Stroke(tool=HIGHLIGHTER, color=0, x=10, y=20, width=100, height=25)
+    ]
+    all_strokes = remarkable_stroke_extractor.parse_strokes(pages["page-0"], tools={PEN, HIGHLIGHTER})
+    assert [stroke.tool for stroke in all_strokes] == [PEN, HIGHLIGHTER]
+
+
+def test_parse_strokes_v6(pages: Dict[str, bytes]) -> None:
+    assert remarkable_stroke_extractor.parse_strokes(pages["page-1"]) == [
+        remarkable_stroke_extractor.Stroke(tool=HIGHLIGHTER_2, color=3, x=-100, y=300, width=150, height=30),
+        remarkable_stroke_extractor.Stroke(tool=HIGHLIGHTER_2, color=3, x=-100, y=100, width=120, height=20),
+    ]
+    assert remarkable_stroke_extractor.parse_strokes(pages["page-2"]) == []
+
+
+@pytest.mark.parametrize("data", [
+    b"not a lines file",
+    header(4),
+    lines_v5([(HIGHLIGHTER, [(10, 20), (110, 20)])])[:-10],
+    lines_v6([line_block(20, HIGHLIGHTER, [(1, 2)])])[:-3],
+])
+def test_parse_strokes_rejects_invalid_files(data: bytes) -> None:
+    with pytest.raises(remarkable_stroke_extractor.RmFormatException):
+        remarkable_stroke_extractor.parse_strokes(data)
+
+
+def test_extractor(tmp_path: pathlib.Path, document: models.Document, pages: Dict[str, bytes]) -> None:
+    write_document(tmp_path, document, pages)
+    extractor = remarkable_stroke_extractor.RemarkableStrokeExtractor()
+    highlights = extractor.get_highlights(str(tmp_path), document)
+
+    assert [
+        (highlight.page_number, highlight.x, highlight.y, highlight.width, highlight.height)
+        for highlight in highlights
+    ] == [
+        (0, 10, 20, 100, 25),
+        (1, -100, 100, 120, 20),
+        (1, -100, 300, 150, 30),
+    ]
+    assert {highlight.text for highlight in highlights} == {""}
+    assert len({highlight.hash for highlight in highlights}) == 3
+    assert {highlight.extraction_method for highlight in highlights} == {"RemarkableStrokeExtractor"}
+    assert {highlight.document_id for highlight in highlights} == {document.id}
+
+
+def test_extractor_reads_from_zip(tmp_path: pathlib.Path,
+                                  document: models.Document,
+                                  pages: Dict[str, bytes]) -> None:
+    write_document(tmp_path, document, pages)
+    archive = tmp_path / "document.zip"
+    with zipfile.ZipFile(archive, "w") as zip_file:
+        for path in sorted(tmp_path.rglob("*")):
+            if path.is_file() and path != archive:
+                zip_file.write(path, path.relative_to(tmp_path).as_posix())
+    source = document_source_.ZipDocumentSource(str(archive))
+
+    extractor = remarkable_stroke_extractor.RemarkableStrokeExtractor()
+    from_zip = extractor.get_highlights(source, document)
+    from_directory = extractor.get_highlights(str(tmp_path), document)
+    assert [highlight.hash for highlight in from_zip] == [highlight.hash for highlight in from_directory]
+    assert len(from_zip) == 3
+
+
+def test_extractor_skips_invalid_pages(tmp_path: pathlib.Path,
+                                       document: models.Document,
+                                       pages: Dict[str, bytes],
+                                       caplog: LogCaptureFixture) -> None:
+    pages["page-1"] = pages["page-1"][:60]
+    write_document(tmp_path, document, pages)
+    extractor = remarkable_stroke_extractor.RemarkableStrokeExtractor()
+    with caplog.at_level(logging.WARNING):
+        highlights = extractor.get_highlights(str(tmp_path), document)
+    assert [highlight.page_number for highlight in highlights] == [0]
+    assert "Skipping page page-1" in caplog.text
+
+
+def test_extractor_returns_nothing_without_pages(tmp_path: pathlib.Path, document: models.Document) -> None:
+    extractor = remarkable_stroke_extractor.RemarkableStrokeExtractor()
+    assert extractor.get_highlights(str(tmp_path), document) == []
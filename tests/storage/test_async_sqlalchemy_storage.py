@@ -0,0 +1,92 @@
+# pylint: disable=no-self-use,missing-function-docstring
+import asyncio
+import importlib.util
+import os
+from typing import Any, Callable, Coroutine
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from rmapy import document as document_
+
+from remarking import models
+from remarking.storage import async_sqlalchemy_storage as async_sqlalchemy_storage_
+from remarking.storage import sqlalchemy_storage as sqlalchemy_storage_
+
+
+@pytest.fixture()
+def db_string(tmpdir: str) -> str:
+    pytest.importorskip("aiosqlite")
+    return f"sqlite:///{os.path.join(str(tmpdir), 'remarking.sqlite3')}"
+
+
+@pytest.fixture()
+def document(rmapy_document: document_.Document) -> models.Document:
+    return models.Document.from_cloud_document(rmapy_document)
+
+
+def run_with_storage(db_string: str,
+                     test: Callable[[async_sqlalchemy_storage_.AsyncSqlAlchemyStorage], Coroutine[Any, Any, None]]
+                     ) -> None:
+    async def run() -> None:
+        storage = async_sqlalchemy_storage_.AsyncSqlAlchemyStorage(db_string)
+        try:
+            await test(storage)
+        finally:
+            await storage.close()
+    asyncio.run(run())
+
+
+def test_to_async_url(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(importlib.util, "find_spec", lambda module: object())
+    assert str(async_sqlalchemy_storage_.to_async_url("sqlite:///db.sqlite3")) == "sqlite+aiosqlite:///db.sqlite3"
+    assert str(async_sqlalchemy_storage_.to_async_url("postgresql+psycopg2://user@host/db")) == \
+        "postgresql+asyncpg://user@host/db"
+    assert str(async_sqlalchemy_storage_.to_async_url("mysql://user@host/db")) == "mysql+aiomysql://user@host/db"
+    with pytest.raises(async_sqlalchemy_storage_.MissingAsyncDriverException):
+        async_sqlalchemy_storage_.to_async_url("oracle://user@host/db")
+
+
+def test_missing_driver(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(importlib.util, "find_spec", lambda module: None)
+    with pytest.raises(async_sqlalchemy_storage_.MissingAsyncDriverException, match="pip install aiosqlite"):
+        async_sqlalchemy_storage_.AsyncSqlAlchemyStorage("sqlite:///db.sqlite3")
+
+
+def test_save_and_get(db_string: str, document: models.Document, highlight: models.Highlight) -> None:
+    async def test(storage: async_sqlalchemy_storage_.AsyncSqlAlchemyStorage) -> None:
+        await storage.save_models([document, highlight, models.PendingHighlight(hash=highlight.hash)])
+        await storage.commit()
+        assert [doc.name for doc in await storage.get_documents([document.id])] == [document.name]
+        assert [hl.hash for hl in await storage.get_highlights([highlight.hash])] == [highlight.hash]
+        assert [hl.hash for hl in await storage.get_pending_highlights()] == [highlight.hash]
+
+        await storage.clear_pending_highlights([highlight.hash])
+        await storage.commit()
+        assert await storage.get_pending_highlights() == []
+
+    run_with_storage(db_string, test)
+
+    # The schema is shared with the synchronous storage, including the search index.
+    storage = sqlalchemy_storage_.SqlAlchemyStorage(db_string)
+    assert [hl.hash for hl in storage.search_highlights(highlight.text.split()[0])] == [highlight.hash]
+
+
+def test_update_documents(db_string: str, document: models.Document) -> None:
+    async def test(storage: async_sqlalchemy_storage_.AsyncSqlAlchemyStorage) -> None:
+        await storage.save_models([document])
+        await storage.commit()
+        document.name = "Renamed"
+        await storage.update_documents([document])
+        await storage.commit()
+        assert [doc.name for doc in await storage.get_documents()] == ["Renamed"]
+
+    run_with_storage(db_string, test)
+
+
+def test_rollback(db_string: str, highlight: models.Highlight) -> None:
+    async def test(storage: async_sqlalchemy_storage_.AsyncSqlAlchemyStorage) -> None:
+        await storage.save_models([highlight])
+        await storage.rollback()
+        assert await storage.get_highlights([highlight.hash]) == []
+
+    run_with_storage(db_string, test)
@@ -0,0 +1,136 @@
+# pylint: disable=no-self-use,missing-function-docstring,protected-access
+import os
+from typing import List
+from unittest import mock
+
+import pytest
+
+from remarking import metrics, models
+from remarking.storage import bloom_storage as bloom_storage_
+from remarking.storage import log_storage as log_storage_
+from remarking.storage import sqlalchemy_storage as sqlalchemy_storage_
+
+
+@pytest.fixture()
+def log_path(tmpdir: str) -> str:
+    return os.path.join(str(tmpdir), "remarking.log")
+
+
+def test_bloom_filter_has_no_false_negatives() -> None:
+    bloom_filter = bloom_storage_.BloomFilter(capacity=1000, error_rate=0.01)
+    items = [f"item-{i}" for i in range(1000)]
+    for item in items:
+        bloom_filter.add(item)
+    assert all(item in bloom_filter for item in items)
+    false_positives = sum(f"other-{i}" in bloom_filter for i in range(10000))
+    assert false_positives < 300
+
+
+def test_bloom_filter_save_and_load(tmpdir: str) -> None:
+    path = os.path.join(str(tmpdir), "filter.bloom")
+    bloom_filter = bloom_storage_.BloomFilter(capacity=10)
+    bloom_filter.add("a")
+    bloom_filter.save(path, (1, 2))
+
+    loaded, source_stat = bloom_storage_.BloomFilter.load(path)
+    assert "a" in loaded
+    assert "b" not in loaded
+    assert loaded.count == 1
+    assert source_stat == (1, 2)
+
+
+def test_definite_misses_skip_storage(log_path: str, highlight: models.Highlight) -> None:
+    metrics.REGISTRY.reset()
+    inner = mock.MagicMock(wraps=log_storage_.LogStorage(log_path))
+    storage = bloom_storage_.BloomFilterStorage(inner)
+
+    assert storage.get_highlights([highlight.hash]) == []
+    inner.get_highlights.assert_not_called()
+    assert metrics.BLOOM_FILTER_LOOKUPS.get(result="skipped") == 1
+
+    storage.save_models([highlight])
+    storage.commit()
+    assert [stored.hash for stored in storage.get_highlights([highlight.hash, "missing"])] == [highlight.hash]
+    inner.get_highlights.assert_called_once_with([highlight.hash])
+
+
+def test_uncommitted_highlights_are_looked_up(log_path: str, highlight: models.Highlight) -> None:
+    storage = bloom_storage_.BloomFilterStorage(log_storage_.LogStorage(log_path))
+    storage.save_models([highlight])
+    assert len(storage.get_highlights([highlight.hash])) == 1
+    storage.rollback()
+    assert storage.get_highlights([highlight.hash]) == []
+
+
+def test_filter_is_persisted(log_path: str, highlight: models.Highlight) -> None:
+    bloom_path = f"{log_path}.bloom"
+    storage = bloom_storage_.BloomFilterStorage(log_storage_.LogStorage(log_path), bloom_path, log_path)
+    storage.save_models([highlight])
+    storage.commit()
+
+    inner = mock.MagicMock(wraps=log_storage_.LogStorage(log_path))
+    reopened = bloom_storage_.BloomFilterStorage(inner, bloom_path, log_path)
+    inner.iter_highlight_batches.assert_not_called()
+    assert len(reopened.get_highlights([highlight.hash])) == 1
+
+
+def test_filter_is_rebuilt_when_storage_changed(log_path: str,
+                                                highlight: models.Highlight,
+                                                highlight_2: models.Highlight) -> None:
+    bloom_path = f"{log_path}.bloom"
+    bloom_storage_.BloomFilterStorage(log_storage_.LogStorage(log_path), bloom_path, log_path)
+    other_writer = log_storage_.LogStorage(log_path)
+    other_writer.save_models([highlight, highlight_2])
+    other_writer.commit()
+
+    reopened = bloom_storage_.BloomFilterStorage(log_storage_.LogStorage(log_path), bloom_path, log_path)
+    assert len(reopened.get_highlights([highlight.hash, highlight_2.hash])) == 2
+
+
+def test_unreadable_filter_is_rebuilt(log_path: str, highlight: models.Highlight) -> None:
+    inner = log_storage_.LogStorage(log_path)
+    inner.save_models([highlight])
+    inner.commit()
+    bloom_path = f"{log_path}.bloom"
+    with open(bloom_path, "wb") as bloom_file:
+        bloom_file.write(b"garbage")
+
+    storage = bloom_storage_.BloomFilterStorage(log_storage_.LogStorage(log_path), bloom_path, log_path)
+    assert len(storage.get_highlights([highlight.hash])) == 1
+    bloom_storage_.BloomFilter.load(bloom_path)
+
+
+def test_filter_is_not_rebuilt_after_acknowledging(log_path: str, highlight: models.Highlight) -> None:
+    bloom_path = f"{log_path}.bloom"
+    storage = bloom_storage_.BloomFilterStorage(log_storage_.LogStorage(log_path), bloom_path, log_path)
+    storage.save_models([highlight, models.PendingHighlight(hash=highlight.hash)])
+    storage.commit()
+    storage.clear_pending_highlights([highlight.hash])
+    storage.commit()
+
+    inner = mock.MagicMock(wraps=log_storage_.LogStorage(log_path))
+    reopened = bloom_storage_.BloomFilterStorage(inner, bloom_path, log_path)
+    inner.iter_highlight_batches.assert_not_called()
+    assert reopened.get_pending_highlights() == []
+
+
+def test_full_filter_is_rebuilt_with_every_account(tmpdir: str, documents: List[models.Document]) -> None:
+    db_path = os.path.join(str(tmpdir), "test.sqlite3")
+    storage = bloom_storage_.BloomFilterStorage(sqlalchemy_storage_.SqlAlchemyStorage(f"sqlite:///{db_path}"),
+                                                f"{db_path}.bloom", db_path)
+    alice = storage.for_account("alice")
+    bob = storage.for_account("bob")
+    alice_highlight = models.Highlight.create_highlight(documents[0].id, "alice's highlight", 0, "test")
+    alice.save_models([documents[0], alice_highlight])
+    alice.commit()
+
+    # Fill the shared filter so that bob's commit rebuilds it.
+    storage._filter.reset(1, storage.error_rate)
+    storage._filter.add(alice_highlight.hash)
+    bob_highlight = models.Highlight.create_highlight(documents[1].id, "bob's highlight", 0, "test")
+    bob.save_models([documents[1], bob_highlight])
+    bob.commit()
+
+    assert [stored.hash for stored in alice.get_highlights([alice_highlight.hash])] == [alice_highlight.hash]
+    assert [stored.hash for stored in bob.get_highlights([bob_highlight.hash])] == [bob_highlight.hash]
+    assert alice_highlight.hash in storage._filter
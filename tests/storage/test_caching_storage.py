@@ -0,0 +1,129 @@
+# pylint: disable=no-self-use,missing-function-docstring
+import os
+from unittest import mock
+
+import pytest
+from rmapy import document as document_
+
+from remarking import metrics, models
+from remarking.storage import caching_storage as caching_storage_
+from remarking.storage import log_storage as log_storage_
+
+
+@pytest.fixture()
+def document(rmapy_document: document_.Document) -> models.Document:
+    return models.Document.from_cloud_document(rmapy_document)
+
+
+@pytest.fixture()
+def inner_storage(tmpdir: str) -> mock.MagicMock:
+    return mock.MagicMock(wraps=log_storage_.LogStorage(os.path.join(str(tmpdir), "remarking.log")))
+
+
+def test_committed_models_are_served_from_cache(inner_storage: mock.MagicMock,
+                                                document: models.Document,
+                                                highlight: models.Highlight) -> None:
+    metrics.REGISTRY.reset()
+    storage = caching_storage_.CachingStorage(inner_storage)
+    storage.save_models([document, highlight])
+    storage.commit()
+
+    assert [doc.to_dict() for doc in storage.get_documents([document.id])] == [document.to_dict()]
+    assert [hl.to_dict() for hl in storage.get_highlights([highlight.hash])] == [highlight.to_dict()]
+    # Only the keys of stored entries are read, once.
+    inner_storage.get_documents.assert_called_once_with()
+    inner_storage.get_highlights.assert_not_called()
+    assert metrics.STORAGE_CACHE_HITS.get(kind="document") == 1
+    assert metrics.STORAGE_CACHE_HITS.get(kind="highlight") == 1
+
+
+def test_misses_are_fetched_once(inner_storage: mock.MagicMock,
+                                 document: models.Document,
+                                 highlight: models.Highlight) -> None:
+    metrics.REGISTRY.reset()
+    inner_storage.save_models([document, highlight])
+    inner_storage.commit()
+    storage = caching_storage_.CachingStorage(inner_storage, max_highlights=0)
+
+    for _ in range(2):
+        assert len(storage.get_highlights([highlight.hash, "missing"])) == 1
+    inner_storage.get_highlights.assert_has_calls([mock.call([highlight.hash]), mock.call([highlight.hash])])
+    assert metrics.STORAGE_CACHE_MISSES.get(kind="highlight") == 2
+    assert metrics.STORAGE_CACHE_HITS.get(kind="highlight") == 2
+
+
+def test_new_keys_are_not_looked_up(inner_storage: mock.MagicMock,
+                                    document: models.Document,
+                                    highlight: models.Highlight,
+                                    highlight_2: models.Highlight) -> None:
+    inner_storage.save_models([document, highlight])
+    inner_storage.commit()
+    storage = caching_storage_.CachingStorage(inner_storage, max_documents=0, max_highlights=0)
+
+    assert storage.get_highlights([highlight_2.hash, "new"]) == []
+    assert storage.get_documents(["new"]) == []
+    storage.save_models([highlight_2])
+    storage.commit()
+    assert storage.get_highlights(["new"]) == []
+    inner_storage.get_highlights.assert_not_called()
+    inner_storage.get_documents.assert_called_once_with()
+    inner_storage.iter_highlight_batches.assert_called_once_with()
+
+    assert len(storage.get_highlights([highlight_2.hash])) == 1
+    inner_storage.get_highlights.assert_called_once_with([highlight_2.hash])
+
+
+def test_keys_past_max_keys_are_looked_up(inner_storage: mock.MagicMock,
+                                          highlight: models.Highlight,
+                                          highlight_2: models.Highlight) -> None:
+    inner_storage.save_models([highlight])
+    inner_storage.commit()
+    storage = caching_storage_.CachingStorage(inner_storage, max_keys=1)
+    assert storage.get_highlights(["new"]) == []
+    inner_storage.get_highlights.assert_not_called()
+
+    storage.save_models([highlight_2])
+    storage.commit()
+    assert storage.get_highlights(["new"]) == []
+    inner_storage.get_highlights.assert_called_once_with(["new"])
+
+
+def test_rollback_discards_uncommitted_models(inner_storage: mock.MagicMock, highlight: models.Highlight) -> None:
+    storage = caching_storage_.CachingStorage(inner_storage)
+    storage.save_models([highlight])
+    storage.rollback()
+    storage.commit()
+
+    assert storage.get_highlights([highlight.hash]) == []
+    inner_storage.get_highlights.assert_not_called()
+
+
+def test_least_recently_used_entries_are_evicted(inner_storage: mock.MagicMock,
+                                                 highlight: models.Highlight,
+                                                 highlight_2: models.Highlight) -> None:
+    storage = caching_storage_.CachingStorage(inner_storage, max_highlights=1)
+    storage.save_models([highlight, highlight_2])
+    storage.commit()
+
+    assert len(storage.get_highlights([highlight_2.hash])) == 1
+    inner_storage.get_highlights.assert_not_called()
+    assert len(storage.get_highlights([highlight.hash])) == 1
+    inner_storage.get_highlights.assert_called_once_with([highlight.hash])
+
+
+def test_returned_models_are_copies(inner_storage: mock.MagicMock, document: models.Document) -> None:
+    storage = caching_storage_.CachingStorage(inner_storage)
+    storage.save_models([document])
+    storage.commit()
+
+    storage.get_documents([document.id])[0].name = "Changed"
+    assert storage.get_documents([document.id])[0].name == document.name
+
+
+def test_listing_all_documents_is_not_cached(inner_storage: mock.MagicMock, document: models.Document) -> None:
+    storage = caching_storage_.CachingStorage(inner_storage)
+    storage.save_models([document])
+    storage.commit()
+
+    assert len(storage.get_documents()) == 1
+    inner_storage.get_documents.assert_called_once_with(None)
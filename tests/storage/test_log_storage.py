@@ -0,0 +1,163 @@
+# pylint: disable=no-self-use,missing-function-docstring
+import os
+
+import pytest
+from pytest_unordered import unordered
+from rmapy import document as document_
+
+from remarking import models
+from remarking.storage import log_storage as log_storage_
+
+
+@pytest.fixture()
+def document(rmapy_document: document_.Document) -> models.Document:
+    return models.Document.from_cloud_document(rmapy_document)
+
+
+@pytest.fixture()
+def document_2(rmapy_document_2: document_.Document) -> models.Document:
+    return models.Document.from_cloud_document(rmapy_document_2)
+
+
+@pytest.fixture()
+def log_path(tmpdir: str) -> str:
+    return os.path.join(str(tmpdir), "remarking.log")
+
+
+def test_save_and_reopen(log_path: str, document: models.Document, highlight: models.Highlight) -> None:
+    storage = log_storage_.LogStorage(f"log://{log_path}")
+    storage.save_models([document, highlight, models.PendingHighlight(hash=highlight.hash)])
+    storage.commit()
+
+    reopened = log_storage_.LogStorage(log_path)
+    documents = reopened.get_documents()
+    assert len(documents) == 1
+    assert documents[0].to_dict() == document.to_dict()
+    highlights = reopened.get_highlights([highlight.hash])
+    assert len(highlights) == 1
+    assert highlights[0].to_dict() == highlight.to_dict()
+    assert [highlight_.hash for highlight_ in reopened.get_pending_highlights()] == [highlight.hash]
+
+
+def test_update_documents(log_path: str, document: models.Document, document_2: models.Document) -> None:
+    storage = log_storage_.LogStorage(log_path)
+    storage.save_models([document, document_2])
+    document.name = "anothername"
+    storage.update_documents([document])
+    storage.commit()
+
+    reopened = log_storage_.LogStorage(log_path)
+    assert unordered([doc.id for doc in reopened.get_documents()]) == [document.id, document_2.id]
+    assert reopened.get_documents([document.id])[0].name == "anothername"
+
+
+def test_uncommitted_changes_are_lost(log_path: str, document: models.Document, document_2: models.Document) -> None:
+    storage = log_storage_.LogStorage(log_path)
+    storage.save_models([document])
+    storage.commit()
+    storage.save_models([document_2])
+    assert len(storage.get_documents()) == 2
+
+    assert len(log_storage_.LogStorage(log_path).get_documents()) == 1
+    storage.rollback()
+    assert [doc.id for doc in storage.get_documents()] == [document.id]
+
+
+def test_incomplete_commit_is_discarded(log_path: str,
+                                        document: models.Document,
+                                        highlight: models.Highlight) -> None:
+    storage = log_storage_.LogStorage(log_path)
+    storage.save_models([document])
+    storage.commit()
+    size = os.path.getsize(log_path)
+    storage.save_models([highlight])
+    storage.commit()
+    with open(log_path, "rb+") as log_file:
+        log_file.truncate(os.path.getsize(log_path) - 5)
+
+    reopened = log_storage_.LogStorage(log_path)
+    assert reopened.get_highlights() == []
+    assert len(reopened.get_documents()) == 1
+    assert os.path.getsize(log_path) == size
+
+
+def test_not_a_log(log_path: str) -> None:
+    with open(log_path, "w") as log_file:
+        log_file.write("SQLite format 3\n")
+    with pytest.raises(log_storage_.CorruptLogException):
+        log_storage_.LogStorage(log_path)
+
+
+def test_pending_highlights(log_path: str, highlight: models.Highlight, highlight_2: models.Highlight) -> None:
+    storage = log_storage_.LogStorage(log_path)
+    storage.save_models([highlight, highlight_2, models.PendingHighlight(hash=highlight.hash),
+                         models.PendingHighlight(hash=highlight_2.hash)])
+    storage.clear_pending_highlights([highlight.hash])
+    storage.commit()
+    assert [highlight_.hash for highlight_ in log_storage_.LogStorage(log_path).get_pending_highlights()] == \
+        [highlight_2.hash]
+
+
+def test_skipped_documents(log_path: str, document: models.Document, document_2: models.Document) -> None:
+    storage = log_storage_.LogStorage(log_path)
+    assert storage.get_skipped_documents() == []
+    storage.save_skipped_documents([
+        models.SkippedDocument.create_skipped_document(document, "took too long"),
+        models.SkippedDocument.create_skipped_document(document_2, "took too long"),
+    ])
+    storage.save_skipped_documents([models.SkippedDocument.create_skipped_document(document, "crashed")])
+    storage.commit()
+
+    skipped = {entry.document_id: entry for entry in log_storage_.LogStorage(log_path).get_skipped_documents()}
+    assert {document_id: entry.reason for document_id, entry in skipped.items()} == {
+        document.id: "crashed", document_2.id: "took too long"
+    }
+    assert skipped[document.id].skips(document)
+
+    storage.clear_skipped_documents([document.id])
+    storage.commit()
+    assert [entry.document_id for entry in log_storage_.LogStorage(log_path).get_skipped_documents()] == \
+        [document_2.id]
+
+
+def test_compaction_keeps_skipped_documents(log_path: str, document: models.Document,
+                                            document_2: models.Document) -> None:
+    storage = log_storage_.LogStorage(log_path, min_compaction_records=10)
+    storage.save_skipped_documents([models.SkippedDocument.create_skipped_document(document_2, "crashed")])
+    storage.commit()
+    for version in range(25):
+        document.version = version
+        storage.update_documents([document])
+        storage.commit()
+
+    with open(log_path) as log_file:
+        assert len(log_file.readlines()) < 10
+    skipped = log_storage_.LogStorage(log_path).get_skipped_documents()
+    assert [(entry.document_id, entry.reason) for entry in skipped] == [(document_2.id, "crashed")]
+    assert skipped[0].skips(document_2)
+
+
+def test_compaction(log_path: str, document: models.Document) -> None:
+    storage = log_storage_.LogStorage(log_path, min_compaction_records=10)
+    for version in range(25):
+        document.version = version
+        storage.update_documents([document])
+        storage.commit()
+
+    with open(log_path) as log_file:
+        assert len([line for line in log_file if '"op": "document"' in line]) < 10
+    reopened = log_storage_.LogStorage(log_path)
+    assert reopened.get_documents()[0].version == 24
+
+
+def test_search_and_iterate(log_path: str,
+                            documents: list,
+                            highlights: list) -> None:
+    storage = log_storage_.LogStorage(log_path)
+    storage.save_models(documents + highlights)
+    storage.commit()
+    assert [highlight.hash for highlight in storage.search_highlights(highlights[0].text)] == [highlights[0].hash]
+    batches = list(storage.iter_highlight_batches(document_ids=[documents[1].id], batch_size=1))
+    assert all(len(batch) == 1 for batch in batches)
+    assert {highlight.hash for batch in batches for highlight in batch} == \
+        {highlight.hash for highlight in highlights if highlight.document_id == documents[1].id}
@@ -1,6 +1,12 @@
 # pylint: disable=no-self-use,missing-function-docstring
 
+import datetime
+from typing import List
+from unittest.mock import MagicMock
+
 import pytest
+import sqlalchemy
+from _pytest.monkeypatch import MonkeyPatch
 from pytest_unordered import unordered
 from rmapy import document as document_
 
@@ -121,3 +127,262 @@ def test_commit(sqlalchemy_storage: sqlalchemy_storage_.SqlAlchemyStorage,
     documents = sqlalchemy_storage.get_documents([document.id])
     assert len(documents) == 1
     assert documents[0].name == "anothername1"
+
+
+def test_pending_highlights(sqlalchemy_storage: sqlalchemy_storage_.SqlAlchemyStorage,
+                            highlight: models.Highlight, highlight_2: models.Highlight) -> None:
+    sqlalchemy_storage.save_models([highlight, highlight_2])
+    assert sqlalchemy_storage.get_pending_highlights() == []
+
+    sqlalchemy_storage.save_models([models.PendingHighlight(hash=highlight.hash),
+                                    models.PendingHighlight(hash=highlight_2.hash)])
+    sqlalchemy_storage.commit()
+    pending = sqlalchemy_storage.get_pending_highlights()
+    assert unordered(highlight_.hash for highlight_ in pending) == [highlight.hash, highlight_2.hash]
+
+    sqlalchemy_storage.clear_pending_highlights([highlight.hash])
+    sqlalchemy_storage.commit()
+    pending = sqlalchemy_storage.get_pending_highlights()
+    assert [highlight_.hash for highlight_ in pending] == [highlight_2.hash]
+
+
+def test_skipped_documents(sqlalchemy_storage: sqlalchemy_storage_.SqlAlchemyStorage,
+                           document: models.Document, document_2: models.Document) -> None:
+    assert sqlalchemy_storage.get_skipped_documents() == []
+
+    sqlalchemy_storage.save_skipped_documents([
+        models.SkippedDocument.create_skipped_document(document, "took too long"),
+        models.SkippedDocument.create_skipped_document(document_2, "took too long"),
+    ])
+    sqlalchemy_storage.save_skipped_documents([models.SkippedDocument.create_skipped_document(document, "crashed")])
+    sqlalchemy_storage.commit()
+    skipped = {entry.document_id: entry for entry in sqlalchemy_storage.get_skipped_documents()}
+    assert {document_id: entry.reason for document_id, entry in skipped.items()} == {
+        document.id: "crashed", document_2.id: "took too long"
+    }
+    assert skipped[document.id].skips(document)
+    assert not skipped[document.id].skips(document_2)
+
+    sqlalchemy_storage.clear_skipped_documents([document.id])
+    sqlalchemy_storage.commit()
+    assert [entry.document_id for entry in sqlalchemy_storage.get_skipped_documents()] == [document_2.id]
+
+
+def test_rollback(sqlalchemy_storage: sqlalchemy_storage_.SqlAlchemyStorage,
+                  document: models.Document) -> None:
+    sqlalchemy_storage.save_models([document])
+    sqlalchemy_storage.rollback()
+    assert sqlalchemy_storage.get_documents() == []
+
+
+def test_for_account(tmpdir: str, document: models.Document, document_2: models.Document) -> None:
+    storage = sqlalchemy_storage_.SqlAlchemyStorage(f"sqlite:///{tmpdir}/test.sqlite3")
+    account_storage = storage.for_account("alice")
+    assert account_storage._engine is storage._engine
+
+    account_storage.save_models([document])
+    account_storage.commit()
+    storage.save_models([document_2])
+    storage.commit()
+
+    accounts = {doc.id: doc.account for doc in storage.get_documents()}
+    assert accounts == {document.id: "alice", document_2.id: None}
+
+
+def test_for_account_scopes_pending_highlights(tmpdir: str,
+                                               document: models.Document,
+                                               document_2: models.Document) -> None:
+    storage = sqlalchemy_storage_.SqlAlchemyStorage(f"sqlite:///{tmpdir}/test.sqlite3")
+    alice = storage.for_account("alice")
+    bob = storage.for_account("bob")
+    alice_highlight = models.Highlight.create_highlight(document.id, "alice's highlight", 0, "test")
+    bob_highlight = models.Highlight.create_highlight(document_2.id, "bob's highlight", 0, "test")
+    alice.save_models([document, alice_highlight, models.PendingHighlight(hash=alice_highlight.hash)])
+    alice.commit()
+    bob.save_models([document_2, bob_highlight, models.PendingHighlight(hash=bob_highlight.hash)])
+    bob.commit()
+
+    assert [highlight.hash for highlight in alice.get_pending_highlights()] == [alice_highlight.hash]
+    assert [highlight.hash for highlight in bob.get_pending_highlights()] == [bob_highlight.hash]
+    assert bob.get_highlights([alice_highlight.hash]) == []
+    assert [doc.id for doc in bob.get_documents()] == [document_2.id]
+
+    bob.clear_pending_highlights([alice_highlight.hash, bob_highlight.hash])
+    bob.commit()
+    assert bob.get_pending_highlights() == []
+    assert [highlight.hash for highlight in alice.get_pending_highlights()] == [alice_highlight.hash]
+    assert len(storage.get_pending_highlights()) == 1
+
+
+def test_add_missing_columns(tmpdir: str) -> None:
+    db_string = f"sqlite:///{tmpdir}/old.sqlite3"
+    engine = sqlalchemy.create_engine(db_string)
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text(
+            "CREATE TABLE document (id VARCHAR(256) PRIMARY KEY, version INTEGER NOT NULL)"
+        ))
+        connection.execute(sqlalchemy.text(
+            "CREATE TABLE highlight (hash VARCHAR(256) PRIMARY KEY, document_id VARCHAR(256) NOT NULL)"
+        ))
+
+    sqlalchemy_storage_.SqlAlchemyStorage(db_string)
+    columns = {column["name"] for column in sqlalchemy.inspect(engine).get_columns("document")}
+    assert "account" in columns
+    columns = {column["name"] for column in sqlalchemy.inspect(engine).get_columns("highlight")}
+    assert {"x", "y", "width", "height"} <= columns
+
+
+def test_search_highlights(sqlalchemy_storage: sqlalchemy_storage_.SqlAlchemyStorage,
+                           document: models.Document, document_2: models.Document) -> None:
+    looking_glass = models.Highlight.create_highlight(document.id, "Alice went through the looking-glass", 1, "test")
+    rabbit = models.Highlight.create_highlight(document.id, "The white rabbit was running late", 2, "test")
+    sqlalchemy_storage.save_models([document, document_2, looking_glass, rabbit])
+    sqlalchemy_storage.commit()
+
+    assert [highlight.hash for highlight in sqlalchemy_storage.search_highlights("looking glass")] == \
+        [looking_glass.hash]
+    assert [highlight.hash for highlight in sqlalchemy_storage.search_highlights("RUN")] == [rabbit.hash]
+    assert sqlalchemy_storage.search_highlights("rabbit alice") == []
+    assert sqlalchemy_storage.search_highlights("\"unbalanced (") == []
+    assert len(sqlalchemy_storage.search_highlights(document.name.split()[0])) == 2
+    assert len(sqlalchemy_storage.search_highlights(document.name.split()[0], limit=1)) == 1
+
+    document.name = "renamed"
+    sqlalchemy_storage.update_documents([document])
+    sqlalchemy_storage.commit()
+    assert len(sqlalchemy_storage.search_highlights("renamed")) == 2
+
+
+def test_search_index_is_rebuilt(tmpdir: str, document: models.Document, highlight: models.Highlight) -> None:
+    db_string = f"sqlite:///{tmpdir}/test.sqlite3"
+    storage = sqlalchemy_storage_.SqlAlchemyStorage(db_string)
+    storage.save_models([document, highlight])
+    storage.commit()
+    with storage._engine.begin() as connection:
+        connection.execute(sqlalchemy.text("DROP TABLE highlight_fts"))
+
+    storage = sqlalchemy_storage_.SqlAlchemyStorage(db_string)
+    assert [highlight_.hash for highlight_ in storage.search_highlights(highlight.text)] == [highlight.hash]
+
+
+def test_search_highlights_without_index(sqlalchemy_storage: sqlalchemy_storage_.SqlAlchemyStorage,
+                                         document: models.Document, highlight: models.Highlight) -> None:
+    sqlalchemy_storage._search_index = False
+    sqlalchemy_storage.save_models([document, highlight])
+    sqlalchemy_storage.commit()
+    assert [highlight_.hash for highlight_ in sqlalchemy_storage.search_highlights(highlight.text.upper())] == \
+        [highlight.hash]
+    assert sqlalchemy_storage.search_highlights("does-not-exist") == []
+
+
+def test_iter_highlight_batches(sqlalchemy_storage: sqlalchemy_storage_.SqlAlchemyStorage,
+                                document: models.Document, document_2: models.Document) -> None:
+    highlights = [
+        models.Highlight.create_highlight(doc.id, f"text {index}", index, "test")
+        for index, doc in enumerate([document, document_2, document, document_2, document])
+    ]
+    for index, highlight in enumerate(highlights):
+        highlight.extracted_at = datetime.datetime(2021, 7, 1 + index)
+    sqlalchemy_storage.save_models([document, document_2, *highlights])
+    sqlalchemy_storage.commit()
+
+    batches = list(sqlalchemy_storage.iter_highlight_batches(batch_size=2))
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert [highlight.hash for batch in batches for highlight in batch] == [highlight.hash for highlight in highlights]
+    assert batches[0][0].equal(highlights[0])
+
+    since = list(sqlalchemy_storage.iter_highlight_batches(since=datetime.datetime(2021, 7, 3)))
+    assert [highlight.hash for batch in since for highlight in batch] == \
+        [highlight.hash for highlight in highlights[2:]]
+
+    of_document = list(sqlalchemy_storage.iter_highlight_batches(document_ids=[document_2.id]))
+    assert [highlight.hash for batch in of_document for highlight in batch] == \
+        [highlights[1].hash, highlights[3].hash]
+
+
+def test_schema_is_set_up_once(tmpdir: str) -> None:
+    db_string = f"sqlite:///{tmpdir}/remarking.sqlite3"
+    sqlalchemy_storage_.SqlAlchemyStorage(db_string).close()
+
+    engine = sqlalchemy.create_engine(db_string)
+    assert not sqlalchemy_storage_.ensure_schema(engine)
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy_storage_.schema_version_table.update().values(version=1))
+    assert sqlalchemy_storage_.ensure_schema(engine)
+    with engine.connect() as connection:
+        assert connection.execute(
+            sqlalchemy.select(sqlalchemy_storage_.schema_version_table.c.version)
+        ).scalars().all() == [sqlalchemy_storage_.SCHEMA_VERSION]
+
+
+def test_context_manager(tmpdir: str, document: models.Document) -> None:
+    db_string = f"sqlite:///{tmpdir}/remarking.sqlite3"
+    with sqlalchemy_storage_.SqlAlchemyStorage(db_string) as storage:
+        storage.save_models([document])
+        storage.commit()
+
+    with pytest.raises(RuntimeError):
+        with sqlalchemy_storage_.SqlAlchemyStorage(db_string) as storage:
+            document.name = "renamed"
+            storage.update_documents([document])
+            raise RuntimeError()
+
+    with sqlalchemy_storage_.SqlAlchemyStorage(db_string) as storage:
+        assert [doc.name for doc in storage.get_documents()] == ["a_book"]
+
+
+def test_pool_options(tmpdir: str, monkeypatch: MonkeyPatch) -> None:
+    create_engine = MagicMock(wraps=sqlalchemy.create_engine)
+    monkeypatch.setattr(sqlalchemy, "create_engine", create_engine)
+    db_string = f"sqlite:///{tmpdir}/remarking.sqlite3"
+
+    sqlalchemy_storage_.SqlAlchemyStorage(db_string, pool_recycle=60).close()
+    create_engine.assert_called_once_with(db_string, echo=False, pool_recycle=60)
+
+    # SQLite file databases do not pool connections, so they reject a pool size.
+    with pytest.raises(TypeError):
+        sqlalchemy_storage_.SqlAlchemyStorage(db_string, pool_size=2, max_overflow=0)
+    create_engine.assert_called_with(db_string, echo=False, pool_size=2, max_overflow=0)
+
+
+def test_returned_models_are_detached(sqlalchemy_storage: sqlalchemy_storage_.SqlAlchemyStorage,
+                                      document: models.Document,
+                                      highlight: models.Highlight) -> None:
+    sqlalchemy_storage.save_models([document, highlight])
+    sqlalchemy_storage.commit()
+    for model in sqlalchemy_storage.get_documents() + sqlalchemy_storage.get_highlights([highlight.hash]):
+        assert sqlalchemy.inspect(model).transient
+
+
+def test_deduplicate_highlight_text(tmpdir: str,
+                                    documents: List[models.Document],
+                                    highlight: models.Highlight) -> None:
+    db_string = f"sqlite:///{tmpdir}/remarking.sqlite3"
+    copies = [models.Highlight.create_highlight(document.id, highlight.text, 0, "Unextracted")
+              for document in documents[:2]]
+    with sqlalchemy_storage_.SqlAlchemyStorage(db_string) as storage:
+        assert not storage.deduplicate_text
+        storage.save_models(documents + copies)
+        storage.commit()
+        assert storage.deduplicate_highlight_text(batch_size=1) == 2
+        assert storage.deduplicate_highlight_text() == 0
+
+    with sqlalchemy_storage_.SqlAlchemyStorage(db_string) as storage:
+        assert storage.deduplicate_text
+        new_highlight = models.Highlight.create_highlight(documents[2].id, highlight.text, 0, "Unextracted")
+        storage.save_models([new_highlight])
+        storage.commit()
+
+        hashes = [copy.hash for copy in copies] + [new_highlight.hash]
+        assert [stored.text for stored in storage.get_highlights(hashes)] == [highlight.text] * 3
+        assert [found.hash for found in storage.search_highlights(highlight.text)] == unordered(hashes)
+        assert [stored.text for batch in storage.iter_highlight_batches() for stored in batch] == [highlight.text] * 3
+
+    engine = sqlalchemy.create_engine(db_string)
+    with engine.connect() as connection:
+        assert connection.execute(
+            sqlalchemy.select(sqlalchemy_storage_.highlight_text_table.c.text)
+        ).scalars().all() == [highlight.text]
+        assert connection.execute(
+            sqlalchemy.select(sqlalchemy_storage_.highlight_table.c.text)
+        ).scalars().all() == [None] * 3
@@ -0,0 +1,33 @@
+# pylint: disable=no-self-use,missing-function-docstring
+import typing as T
+from typing import List
+
+from remarking import models
+from remarking.storage import storage as storage_
+
+
+class MinimalStorage(storage_.Storage):
+    """ Storage implementing only the abstract methods """
+
+    def get_documents(self, document_ids: T.Optional[List[str]] = None) -> List[models.Document]:
+        return []
+
+    def get_highlights(self, combined_text_hashes: List[str]) -> List[models.Highlight]:
+        return []
+
+    def save_models(self, models: T.Sequence[T.Any]) -> None:
+        pass
+
+    def update_documents(self, documents: List[models.Document]) -> None:
+        pass
+
+    def commit(self) -> None:
+        pass
+
+
+def test_optional_methods_have_defaults() -> None:
+    with MinimalStorage() as storage:
+        assert storage.get_pending_highlights() == []
+        storage.clear_pending_highlights(["hash"])
+        storage.rollback()
+        assert storage.get_skipped_documents() == []
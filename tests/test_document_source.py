@@ -0,0 +1,83 @@
+# pylint: disable=no-self-use,missing-function-docstring
+import io
+import pickle
+import zipfile
+
+import pytest
+
+from remarking import document_source as document_source_
+
+
+@pytest.fixture
+def archive() -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zip_file:
+        zip_file.writestr("1111.content", '{"pages": ["a", "b"]}')
+        zip_file.writestr("1111.highlights/a.json", '{"highlights": []}')
+        zip_file.writestr("1111.highlights/b.json", '{"highlights": []}')
+        zip_file.writestr("1111/a.rm", b"\x00\x01")
+    return buffer.getvalue()
+
+
+def test_zip_source_exists(archive: bytes) -> None:
+    source = document_source_.ZipDocumentSource(archive)
+    assert source.exists("1111.content")
+    assert source.exists("1111.highlights")
+    assert source.exists("1111.highlights/a.json")
+    assert not source.exists("2222.content")
+
+
+def test_zip_source_listdir(archive: bytes) -> None:
+    source = document_source_.ZipDocumentSource(archive)
+    assert sorted(source.listdir("1111.highlights")) == ["a.json", "b.json"]
+    assert source.listdir("1111") == ["a.rm"]
+    with pytest.raises(FileNotFoundError):
+        source.listdir("2222.highlights")
+
+
+def test_zip_source_read(archive: bytes) -> None:
+    source = document_source_.ZipDocumentSource(io.BytesIO(archive))
+    assert source.read_bytes("1111/a.rm") == b"\x00\x01"
+    with source.open("1111.content") as content:
+        assert content.read() == '{"pages": ["a", "b"]}'
+    with pytest.raises(FileNotFoundError):
+        source.read_bytes("1111/b.rm")
+
+
+def test_zip_source_from_path(archive: bytes, tmpdir: str) -> None:
+    path = f"{tmpdir}/1111.zip"
+    with open(path, "wb") as file_p:
+        file_p.write(archive)
+    source = document_source_.ZipDocumentSource(path)
+    assert source.exists("1111.content")
+
+    unpickled = pickle.loads(pickle.dumps(source))
+    assert unpickled.read_bytes("1111/a.rm") == b"\x00\x01"
+
+
+def test_directory_source(tmpdir: str) -> None:
+    source = document_source_.DirectoryDocumentSource(str(tmpdir))
+    with open(f"{tmpdir}/1111.content", "w") as file_p:
+        file_p.write("{}")
+    assert source.exists("1111.content")
+    assert source.listdir("") == ["1111.content"]
+    assert source.read_bytes("1111.content") == b"{}"
+    with pytest.raises(ValueError):
+        source.open("1111.content", "w")
+
+
+def test_composite_source_routes_by_document_id(archive: bytes) -> None:
+    source = document_source_.CompositeDocumentSource()
+    source.add("1111", document_source_.ZipDocumentSource(archive))
+    assert source.exists("1111.content")
+    assert source.exists("1111/a.rm")
+    assert not source.exists("2222.content")
+    assert sorted(source.listdir("1111.highlights")) == ["a.json", "b.json"]
+    with pytest.raises(FileNotFoundError):
+        source.read_bytes("2222.content")
+
+
+def test_as_document_source(archive: bytes) -> None:
+    assert isinstance(document_source_.as_document_source("/tmp"), document_source_.DirectoryDocumentSource)
+    source = document_source_.ZipDocumentSource(archive)
+    assert document_source_.as_document_source(source) is source
@@ -0,0 +1,58 @@
+# pylint: disable=no-self-use,missing-function-docstring
+import json
+import logging
+
+import pytest
+from _pytest.logging import LogCaptureFixture
+
+from remarking import events, metrics
+from remarking.cli import log
+
+
+def test_emit(caplog: LogCaptureFixture) -> None:
+    events.emit("document_downloaded", document_id="1111", bytes=10)
+    assert caplog.records == []
+
+    caplog.set_level(logging.INFO, logger="remarking.events")
+    events.emit("document_downloaded", document_id="1111", bytes=10)
+    record = caplog.records[0]
+    assert record.getMessage() == "document_downloaded document_id=1111 bytes=10"
+    assert record.event == "document_downloaded"  # type: ignore
+    assert record.fields == {"document_id": "1111", "bytes": 10}  # type: ignore
+
+
+def test_stage(caplog: LogCaptureFixture) -> None:
+    caplog.set_level(logging.INFO, logger="remarking.events")
+    duration = metrics.STAGE_DURATION.get(stage="test")
+    with events.stage("test", documents=2) as result:
+        result["highlights"] = 3
+    with pytest.raises(RuntimeError):
+        with events.stage("test"):
+            raise RuntimeError()
+
+    assert [record.event for record in caplog.records] == [  # type: ignore
+        "stage_started", "stage_finished", "stage_started", "stage_failed"
+    ]
+    finished = caplog.records[1].fields  # type: ignore
+    assert finished["stage"] == "test"
+    assert finished["documents"] == 2
+    assert finished["highlights"] == 3
+    assert finished["ms"] >= 0
+    assert metrics.STAGE_DURATION.get(stage="test") > duration
+
+
+def test_json_log_formatter(caplog: LogCaptureFixture) -> None:
+    caplog.set_level(logging.INFO, logger="remarking.events")
+    events.emit("document_extracted", document_id="1111", highlights=2, ms=1.5)
+    logging.getLogger("remarking.test").warning("plain %s", "message")
+
+    formatter = log.JSONLogFormatter()
+    extracted, plain = [json.loads(formatter.format(record)) for record in caplog.records]
+    assert extracted["event"] == "document_extracted"
+    assert extracted["level"] == "INFO"
+    assert extracted["logger"] == "remarking.events"
+    assert extracted["document_id"] == "1111"
+    assert extracted["highlights"] == 2
+    assert extracted["ms"] == 1.5
+    assert plain["event"] == "log"
+    assert plain["message"] == "plain message"
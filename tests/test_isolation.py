@@ -0,0 +1,85 @@
+# pylint: disable=no-self-use,missing-function-docstring
+import datetime
+import os
+import time
+import typing as T
+from typing import List
+
+import pytest
+
+from remarking import document_source as document_source_
+from remarking import isolation, models
+from remarking.highlight_extractor import highlight_extractor
+
+
+class BehavingExtractor(highlight_extractor.HighlightExtractor):
+    """ Returns a highlight for every document, unless the document's name asks it to misbehave """
+
+    @classmethod
+    def get_extractor_instance_data(cls) -> List[highlight_extractor.ExtractorData]:
+        return []
+
+    def get_highlights(self,
+                       working_path: T.Union[str, document_source_.DocumentSource],
+                       document: models.Document) -> List[models.Highlight]:
+        if document.name == "slow":
+            time.sleep(30)
+        elif document.name == "crash":
+            os._exit(3)  # pylint: disable=protected-access
+        elif document.name == "hog":
+            bytearray(4 * 2 ** 30)
+        elif document.name == "error":
+            raise ValueError("broken document")
+        return [models.Highlight.create_highlight(document.id, f"text of {document.name}", 0, "BehavingExtractor")]
+
+
+def document(name: str) -> models.Document:
+    return models.Document(id=f"id-{name}", name=name, current_page=0, bookmarked=False, parent="", version=1,
+                           modified_client=datetime.datetime(year=2022, month=5, day=6))
+
+
+@pytest.fixture
+def source(tmp_path: T.Any) -> document_source_.DocumentSource:
+    return document_source_.DirectoryDocumentSource(str(tmp_path))
+
+
+def test_pool_extracts_documents(source: document_source_.DocumentSource) -> None:
+    documents = [document("a"), document("b"), document("c")]
+    with isolation.ExtractorPool([BehavingExtractor()], isolation.ExtractionLimits(workers=2)) as pool:
+        results = list(pool.extract(source, documents))
+    assert sorted((result.document.id, result.skip_reason) for result in results) == [
+        ("id-a", None), ("id-b", None), ("id-c", None)
+    ]
+    assert sorted(result.highlights[0].text for result in results) == ["text of a", "text of b", "text of c"]
+
+
+def test_pool_skips_documents_exceeding_limits(source: document_source_.DocumentSource) -> None:
+    documents = [document("slow"), document("crash"), document("a")]
+    with isolation.ExtractorPool([BehavingExtractor()], isolation.ExtractionLimits(timeout=2)) as pool:
+        start = time.monotonic()
+        results = {result.document.name: result for result in pool.extract(source, documents)}
+        assert time.monotonic() - start < 20
+        # The worker is replaced, so later runs are not affected.
+        assert [result.skip_reason for result in pool.extract(source, [document("b")])] == [None]
+
+    assert results["slow"].skip_reason == "took longer than 2 seconds"
+    assert results["slow"].highlights == []
+    assert results["crash"].skip_reason == "crashed its worker process with exit code 3"
+    assert results["a"].skip_reason is None
+    assert [highlight.text for highlight in results["a"].highlights] == ["text of a"]
+
+
+@pytest.mark.skipif(isolation.resource is None, reason="Memory limits are only enforced on Unix")
+def test_pool_skips_documents_exceeding_memory_limit(source: document_source_.DocumentSource) -> None:
+    limits = isolation.ExtractionLimits(memory=2 ** 30)
+    with isolation.ExtractorPool([BehavingExtractor()], limits) as pool:
+        results = {result.document.name: result for result in pool.extract(source, [document("hog"), document("a")])}
+    assert results["hog"].skip_reason == "exceeded the memory limit of 1024 MiB"
+    assert results["a"].skip_reason is None
+
+
+def test_pool_raises_extractor_errors(source: document_source_.DocumentSource) -> None:
+    with isolation.ExtractorPool([BehavingExtractor()], isolation.ExtractionLimits(timeout=10)) as pool:
+        with pytest.raises(isolation.ExtractorWorkerException, match="broken document") as exc_info:
+            list(pool.extract(source, [document("error")]))
+    assert isinstance(exc_info.value.__cause__, ValueError)
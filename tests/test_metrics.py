@@ -0,0 +1,70 @@
+# pylint: disable=no-self-use,missing-function-docstring
+import os
+
+import pytest
+
+from remarking import metrics as metrics_
+
+
+@pytest.fixture
+def registry() -> metrics_.Registry:
+    return metrics_.Registry()
+
+
+def test_counter(registry: metrics_.Registry) -> None:
+    counter = registry.counter("test_documents", "Documents.")
+    counter.inc()
+    counter.inc(2)
+    counter.inc(operation="download")
+    assert counter.get() == 3
+    assert counter.get(operation="download") == 1
+    with pytest.raises(ValueError):
+        counter.inc(-1)
+    with pytest.raises(ValueError):
+        counter.set(1)
+
+
+def test_register_twice(registry: metrics_.Registry) -> None:
+    registry.gauge("test_gauge", "A gauge.")
+    with pytest.raises(ValueError):
+        registry.counter("test_gauge", "A counter.")
+
+
+def test_to_openmetrics(registry: metrics_.Registry) -> None:
+    counter = registry.counter("test_requests", "Requests \"made\".")
+    registry.counter("test_unused", "Never incremented.")
+    gauge = registry.gauge("test_last_run_seconds", "Last run.")
+    counter.inc(3, operation="download")
+    counter.inc(operation="meta_items")
+    gauge.set(1.5)
+
+    assert registry.to_openmetrics() == (
+        "# TYPE test_requests counter\n"
+        "# HELP test_requests Requests \\\"made\\\".\n"
+        "test_requests_total{operation=\"download\"} 3\n"
+        "test_requests_total{operation=\"meta_items\"} 1\n"
+        "# TYPE test_unused counter\n"
+        "# HELP test_unused Never incremented.\n"
+        "test_unused_total 0\n"
+        "# TYPE test_last_run_seconds gauge\n"
+        "# HELP test_last_run_seconds Last run.\n"
+        "test_last_run_seconds 1.5\n"
+        "# EOF\n"
+    )
+
+
+def test_time(registry: metrics_.Registry) -> None:
+    counter = registry.counter("test_duration_seconds", "Duration.")
+    with pytest.raises(RuntimeError):
+        with counter.time(stage="download"):
+            raise RuntimeError()
+    assert counter.get(stage="download") > 0
+
+
+def test_write_textfile(registry: metrics_.Registry, tmpdir: str) -> None:
+    registry.counter("test_runs", "Runs.").inc()
+    path = os.path.join(str(tmpdir), "remarking.prom")
+    registry.write_textfile(path)
+    with open(path) as metrics_file:
+        assert metrics_file.read() == registry.to_openmetrics()
+    assert os.listdir(str(tmpdir)) == ["remarking.prom"]
@@ -3,6 +3,8 @@
 
 import typing as T
 
+import pytest
+from dateutil import parser as date_parser
 from rmapy import document as document_
 from sqlalchemy import Column, Integer, String, orm
 
@@ -59,6 +61,15 @@ class TestDocument():
         assert document_model.bookmarked == document_data['Bookmarked']
         assert document_model.parent == document_data['Parent']
 
+    def test_from_cloud_documents(self, rmapy_document: document_.Document,
+                                  rmapy_document_2: document_.Document) -> None:
+        document_models = models.Document.from_cloud_documents([rmapy_document, rmapy_document_2])
+        assert [document_model.to_dict() for document_model in document_models] == [
+            models.Document.from_cloud_document(rmapy_document).to_dict(),
+            models.Document.from_cloud_document(rmapy_document_2).to_dict(),
+        ]
+        assert models.Document.from_cloud_documents([]) == []
+
     def test_to_metadata_dict(self, rmapy_document: document_.Document,
                               document_data: T.Dict[str, T.Any]) -> None:
         document_model = models.Document.from_cloud_document(rmapy_document)
@@ -86,6 +97,25 @@ class TestDocument():
         assert not document_model_2.equal(document_model_3)
 
 
+@pytest.mark.parametrize("value", [
+    "2020-01-01T20:00:00",
+    "2021-07-05T14:18:22.123456789Z",
+    "2021-07-05T14:18:22.1Z",
+    "2021-07-05T14:18:22+02:00",
+    "2021-07-05 14:18:22,5",
+    "July 5 2021 10:00",
+])
+def test_parse_timestamp(value: str) -> None:
+    assert models.parse_timestamp(value) == date_parser.parse(value).replace(tzinfo=None)
+
+
+def test_parse_timestamp_rejects_invalid_values() -> None:
+    with pytest.raises(ValueError):
+        models.parse_timestamp("2021-13-05T14:18:22Z")
+    with pytest.raises(ValueError):
+        models.parse_timestamp("not a timestamp")
+
+
 class TestHighlights():
 
     def test_equal(self, highlight: models.Highlight) -> None:
@@ -134,3 +164,11 @@ class TestHighlights():
         assert highlight.text == "document"
         assert highlight.page_number == 20
         assert highlight.extraction_method == "Unextracted"
+
+    def test_create_highlight_with_bounding_box(self) -> None:
+        first = models.Highlight.create_highlight("123", "", 1, "Unextracted", bounding_box=(10, 20, 100, 25))
+        second = models.Highlight.create_highlight("123", "", 1, "Unextracted", bounding_box=(10, 60, 100, 25))
+        assert (first.x, first.y, first.width, first.height) == (10, 20, 100, 25)
+        assert first.hash != second.hash
+        assert first.hash != models.Highlight.create_highlight("123", "", 1, "Unextracted").hash
+        assert models.Highlight.create_highlight("123", "document", 1, "Unextracted").x is None
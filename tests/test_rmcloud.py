@@ -1,6 +1,12 @@
 # pylint: disable=no-self-use,missing-function-docstring,protected-access
+import io
+import os
+import zipfile
+from unittest.mock import MagicMock
+
 import pytest
 import rmapy
+from _pytest.monkeypatch import MonkeyPatch
 from rmapy import collections as collections_
 from rmapy import document as document_
 from rmapy import folder as folder_
@@ -78,6 +84,63 @@ def test_crawl_folders(rmcloud: rmcloud_.RMCloud,
     assert documents == [rmapy_document_2, rmapy_document_3]
 
 
+def test_crawl_folders_prunes_trash_and_excluded_folders(rmcloud: rmcloud_.RMCloud,
+                                                          rmapy_collection: collections_.Collection,
+                                                          rmapy_document: document_.Document,
+                                                          rmapy_document_2: document_.Document,
+                                                          rmapy_document_3: document_.Document,
+                                                          rmapy_folder: folder_.Folder,
+                                                          rmapy_folder_2: folder_.Folder) -> None:
+    rmapy_collection.add({"ID": "777", "VissibleName": "old notes", "Parent": rmcloud_.TRASH,
+                          "Type": "CollectionType"})
+    rmapy_collection.add({"ID": "778", "VissibleName": "old book", "Parent": "777", "Type": "DocumentType"})
+    rmapy_document_2.Parent = rmcloud_.TRASH
+    rmcloud.refresh_meta_items()
+    trashed_folder = rmcloud.get_folders(["old notes"])[0]
+
+    assert rmcloud.crawl_folders([rmapy_folder_2]) == [rmapy_document_3]
+    assert rmcloud.crawl_folders([trashed_folder]) == []
+    assert rmcloud.is_excluded(rmcloud.get_documents(["old book"])[0])
+    assert rmcloud.is_excluded(rmapy_document_2)
+    assert not rmcloud.is_excluded(rmapy_document)
+
+    assert rmcloud.crawl_folders([rmapy_folder], excluded_folders=[rmapy_folder_2.VissibleName.upper()]) == [
+        rmapy_document
+    ]
+    assert rmcloud.crawl_folders([rmapy_folder_2], excluded_folders=[rmapy_folder_2.VissibleName]) == []
+    assert rmcloud.is_excluded(rmapy_document_3, [rmapy_folder_2.VissibleName])
+
+
 @pytest.mark.skip()
 def test_download_document() -> None:
     pass
+
+
+def test_download_document_does_not_unpack(rmcloud: rmcloud_.RMCloud, tmpdir: str) -> None:
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zip_file:
+        zip_file.writestr("1111.content", '{"pages": []}')
+    rmcloud._api_client.download.return_value = MagicMock(zipfile=archive)
+
+    source = rmcloud.download_document("1111", str(tmpdir))
+    assert os.listdir(str(tmpdir)) == ["1111.zip"]
+    assert source.exists("1111.content")
+
+    in_memory_source = rmcloud.download_document("1111")
+    assert in_memory_source.read_bytes("1111.content") == b'{"pages": []}'
+
+
+def test_configured_client_keeps_tokens_in_its_config(tmpdir: str, monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setenv("HOME", str(tmpdir))
+    session = MagicMock()
+    session.request.return_value = MagicMock(ok=True, text="token")
+    config_path = os.path.join(tmpdir, "alice.rmapi")
+
+    client = rmcloud_._ConfiguredClient(config_path, session)
+    client.register_device("code")
+    client.renew_token()
+
+    assert client.is_auth()
+    assert session.request.call_count == 2
+    assert rmcloud_._ConfiguredClient(config_path, session).token_set == {"devicetoken": "token", "usertoken": "token"}
+    assert not os.path.exists(os.path.join(tmpdir, ".rmapi"))